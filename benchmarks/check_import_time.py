@@ -0,0 +1,67 @@
+import argparse
+import re
+import subprocess
+import sys
+
+# Modules whose import must stay cheap, and what they may not pull in at import time
+CHECKS = {
+    'main': ['pandas', 'pyarrow', 'matplotlib', 'seaborn', 'folium'],
+    'src.analysis.delay_analysis': ['matplotlib', 'seaborn', 'folium'],
+    'src.analysis.generate_summary_report': ['matplotlib', 'seaborn', 'folium'],
+}
+DEFAULT_BUDGET_MS = 300
+
+IMPORTTIME_LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)')
+
+
+def import_profile(module):
+    """
+    Imports `module` in a fresh interpreter with -X importtime.
+    Returns (cumulative import time of the module in ms, set of top-level packages loaded).
+    """
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                          capture_output=True, text=True, check=True)
+    total_ms = None
+    loaded = set()
+    for line in proc.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        name = match.group(4)
+        loaded.add(name.split('.')[0])
+        if name == module:
+            total_ms = int(match.group(2)) / 1000
+    return total_ms, loaded
+
+
+def main(argv=None):
+    """
+    Fails (exit 1) when importing a checked module takes longer than the budget or
+    loads a library that should only be imported when its stage runs.
+    """
+    parser = argparse.ArgumentParser(description="Import-time budget check")
+    parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS,
+                        help="Maximum cumulative import time of `main` (default: %(default)s ms)")
+    args = parser.parse_args(argv)
+
+    failures = []
+    for module, forbidden in CHECKS.items():
+        total_ms, loaded = import_profile(module)
+        heavy = sorted(set(forbidden) & loaded)
+        print(f"{module:<40} {total_ms:>8.1f} ms  heavy imports: {', '.join(heavy) or 'none'}")
+        if heavy:
+            failures.append(f"{module} imports {', '.join(heavy)} at import time")
+        if module == 'main' and total_ms > args.budget_ms:
+            failures.append(f"import main took {total_ms:.1f} ms (budget {args.budget_ms:.0f} ms)")
+
+    if failures:
+        print("IMPORT BUDGET EXCEEDED:")
+        for line in failures:
+            print(f"  {line}")
+        return 1
+    print("Import budget OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
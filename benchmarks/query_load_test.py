@@ -0,0 +1,163 @@
+import argparse
+import http.client
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from urllib.parse import urlencode, urlsplit
+
+from src.service.query_service import DelayQueryService, QueryError, make_server, load_table, DEFAULT_TABLE_PATH
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_OUTPUT = os.path.join(BENCHMARK_DIR, 'results', 'query_load_test.json')
+DAY_VALUES = ['weekday', 'weekend', 'all', 'Monday', 'Saturday']
+
+
+def query_mix(table_path, n, seed=42, miss_rate=0.02):
+    """
+    `n` query parameter dicts drawn from the table's keys with a Zipf-like skew (a few hot
+    route-hours, a long tail), plus a share of queries for unknown routes.
+    """
+    index, _ = load_table(table_path)
+    keys = sorted({(route, hour) for route, hour, _ in index})
+    rng = random.Random(seed)
+    rng.shuffle(keys)
+    weights = [1 / (rank + 1) for rank in range(len(keys))]
+    picks = rng.choices(keys, weights=weights, k=n)
+    queries = []
+    for route, hour in picks:
+        if rng.random() < miss_rate:
+            route = f"UNKNOWN{rng.randrange(100)}"
+        queries.append({'route': route, 'hour': hour, 'day': rng.choice(DAY_VALUES)})
+    return queries
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    return sorted_values[min(int(q * len(sorted_values)), len(sorted_values) - 1)]
+
+
+def run_inprocess(service, queries, threads):
+    def worker(chunk, latencies, errors):
+        for params in chunk:
+            start = time.perf_counter()
+            try:
+                service.lookup(params['route'], params['hour'], params['day'])
+            except QueryError:
+                errors.append(1)
+            latencies.append(time.perf_counter() - start)
+    return _run_threads(worker, queries, threads)
+
+
+def run_http(url, queries, threads):
+    parts = urlsplit(url)
+
+    def worker(chunk, latencies, errors):
+        # One keep-alive connection per client thread
+        connection = http.client.HTTPConnection(parts.hostname, parts.port, timeout=10)
+        for params in chunk:
+            start = time.perf_counter()
+            connection.request('GET', '/delay?' + urlencode(params))
+            response = connection.getresponse()
+            response.read()
+            latencies.append(time.perf_counter() - start)
+            if response.status != 200:
+                errors.append(response.status)
+        connection.close()
+    return _run_threads(worker, queries, threads)
+
+
+def _run_threads(worker, queries, threads):
+    chunks = [queries[i::threads] for i in range(threads)]
+    latencies = [[] for _ in chunks]
+    errors = [[] for _ in chunks]
+    workers = [threading.Thread(target=worker, args=(chunk, lat, err)) for chunk, lat, err in zip(chunks, latencies, errors)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    all_latencies = sorted(value for values in latencies for value in values)
+    return {
+        'queries': len(all_latencies),
+        'threads': threads,
+        'elapsed_s': round(elapsed, 3),
+        'qps': round(len(all_latencies) / elapsed, 1) if elapsed > 0 else None,
+        'p50_ms': round(percentile(all_latencies, 0.5) * 1000, 4),
+        'p99_ms': round(percentile(all_latencies, 0.99) * 1000, 4),
+        'max_ms': round(all_latencies[-1] * 1000, 4),
+        'non_200': sum(len(values) for values in errors)
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load test of the delay query service")
+    parser.add_argument('--table', default=DEFAULT_TABLE_PATH, help="Lookup table (build it with `python main.py lookup`)")
+    parser.add_argument('--url', default=None,
+                        help="Test a running service at this URL (default: start one in this process)")
+    parser.add_argument('--mode', choices=['http', 'inprocess', 'both'], default='both')
+    parser.add_argument('--queries', type=int, default=20000)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--cache-size', type=int, default=4096)
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help="Where to write the results")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """
+    Fires a skewed query mix at the service in-process and/or over HTTP and reports
+    p50/p99 latency, queries per second and cache hit rates.
+    """
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+    if not os.path.exists(args.table):
+        print(f"Delay table {args.table} not found; run `python main.py lookup` first.")
+        return 1
+
+    queries = query_mix(args.table, args.queries)
+    results = {'run_at': time.strftime('%Y-%m-%dT%H:%M:%S'), 'table': args.table}
+
+    if args.mode in ('inprocess', 'both'):
+        service = DelayQueryService(args.table, args.cache_size)
+        service.load()
+        results['inprocess'] = {**run_inprocess(service, queries, args.threads), 'cache': service.cache.stats()}
+
+    if args.mode in ('http', 'both'):
+        server = None
+        if args.url is None:
+            service = DelayQueryService(args.table, args.cache_size)
+            service.load()
+            server = make_server(service, port=0)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            url = f"http://127.0.0.1:{server.server_address[1]}"
+        else:
+            url = args.url
+        results['http'] = run_http(url, queries, args.threads)
+        parts = urlsplit(url)
+        connection = http.client.HTTPConnection(parts.hostname, parts.port, timeout=10)
+        connection.request('GET', '/health')
+        results['http']['cache'] = json.loads(connection.getresponse().read())['cache']
+        connection.close()
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+
+    for mode in ('inprocess', 'http'):
+        if mode in results:
+            r = results[mode]
+            print(f"{mode:<10} {r['queries']:>8} queries  {r['qps']:>10,.0f} q/s  p50 {r['p50_ms']:.3f} ms  "
+                  f"p99 {r['p99_ms']:.3f} ms  cache hit rate {r['cache']['hit_rate']}")
+
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
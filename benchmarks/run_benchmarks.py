@@ -0,0 +1,227 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from src.data_collection.generate_dataset import generate_dataset, synthetic_routes, DEFAULT_ROUTES, DEFAULT_TRIP_HOURS
+from src.pipeline.instrumentation import StageProfile
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BENCHMARK_DIR, 'baseline.json')
+DEFAULT_RESULTS = os.path.join(BENCHMARK_DIR, 'results', 'latest.json')
+
+SERVICE_HOURS = list(range(5, 23))
+
+# Dataset scales: routes x days x hours x trips per hour.
+# routes=None means the six Coimbatore routes from the generator.
+SCALES = {
+    'tiny':   {'routes': None, 'days': 30, 'trip_hours': DEFAULT_TRIP_HOURS, 'trips_per_hour': 1, 'chunksize': None},  # 900 trips
+    'small':  {'routes': None, 'days': 365, 'trip_hours': SERVICE_HOURS, 'trips_per_hour': 4, 'chunksize': None},  # ~158k trips
+    'medium': {'routes': 150, 'days': 365, 'trip_hours': SERVICE_HOURS, 'trips_per_hour': 1, 'chunksize': 1_000_000},  # ~1M trips
+    'large':  {'routes': 1500, 'days': 365, 'trip_hours': SERVICE_HOURS, 'trips_per_hour': 1, 'chunksize': 1_000_000},  # ~10M trips
+    'xlarge': {'routes': 2000, 'days': 365, 'trip_hours': SERVICE_HOURS, 'trips_per_hour': 4, 'chunksize': 2_000_000},  # ~50M trips
+}
+DEFAULT_SCALES = ['tiny', 'small']
+STAGES = ['generate', 'clean', 'load', 'cube', 'analyze', 'optimize', 'summary', 'plots']
+METRICS = ['wall_s', 'peak_rss_mb']
+
+# Differences below these are treated as noise, whatever the relative change
+MIN_DELTA = {'wall_s': 0.05, 'peak_rss_mb': 20.0}
+
+
+def expected_trips(scale):
+    spec = SCALES[scale]
+    n_routes = len(DEFAULT_ROUTES) if spec['routes'] is None else spec['routes']
+    return n_routes * spec['days'] * len(spec['trip_hours']) * spec['trips_per_hour']
+
+
+def run_scale(scale, work_dir, plot_mode='aggregate', seed=42):
+    """
+    Runs every benchmarked stage once on a freshly generated dataset of the given scale.
+    Returns {stage: StageProfile record}. Meant to run in its own process so peak RSS
+    is not inflated by earlier scales.
+    """
+    from src.data_processing.clean_data import clean_data
+    from src.data_processing.load_data import load_cleaned_data
+    from src.analysis.aggregate_cube import DelayCube
+    from src.analysis.delay_analysis import analyze_delays
+    from src.analysis.schedule_optimizer import optimize_schedule
+    from src.analysis.generate_summary_report import generate_summary
+    from src.visualization.plot_delay import plot_delays
+
+    spec = SCALES[scale]
+    routes = None if spec['routes'] is None else synthetic_routes(spec['routes'], seed=seed)
+    raw_path = os.path.join(work_dir, 'raw', 'bus_delay_dataset.csv')
+    processed_path = os.path.join(work_dir, 'processed', 'cleaned_bus_delay.csv')
+    tables_dir = os.path.join(work_dir, 'tables')
+    n_trips = expected_trips(scale)
+    records = {}
+
+    def measure(stage, func, rows_in=None, rows_out=None):
+        with StageProfile(stage) as profile:
+            result = func()
+            profile.set_rows(rows_in, rows_out)
+        records[stage] = profile.record
+        return result
+
+    measure('generate', lambda: generate_dataset(
+        output_path=raw_path, days=spec['days'], routes=routes, trip_hours=spec['trip_hours'],
+        trips_per_hour=spec['trips_per_hour'], start_date='2024-01-01', seed=seed, return_df=False
+    ), rows_out=n_trips)
+    measure('clean', lambda: clean_data(input_path=raw_path, output_path=processed_path,
+                                        chunksize=spec['chunksize']), rows_in=n_trips)
+    df = measure('load', lambda: load_cleaned_data(processed_path), rows_out=n_trips)
+    cube = measure('cube', lambda: DelayCube.from_trips(df), rows_in=len(df))
+    measure('analyze', lambda: analyze_delays(input_path=processed_path, output_dir=tables_dir, cube=cube),
+            rows_in=len(df))
+    measure('optimize', lambda: optimize_schedule(input_path=processed_path, output_dir=tables_dir, df=df, cube=cube),
+            rows_in=len(df))
+    measure('summary', lambda: generate_summary(
+        input_data=processed_path, rec_path=os.path.join(tables_dir, 'recommendations.csv'),
+        output_report=os.path.join(work_dir, 'summary_report.txt'), cube=cube
+    ), rows_in=len(df))
+    measure('plots', lambda: plot_delays(input_path=processed_path, output_dir=os.path.join(work_dir, 'plots'),
+                                         df=df, cube=cube, use_cache=False, mode=plot_mode), rows_in=len(df))
+    return records
+
+
+def run_isolated(scale, work_root, plot_mode):
+    """
+    Runs one scale in a fresh spawned process and removes its data afterwards.
+    """
+    work_dir = tempfile.mkdtemp(prefix=f'bench_{scale}_', dir=work_root)
+    try:
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+            return pool.submit(run_scale, scale, work_dir, plot_mode).result()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def machine_info():
+    return {
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'cpu_count': os.cpu_count()
+    }
+
+
+def compare(results, baseline, threshold):
+    """
+    Compares results against a baseline; returns a list of regression messages.
+    A metric regresses when it is more than `threshold` (relative) worse than the
+    baseline and the absolute difference is above MIN_DELTA.
+    """
+    regressions = []
+    for scale, stages in results['scales'].items():
+        base_stages = baseline.get('scales', {}).get(scale)
+        if base_stages is None:
+            logging.warning(f"No baseline for scale '{scale}', skipped comparison")
+            continue
+        for stage, record in stages.items():
+            base = base_stages.get(stage)
+            if base is None:
+                continue
+            for metric in METRICS:
+                new, old = record.get(metric), base.get(metric)
+                if new is None or not old:
+                    continue
+                change = new / old - 1
+                if change > threshold and new - old > MIN_DELTA[metric]:
+                    regressions.append(f"{scale}/{stage} {metric}: {old} -> {new} (+{change:.0%})")
+    return regressions
+
+
+def print_table(results, baseline=None):
+    print(f"{'scale':<8} {'stage':<9} {'trips':>11} {'wall_s':>9} {'base_s':>9} {'rows/s':>12} {'peak_rss_mb':>12}")
+    for scale, stages in results['scales'].items():
+        base_stages = (baseline or {}).get('scales', {}).get(scale, {})
+        for stage, record in stages.items():
+            base_wall = base_stages.get(stage, {}).get('wall_s')
+            rows = record['rows_in'] if record['rows_in'] is not None else record['rows_out']
+            print(f"{scale:<8} {stage:<9} {rows or 0:>11,} {record['wall_s']:>9.3f} "
+                  f"{base_wall if base_wall is not None else '-':>9} "
+                  f"{record['rows_per_s'] or 0:>12,.0f} {record['peak_rss_mb']:>12.1f}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Scaling benchmarks for the bus delay pipeline")
+    parser.add_argument('--scales', default=','.join(DEFAULT_SCALES),
+                        help=f"Comma-separated scales to run, from: {', '.join(SCALES)} (default: %(default)s)")
+    parser.add_argument('--repeat', type=int, default=1, help="Runs per scale; the best time per stage is kept")
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help="Allowed relative slowdown / memory growth before failing (default: %(default)s)")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="Baseline JSON file")
+    parser.add_argument('--output', default=DEFAULT_RESULTS, help="Where to write this run's results")
+    parser.add_argument('--update-baseline', action='store_true', help="Store this run as the new baseline")
+    parser.add_argument('--plot-mode', choices=['trips', 'aggregate'], default='aggregate', help="Plot rendering mode")
+    parser.add_argument('--work-dir', default=None, help="Directory for generated datasets (default: system temp)")
+    parser.add_argument('--verbose', action='store_true', help="Show pipeline log messages")
+    args = parser.parse_args(argv)
+    args.scales = [s.strip() for s in args.scales.split(',') if s.strip()]
+    unknown = set(args.scales) - set(SCALES)
+    if unknown:
+        parser.error(f"Unknown scale(s): {sorted(unknown)}")
+    return args
+
+
+def main(argv=None):
+    """
+    Runs the selected scales, writes the results and checks them against the baseline.
+    Returns 1 when a regression exceeds the threshold, 0 otherwise.
+    """
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format="%(asctime)s - %(levelname)s - %(message)s")
+
+    results = {'run_at': datetime.now().isoformat(timespec='seconds'), 'machine': machine_info(),
+               'plot_mode': args.plot_mode, 'scales': {}}
+    for scale in args.scales:
+        print(f"Running scale '{scale}' (~{expected_trips(scale):,} trips)...", flush=True)
+        best = {}
+        for _ in range(args.repeat):
+            for stage, record in run_isolated(scale, args.work_dir, args.plot_mode).items():
+                if stage not in best or record['wall_s'] < best[stage]['wall_s']:
+                    best[stage] = record
+        results['scales'][scale] = {stage: best[stage] for stage in STAGES if stage in best}
+
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_table(results, baseline)
+    print(f"Results written to {args.output}")
+
+    if args.update_baseline or baseline is None:
+        if baseline is not None:
+            # Keep scales that were not part of this run
+            results['scales'] = {**baseline.get('scales', {}), **results['scales']}
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if baseline.get('machine') != results['machine']:
+        logging.warning("Baseline was recorded on a different machine; timings may not be comparable")
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print(f"REGRESSIONS (threshold {args.threshold:.0%}):")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    print(f"No regressions beyond {args.threshold:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,12 +1,37 @@
-from src.data_collection.generate_dataset import generate_dataset
-from src.data_processing.clean_data import clean_data
-from src.analysis.delay_analysis import analyze_delays
-from src.analysis.generate_summary_report import generate_summary
-from src.visualization.plot_delay import plot_delays
-from src.visualization.route_map import generate_route_map
+from src.pipeline.context import PipelineContext
+from src.pipeline.scheduler import Stage, StageScheduler
+from src.pipeline.instrumentation import RunReport
+from datetime import datetime, timedelta
+import argparse
 import os
+import sys
 import logging
 
+# Stage modules (pandas, matplotlib, seaborn, folium) are imported inside the stage
+# functions, so a command only pays for the libraries of the stages it runs.
+STAGE_NAMES = ['generate', 'clean', 'analyze', 'optimize', 'simulate', 'model', 'lookup', 'summary', 'plots', 'map']
+
+# CLI subcommand -> stages it runs (None: the whole pipeline)
+COMMANDS = {
+    'generate': ['generate'],
+    'clean': ['clean'],
+    'analyze': ['analyze'],
+    'optimize': ['optimize'],
+    'simulate': ['simulate'],
+    'train': ['model'],
+    'lookup': ['lookup'],
+    'report': ['summary'],
+    'plot': ['plots'],
+    'map': ['map'],
+    'all': None
+}
+
+OPTION_DEFAULTS = {'force': False, 'only': None, 'jobs': 4, 'days': 30, 'chunksize': None,
+                   'plot_mode': 'trips', 'plot_workers': None, 'cube_workers': None,
+                   'partitioned': False, 'start_date': None, 'end_date': None, 'routes': None,
+                   'target_percentile': 0.9, 'fleet': None, 'replications': 1000, 'sim_workers': None,
+                   'profile': False, 'trace_memory': False}
+
 def configure_logging():
     """
     Configures the extraction logging system.
@@ -25,57 +50,273 @@ def configure_logging():
     console.setFormatter(formatter)
     logging.getLogger('').addHandler(console)
 
-def main():
+def share(text):
+    """
+    argparse type of a share in (0, 1], e.g. 0.9 (not 90).
+    """
+    value = float(text)
+    if not 0 < value <= 1:
+        raise argparse.ArgumentTypeError(f"expected a share in (0, 1] such as 0.9, got {text}")
+    return value
+
+def parse_args(argv=None):
+    """
+    Parses `main.py <command> [options]`. Without a command the whole pipeline runs,
+    so `python main.py --force` keeps working.
+    """
+    argv = list(sys.argv[1:] if argv is None else argv)
+    if not argv or (argv[0].startswith('-') and argv[0] not in ('-h', '--help')):
+        argv.insert(0, 'all')
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--force', action='store_true',
+                        help="Re-run stages even if their inputs and parameters are unchanged")
+    common.add_argument('--jobs', type=int, default=4, help="Maximum number of stages running concurrently")
+    common.add_argument('--cube-workers', type=int, default=None,
+                        help="Build the aggregate cube from the memory-mapped trip store in this many processes")
+    common.add_argument('--profile', action='store_true',
+                        help="Dump cProfile output per stage to reports/metrics/profiles (runs stages one at a time)")
+    common.add_argument('--trace-memory', action='store_true',
+                        help="Also record the tracemalloc peak per stage (runs stages one at a time)")
+
+    generate_opts = argparse.ArgumentParser(add_help=False)
+    generate_opts.add_argument('--days', type=int, default=30, help="Days of trips to generate")
+    clean_opts = argparse.ArgumentParser(add_help=False)
+    clean_opts.add_argument('--chunksize', type=int, default=None, help="Clean the raw data in streaming chunks of this many rows")
+    clean_opts.add_argument('--partitioned', action='store_true',
+                            help="Also write a date/route-partitioned Parquet dataset for fast filtered reads")
+    slice_opts = argparse.ArgumentParser(add_help=False)
+    slice_opts.add_argument('--start-date', default=None, help="Only use trips on or after this date (YYYY-MM-DD)")
+    slice_opts.add_argument('--end-date', default=None, help="Only use trips on or before this date (YYYY-MM-DD)")
+    slice_opts.add_argument('--route', action='append', dest='routes', metavar='ROUTE',
+                            help="Only use trips of this route (repeatable)")
+    optimize_opts = argparse.ArgumentParser(add_help=False)
+    optimize_opts.add_argument('--target-percentile', type=share, default=0.9,
+                               help="Share of trips that should run on time with the schedule buffers (default: %(default)s)")
+    optimize_opts.add_argument('--fleet', type=int, default=None,
+                               help="Buses available per hour (default: what the current timetable needs)")
+    simulate_opts = argparse.ArgumentParser(add_help=False)
+    simulate_opts.add_argument('--replications', type=int, default=1000,
+                               help="Monte Carlo replications per what-if scenario (default: %(default)s)")
+    simulate_opts.add_argument('--sim-workers', type=int, default=None,
+                               help="Processes for the scenario simulation (default: all CPUs)")
+    plot_opts = argparse.ArgumentParser(add_help=False)
+    plot_opts.add_argument('--plot-mode', choices=['trips', 'aggregate'], default='trips', help="Plot rendering mode")
+    plot_opts.add_argument('--plot-workers', type=int, default=None, help="Render plots in a process pool of this size")
+
+    parser = argparse.ArgumentParser(description="Bus Delay Optimization Pipeline")
+    commands = parser.add_subparsers(dest='command', metavar='COMMAND')
+    commands.add_parser('generate', parents=[common, generate_opts], help="Generate the raw trip dataset")
+    commands.add_parser('clean', parents=[common, clean_opts], help="Clean the raw dataset")
+    commands.add_parser('analyze', parents=[common, slice_opts], help="Route ranking and recommendation tables")
+    commands.add_parser('optimize', parents=[common, optimize_opts, slice_opts],
+                        help="Schedule buffers, fleet allocation and headways per route and hour")
+    commands.add_parser('simulate', parents=[common, simulate_opts],
+                        help="Monte Carlo what-if scenarios from config/scenarios.json")
+    commands.add_parser('train', parents=[common], help="Train and evaluate the delay prediction model")
+    commands.add_parser('lookup', parents=[common], help="Build the delay query service's lookup table")
+    commands.add_parser('report', parents=[common, slice_opts], help="Executive summary report")
+    commands.add_parser('plot', parents=[common, plot_opts, slice_opts], help="Delay plots")
+    commands.add_parser('map', parents=[common, slice_opts], help="Interactive route map")
+    run_all = commands.add_parser('all', parents=[common, generate_opts, clean_opts, optimize_opts, simulate_opts,
+                                                  plot_opts, slice_opts],
+                                  help="Run the whole pipeline (default)")
+    run_all.add_argument('--only', action='append', choices=STAGE_NAMES, metavar='STAGE',
+                         help=f"Run only this stage (repeatable). One of: {', '.join(STAGE_NAMES)}")
+
+    # Options a command does not define keep their defaults (the stage DAG is always built in full)
+    args = parser.parse_args(argv, namespace=argparse.Namespace(**OPTION_DEFAULTS))
+    if args.command != 'all':
+        args.only = COMMANDS[args.command]
+    return args
+
+def count_csv_rows(path):
+    """
+    Number of data rows in a CSV file, counted without parsing it.
+    """
+    with open(path, 'rb') as f:
+        lines = sum(block.count(b'\n') for block in iter(lambda: f.read(1 << 20), b''))
+    return max(lines - 1, 0)
+
+def build_stages(ctx, args, tables_dir='reports/tables'):
+    """
+    Declares the pipeline as a DAG: each stage lists the files it reads and writes.
+    """
+    raw_data_path = ctx.raw_data_path
+    processed_data_path = ctx.processed_data_path
+    ranking_path = os.path.join(tables_dir, 'route_ranking.csv')
+    rec_path = os.path.join(tables_dir, 'recommendations.csv')
+    rules_path = 'config/recommendation_rules.json'
+    plan_path = os.path.join(tables_dir, 'schedule_plan.csv')
+    scenarios_path = 'config/scenarios.json'
+    scenario_results_path = os.path.join(tables_dir, 'scenario_results.csv')
+    model_path = 'data/models/delay_model'
+    evaluation_path = os.path.join(tables_dir, 'model_evaluation.csv')
+    lookup_path = 'data/service/delay_table.csv'
+    plot_files = ['delay_distribution.png', 'route_wise_delay.png', 'hour_vs_delay.png',
+                  'delay_heatmap.png', 'traffic_vs_delay.png']
+
+    # A date/route slice is loaded by each report stage itself (pruned partitions);
+    # the shared full-history cube is only used without one. Report stages work from the
+    # cube, so the trips are only passed along when they are already in memory; a stage
+    # that also needs trips loads just the columns it uses.
+    filters = {'start_date': args.start_date, 'end_date': args.end_date, 'routes': args.routes}
+    sliced = any(filters.values())
+
+    def shared():
+        if sliced:
+            return {'df': None, 'cube': None, **filters}
+        return {'cube': ctx.cube, 'df': ctx.loaded_cleaned}
+
+    def trips():
+        return None if sliced else ctx.trip_count
+
+    def run_generate():
+        from src.data_collection.generate_dataset import generate_dataset, DEFAULT_ROUTES, DEFAULT_TRIP_HOURS
+        # The window ends today; the date is left out of the stage params so the stage is
+        # not re-run just because the calendar moved on
+        start_date = (datetime.now() - timedelta(days=args.days)).strftime('%Y-%m-%d')
+        generate_dataset(output_path=raw_data_path, days=args.days, start_date=start_date, return_df=False)
+        return {'rows_out': len(DEFAULT_ROUTES) * len(DEFAULT_TRIP_HOURS) * args.days}
+
+    def run_clean():
+        from src.data_processing.clean_data import clean_data
+        # Raw and cleaned trips are counted while cleaning, not by re-reading the raw file
+        counts = {}
+        cleaned = clean_data(input_path=raw_data_path, output_path=processed_data_path, chunksize=args.chunksize,
+                             partition_by=('date', 'route_no') if args.partitioned else None, counts=counts)
+        # Chunked cleaning returns the number of cleaned trips instead of the trips themselves
+        ctx.cleaned = cleaned if args.chunksize is None else None
+        return {'rows_in': counts.get('rows_in'), 'rows_out': counts.get('rows_out')}
+
+    def run_analyze():
+        from src.analysis.delay_analysis import analyze_delays
+        analyze_delays(input_path=processed_data_path, output_dir=tables_dir, rules_path=rules_path, **shared())
+        return {'rows_in': trips(), 'rows_out': count_csv_rows(ranking_path)}
+
+    def run_optimize():
+        from src.analysis.schedule_optimizer import optimize_schedule
+        optimize_schedule(input_path=processed_data_path, output_dir=tables_dir,
+                          target_percentile=args.target_percentile, fleet_size=args.fleet, **shared())
+        return {'rows_in': trips(), 'rows_out': count_csv_rows(plan_path)}
+
+    def run_simulate():
+        from src.simulation.monte_carlo import run_scenarios
+        run_scenarios(scenarios_path=scenarios_path, output_path=scenario_results_path,
+                      replications=args.replications, workers=args.sim_workers)
+        return {'rows_out': count_csv_rows(scenario_results_path)}
+
+    def run_model():
+        from src.prediction.delay_model import train_delay_model
+        # The model is always trained on the full history, whatever the report slice
+        train_delay_model(input_path=processed_data_path, model_path=model_path, report_path=evaluation_path,
+                          df=ctx.cleaned)
+        return {'rows_in': ctx.trip_count}
+
+    def run_lookup():
+        from src.service.delay_table import write_delay_table
+        # A running query service reloads the table as soon as this replaces it
+        table = write_delay_table(input_path=processed_data_path, output_path=lookup_path, df=ctx.cleaned)
+        return {'rows_in': ctx.trip_count, 'rows_out': len(table) if table is not None else None}
+
+    def run_summary():
+        from src.analysis.generate_summary_report import generate_summary
+        generate_summary(input_data=processed_data_path, rec_path=rec_path, **shared())
+        return {'rows_in': trips()}
+
+    def run_plots():
+        from src.visualization.plot_delay import plot_delays
+        plot_delays(input_path=processed_data_path, workers=args.plot_workers, mode=args.plot_mode, **shared())
+        return {'rows_in': trips()}
+
+    def run_map():
+        from src.visualization.route_map import generate_route_map
+        generate_route_map(input_path=processed_data_path, **shared())
+        return {'rows_in': trips()}
+
+    return [
+        # Step 1: Data Collection
+        Stage('generate', run_generate,
+              outputs=[raw_data_path], params={'days': args.days}),
+        # Step 2: Data Processing
+        Stage('clean', run_clean,
+              inputs=[raw_data_path], outputs=[processed_data_path], params={'partitioned': args.partitioned}),
+        # Step 3: Analysis
+        Stage('analyze', run_analyze,
+              inputs=[processed_data_path, rules_path], outputs=[ranking_path, rec_path], params=filters),
+        # Step 3b: Schedule Optimization
+        Stage('optimize', run_optimize,
+              inputs=[processed_data_path], outputs=[plan_path],
+              params={'target_percentile': args.target_percentile, 'fleet': args.fleet, **filters}),
+        # Step 3c: What-if Scenario Simulation (independent of the collected data)
+        Stage('simulate', run_simulate,
+              inputs=[scenarios_path], outputs=[scenario_results_path], params={'replications': args.replications}),
+        # Step 3d: Delay Prediction Model
+        Stage('model', run_model,
+              inputs=[processed_data_path], outputs=[model_path + '.npz', model_path + '.json', evaluation_path]),
+        # Step 3e: Query Service Lookup Table
+        Stage('lookup', run_lookup,
+              inputs=[processed_data_path], outputs=[lookup_path]),
+        # Step 4: Summary Report (also reads the recommendations)
+        Stage('summary', run_summary,
+              inputs=[processed_data_path, rec_path, ranking_path], outputs=['reports/summary_report.txt'],
+              params=filters),
+        # Step 5: Visualization
+        Stage('plots', run_plots,
+              inputs=[processed_data_path], outputs=[os.path.join('reports/plots', f) for f in plot_files],
+              params={'mode': args.plot_mode, **filters}),
+        # Step 6: Geospatial Map
+        Stage('map', run_map,
+              inputs=[processed_data_path], outputs=['reports/bus_route_map.html'], params=filters),
+    ]
+
+def main(argv=None):
     """
     Main entry point for the Bus Delay & Route Optimization project.
-    Orchestrates the entire data pipeline (Version 1.0).
+    Orchestrates the entire data pipeline (Version 1.0) as a stage DAG: independent
+    stages run concurrently and stages whose inputs are unchanged are skipped.
     """
+    args = parse_args(argv)
     configure_logging()
-    
+
     logging.info("==================================================")
     logging.info("   Bus Delay Optimization Pipeline Started (v1.0) ")
     logging.info("==================================================")
-    
+
     # Define Paths
     raw_data_path = 'data/raw/bus_delay_dataset.csv'
     processed_data_path = 'data/processed/cleaned_bus_delay.csv'
-    
+
+    # Shared run state: the cleaned data is parsed once and reused by every stage
+    ctx = PipelineContext(raw_data_path=raw_data_path, processed_data_path=processed_data_path,
+                          cube_workers=args.cube_workers)
+
     # Ensure all directories exist
     os.makedirs('reports/plots', exist_ok=True)
     os.makedirs('reports/tables', exist_ok=True)
-    
-    try:
-        # Step 1: Data Collection
-        logging.info(">>> Step [1/6]: Generating Dataset...")
-        generate_dataset(output_path=raw_data_path)
-        
-        # Step 2: Data Processing
-        logging.info(">>> Step [2/6]: Cleaning Data...")
-        clean_data(input_path=raw_data_path, output_path=processed_data_path)
-        
-        # Step 3: Analysis
-        logging.info(">>> Step [3/6]: Running Analysis & Recommendations...")
-        analyze_delays(input_path=processed_data_path)
-        
-        # Step 4: Summary Report
-        logging.info(">>> Step [4/6]: Generating Summary Report...")
-        generate_summary(input_data=processed_data_path)
-        
-        # Step 5: Visualization
-        logging.info(">>> Step [5/6]: Generating Plots...")
-        plot_delays(input_path=processed_data_path)
 
-        # Step 6: Geospatial Map
-        logging.info(">>> Step [6/6]: Creating Route Map...")
-        generate_route_map(input_path=processed_data_path)
-        
-        logging.info("==================================================")
-        logging.info("   Pipeline Execution Completed Successfully      ")
-        logging.info("==================================================")
-        
-    except Exception as e:
-        logging.critical(f"Pipeline failed with error: {str(e)}", exc_info=True)
-        print(f"CRITICAL ERROR: {str(e)}. Check logs/project.log for details.")
+    # Per-stage wall/CPU time, memory and row counts go to reports/metrics/run_metrics.{json,csv}
+    report = RunReport(output_dir='reports/metrics')
+    jobs = args.jobs
+    if (args.profile or args.trace_memory) and jobs != 1:
+        logging.info("Profiling enabled: running stages one at a time for accurate per-stage numbers")
+        jobs = 1
+
+    scheduler = StageScheduler(build_stages(ctx, args), max_workers=jobs, report=report,
+                               trace_memory=args.trace_memory,
+                               profile_dir='reports/metrics/profiles' if args.profile else None)
+    results = scheduler.run(only=args.only, force=args.force)
+    logging.info("Stage results: " + ", ".join(f"{name}={status}" for name, status in results.items()))
+    report.write()
+
+    if any(status in ('failed', 'blocked') for status in results.values()):
+        print("CRITICAL ERROR: pipeline stage(s) failed. Check logs/project.log for details.")
+        return 1
+
+    logging.info("==================================================")
+    logging.info("   Pipeline Execution Completed Successfully      ")
+    logging.info("==================================================")
+    return 0
 
 if __name__ == "__main__":
-    main()
+    raise SystemExit(main())
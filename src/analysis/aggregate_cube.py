@@ -0,0 +1,236 @@
+import pandas as pd
+import numpy as np
+import os
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from src.data_processing.trip_store import open_trip_store
+
+# Grain of the cube: one cell per route x hour x date x peak flag
+CUBE_KEYS = ['route_no', 'route_name', 'hour', 'date', 'peak_hour']
+# Grain of the delay histogram used for quantiles (dates are folded in to keep it small)
+HIST_KEYS = ['route_no', 'route_name', 'hour', 'peak_hour']
+# Grain of the traffic x delay counts behind the traffic plots (multipliers have 2 decimals)
+TRAFFIC_KEYS = ['peak_hour', 'traffic_multiplier', 'delay_min']
+# Trip columns needed to build a cube
+CUBE_COLUMNS = CUBE_KEYS + ['delay_min', 'inefficiency_score', 'traffic_multiplier']
+# Per-cell statistics
+CELL_STATS = ['count', 'delay_mean', 'delay_m2', 'delay_lo', 'delay_hi', 'inefficiency_sum']
+
+
+def combine_cells(cells, keys):
+    """
+    Merges cells into one cell per `keys` group (a single group when empty).
+    Means and M2 are combined with the parallel update of Chan et al.:
+    M2 = sum(M2_i) + sum(n_i * (mean_i - mean)^2).
+    """
+    if not keys:
+        cells = cells.assign(_all='ALL')
+        keys = ['_all']
+
+    cells = cells.assign(_weighted=cells['count'] * cells['delay_mean'])
+    group_total = cells.groupby(keys, observed=True)['count'].transform('sum')
+    group_mean = cells.groupby(keys, observed=True)['_weighted'].transform('sum') / group_total
+    cells['_dev'] = cells['delay_m2'] + cells['count'] * (cells['delay_mean'] - group_mean) ** 2
+
+    out = cells.groupby(keys, observed=True, sort=True).agg(
+        count=('count', 'sum'),
+        _weighted=('_weighted', 'sum'),
+        delay_m2=('_dev', 'sum'),
+        delay_lo=('delay_lo', 'min'),
+        delay_hi=('delay_hi', 'max'),
+        inefficiency_sum=('inefficiency_sum', 'sum')
+    )
+    out.insert(1, 'delay_mean', out.pop('_weighted') / out['count'])
+    return out.reset_index()
+
+
+class DelayCube:
+    """
+    Sufficient statistics of trip delays, built in one scan over the trip table.
+
+    `cells` holds, per CUBE_KEYS cell: count, delay_mean, delay_m2 (sum of squared
+    deviations), delay_lo/delay_hi (min/max) and inefficiency_sum.
+    `hist` holds trip counts per HIST_KEYS cell and delay value. Delays are whole
+    minutes, so it is an exact quantile sketch whose size is bounded by the delay range.
+    `traffic` holds trip counts per TRAFFIC_KEYS value (None for cubes saved without it).
+
+    Every metric of the analysis, summary and plots is answered from these two
+    tables, so their cost scales with the number of groups rather than trips.
+    """
+
+    def __init__(self, cells, hist, traffic=None):
+        self.cells = cells
+        self.hist = hist
+        self.traffic = traffic
+
+    @classmethod
+    def from_trips(cls, df):
+        """
+        Builds the cube from a cleaned trip DataFrame (needs CUBE_COLUMNS).
+        """
+        logging.info(f"Building aggregate cube from {len(df)} trips...")
+        cells = df.groupby(CUBE_KEYS, observed=True, sort=True).agg(
+            count=('delay_min', 'size'),
+            delay_mean=('delay_min', 'mean'),
+            delay_var=('delay_min', 'var'),
+            delay_lo=('delay_min', 'min'),
+            delay_hi=('delay_min', 'max'),
+            inefficiency_sum=('inefficiency_score', 'sum')
+        ).reset_index()
+        cells['delay_m2'] = (cells.pop('delay_var') * (cells['count'] - 1)).fillna(0.0)
+        cells = cells[CUBE_KEYS + CELL_STATS]
+
+        hist = df.groupby(HIST_KEYS + ['delay_min'], observed=True, sort=True).size().rename('count').reset_index()
+
+        # Rounded back to 2 decimals, which the float32 trip columns do not hold exactly
+        traffic = df[TRAFFIC_KEYS].assign(traffic_multiplier=df['traffic_multiplier'].astype(float).round(2))
+        traffic = traffic.groupby(TRAFFIC_KEYS, observed=True, sort=True).size().rename('count').reset_index()
+
+        logging.info(f"Aggregate cube has {len(cells)} cells and {len(hist)} histogram bins")
+        return cls(cells, hist, traffic)
+
+    @property
+    def keys(self):
+        """
+        Key columns of the cells (CUBE_KEYS, or fewer after compact()).
+        """
+        return [c for c in self.cells.columns if c not in CELL_STATS]
+
+    def compact(self, by=HIST_KEYS):
+        """
+        Returns a cube whose cells are merged down to the `by` columns.
+        The default drops the date, which keeps the cube size independent of history length.
+        """
+        return DelayCube(combine_cells(self.cells, list(by)), self.hist, self.traffic)
+
+    def merge(self, other):
+        """
+        Returns the cube of the union of both trip sets, keyed on the keys both cubes share.
+        Cells with the same key are combined with the parallel mean/variance update.
+        """
+        return DelayCube.merge_all([self, other])
+
+    @classmethod
+    def merge_all(cls, cubes):
+        """
+        Cube of the union of several trip sets (see merge), combined in a single pass.
+        """
+        keys = [k for k in cubes[0].keys if all(k in cube.keys for cube in cubes[1:])]
+        columns = keys + CELL_STATS
+        cells = pd.concat([cube.cells[columns] for cube in cubes], ignore_index=True)
+        if keys:
+            # Only keys present in more than one cube need combining (few, for row-range partitions)
+            shared = cells.duplicated(keys, keep=False)
+            cells = pd.concat([cells[~shared], combine_cells(cells[shared], keys)], ignore_index=True)
+            cells = cells.sort_values(keys, ignore_index=True)
+        else:
+            cells = combine_cells(cells, keys)
+        hist = pd.concat([cube.hist for cube in cubes], ignore_index=True)
+        hist = hist.groupby(HIST_KEYS + ['delay_min'], observed=True, sort=True)['count'].sum().reset_index()
+        traffic = None
+        if all(cube.traffic is not None for cube in cubes):
+            traffic = pd.concat([cube.traffic for cube in cubes], ignore_index=True)
+            traffic = traffic.groupby(TRAFFIC_KEYS, observed=True, sort=True)['count'].sum().reset_index()
+        return cls(cells, hist, traffic)
+
+    def save(self, path, extra=None):
+        """
+        Persists the cube (pickle), replacing `path` atomically.
+        `extra` entries (e.g. bookkeeping of what the cube covers) are stored in the same file.
+        """
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = path + '.tmp'
+        pd.to_pickle({**(extra or {}), 'cells': self.cells, 'hist': self.hist, 'traffic': self.traffic}, tmp_path)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        state = pd.read_pickle(path)
+        return cls(state['cells'], state['hist'], state.get('traffic'))
+
+    def rollup(self, by=None):
+        """
+        Rolls the cells up to the `by` columns (overall when None).
+        Returns count, mean, std (sample), min, max and inefficiency (mean score) per group.
+        """
+        keys = list(by) if by else []
+        out = combine_cells(self.cells, keys).set_index(keys or ['_all'])
+        result = pd.DataFrame({
+            'count': out['count'],
+            'mean': out['delay_mean'],
+            'std': np.sqrt(out['delay_m2'] / (out['count'] - 1).where(out['count'] > 1)),
+            'min': out['delay_lo'],
+            'max': out['delay_hi'],
+            'inefficiency': out['inefficiency_sum'] / out['count']
+        })
+        if not keys:
+            result.index.name = None
+        return result
+
+    def overall(self):
+        """
+        Overall statistics across every trip, as a Series.
+        """
+        return self.rollup().iloc[0]
+
+    def quantile(self, q, by=None):
+        """
+        Exact delay quantile (linear interpolation, as pandas' quantile) per `by` group.
+        Returns a float when `by` is None, else a Series indexed by `by`.
+        """
+        keys = list(by) if by else []
+        for key in keys:
+            if key not in HIST_KEYS:
+                raise ValueError(f"Quantiles are only available over {HIST_KEYS}, not '{key}'")
+
+        hist = self.hist
+        if not keys:
+            hist = hist.assign(_all='ALL')
+            keys = ['_all']
+        hist = hist.groupby(keys + ['delay_min'], observed=True, sort=True)['count'].sum().reset_index()
+
+        grouped = hist.groupby(keys, observed=True, sort=False)['count']
+        upto = grouped.cumsum()
+        before = upto - hist['count']
+        pos = (grouped.transform('sum') - 1) * q
+        lo, hi = np.floor(pos), np.ceil(pos)
+
+        # The value at 0-based rank r lives in the bin with before <= r < upto
+        lo_rows = (before <= lo) & (lo < upto)
+        hi_rows = (before <= hi) & (hi < upto)
+        index = pd.MultiIndex.from_frame(hist[keys]) if len(keys) > 1 else pd.Index(hist[keys[0]])
+        values = pd.Series(hist['delay_min'].to_numpy(dtype=float), index=index)
+        frac = pd.Series((pos - lo).to_numpy(), index=index)
+
+        v_lo = values[lo_rows.to_numpy()]
+        v_hi = values[hi_rows.to_numpy()]
+        result = v_lo + (v_hi - v_lo) * frac[lo_rows.to_numpy()]
+        if keys == ['_all']:
+            return float(result.iloc[0])
+        return result.rename(f"p{q * 100:g}")
+
+
+def _cube_for_rows(csv_path, start, stop):
+    """
+    Worker task: cube of one row range of the trip store (opened, not pickled).
+    """
+    store = open_trip_store(csv_path)
+    return DelayCube.from_trips(store.frame(start, stop, CUBE_COLUMNS))
+
+
+def cube_from_store(csv_path, workers=None):
+    """
+    Builds the cube of a cleaned CSV from its memory-mapped trip store.
+    With `workers`, each process maps the same store and aggregates one row range;
+    the partial cubes are merged. Returns None when no up-to-date store exists.
+    """
+    store = open_trip_store(csv_path)
+    if store is None:
+        return None
+    if not workers or workers < 2 or len(store) == 0:
+        return DelayCube.from_trips(store.frame(columns=CUBE_COLUMNS))
+
+    logging.info(f"Building aggregate cube from {len(store)} trips in {workers} processes...")
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_cube_for_rows, csv_path, start, stop) for start, stop in store.row_ranges(workers)]
+        return DelayCube.merge_all([future.result() for future in futures])
@@ -1,35 +1,50 @@
 import pandas as pd
 import os
 import logging
+from src.data_processing.load_data import load_cleaned_data
+from src.data_processing.partitioned import has_filters, filter_trips
+from src.analysis.aggregate_cube import DelayCube, CUBE_COLUMNS
 
 def generate_summary(input_data='data/processed/cleaned_bus_delay.csv', 
                      rec_path='reports/tables/recommendations.csv',
-                     output_report='reports/summary_report.txt'):
+                     output_report='reports/summary_report.txt', df=None, cube=None,
+                     start_date=None, end_date=None, routes=None):
     """
     Generates a readable summary report of the bus delay analysis.
+    Pass an already loaded cleaned DataFrame as `df` to skip reading `input_data`, or a
+    prebuilt DelayCube as `cube` to skip the trip scan altogether.
+    `start_date`/`end_date` (inclusive) and `routes` restrict it to a slice of the trips,
+    read from the partitioned dataset when available.
     """
     logging.info("Generating summary report...")
 
-    if not os.path.exists(input_data):
-        logging.error(f"Input file {input_data} not found.")
-        return
-
-    df = pd.read_csv(input_data, parse_dates=['date'])
+    filters = {'start_date': start_date, 'end_date': end_date, 'routes': routes}
+    if has_filters(**filters):
+        # Aggregates of the full history cannot answer a slice
+        cube = None
+        df = filter_trips(df, **filters) if df is not None else None
+    if cube is None:
+        if df is None:
+            df = load_cleaned_data(input_data, columns=CUBE_COLUMNS, **filters)
+            if df is None:
+                return
+        cube = DelayCube.from_trips(df)
     
     # Compute Key Metrics
-    avg_delay = df['delay_min'].mean()
-    p95_delay = df['delay_min'].quantile(0.95)
-    
-    route_avg = df.groupby(['route_no', 'route_name'])['delay_min'].mean()
+    avg_delay = cube.overall()['mean']
+    p95_delay = cube.quantile(0.95)
+
+    route_stats = cube.rollup(['route_no', 'route_name'])
+    route_avg = route_stats['mean']
     worst_route_idx = route_avg.idxmax()
     worst_route = f"{worst_route_idx[0]} ({worst_route_idx[1]})"
     worst_route_delay = route_avg.max()
 
-    hour_avg = df.groupby('hour')['delay_min'].mean()
+    hour_avg = cube.rollup(['hour'])['mean']
     congested_hour = hour_avg.idxmax()
     congested_hour_delay = hour_avg.max()
     
-    inefficiency = df.groupby(['route_no', 'route_name'])['inefficiency_score'].mean()
+    inefficiency = route_stats['inefficiency']
     top_inefficient_idx = inefficiency.idxmax()
     top_inefficient = f"{top_inefficient_idx[0]} ({top_inefficient_idx[1]})"
     
@@ -42,7 +57,7 @@ def generate_summary(input_data='data/processed/cleaned_bus_delay.csv',
                 recommendations_text += f"{idx+1}. Route {row['Route']}: {row['Issue']} -> {row['Action']}\n"
         except Exception as e:
             recommendations_text = f"Could not load recommendations: {str(e)}"
-    else:
+    if not recommendations_text:
         recommendations_text = "No critical recommendations found."
 
     # Report Template
@@ -0,0 +1,253 @@
+import pandas as pd
+import numpy as np
+import os
+import sys
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from src.data_processing.load_data import load_cleaned_data
+from src.data_processing.schema import csv_dtypes, parse_dates
+from src.data_processing.trip_store import open_trip_store
+from src.data_processing.partitioned import has_filters
+
+DEFAULT_QUANTILES = (0.5, 0.9, 0.95, 0.99)
+DEFAULT_GROUPS = ['route_no', 'hour', 'day_of_week']
+DEFAULT_COMPRESSION = 200
+
+
+def _quantile_label(q):
+    return f"p{q * 100:g}"
+
+
+class QuantileSketch:
+    """
+    Mergeable t-digest quantile sketches for many groups at once.
+
+    All groups share one centroid table (group keys, mean, weight) that is compressed
+    with vectorized NumPy operations: centroids are sorted per group and bucketed by the
+    t-digest scale function k(q) = compression / (2 pi) * asin(2q - 1), so every group
+    keeps at most about compression / 2 centroids. Small clusters near the tails give
+    tight error on p95/p99. Exact per-group min/max are tracked as well.
+
+    Sketches built on separate chunks or workers are combined with merge().
+    """
+
+    def __init__(self, by, compression=DEFAULT_COMPRESSION, centroids=None, extremes=None):
+        self.by = list(by)
+        self.compression = compression
+        self.centroids = centroids if centroids is not None else pd.DataFrame(columns=self.by + ['mean', 'weight'])
+        self.extremes = extremes if extremes is not None else pd.DataFrame(columns=self.by + ['min', 'max'])
+
+    @classmethod
+    def from_frame(cls, df, by=DEFAULT_GROUPS, value='delay_min', compression=DEFAULT_COMPRESSION):
+        """
+        Builds a sketch of `value` per `by` group from a DataFrame of trips.
+        """
+        sketch = cls(by, compression)
+        return sketch.merge(sketch._points(df, value))
+
+    def _points(self, df, value):
+        """
+        Wraps raw values as a sketch of weight-1 centroids (not yet compressed).
+        """
+        centroids = df[self.by].copy()
+        centroids['mean'] = df[value].to_numpy(dtype=float)
+        centroids['weight'] = 1.0
+        extremes = df.groupby(self.by, observed=True)[value].agg(['min', 'max']).reset_index()
+        return QuantileSketch(self.by, self.compression, centroids, extremes)
+
+    def update(self, df, value='delay_min'):
+        """
+        Adds a DataFrame of trips to this sketch in place.
+        """
+        merged = self.merge(self._points(df, value))
+        self.centroids, self.extremes = merged.centroids, merged.extremes
+        return self
+
+    def merge(self, other):
+        """
+        Returns the sketch of the union of both inputs.
+        """
+        if other.by != self.by:
+            raise ValueError(f"Cannot merge sketches grouped by {self.by} and {other.by}")
+        frames = [c for c in (self.centroids, other.centroids) if len(c)]
+        centroids = self._compress(pd.concat(frames, ignore_index=True)) if frames else self.centroids
+        frames = [e for e in (self.extremes, other.extremes) if len(e)]
+        extremes = (pd.concat(frames, ignore_index=True).groupby(self.by, observed=True, sort=True)
+                    .agg(min=('min', 'min'), max=('max', 'max')).reset_index()) if frames else self.extremes
+        return QuantileSketch(self.by, self.compression, centroids, extremes)
+
+    def _compress(self, centroids):
+        """
+        Re-clusters a centroid table so each group holds at most ~compression/2 centroids.
+        """
+        codes = centroids.groupby(self.by, observed=True, sort=True).ngroup().to_numpy()
+        means = centroids['mean'].to_numpy(dtype=float)
+        weights = centroids['weight'].to_numpy(dtype=float)
+
+        order = np.lexsort((means, codes))
+        codes, means, weights = codes[order], means[order], weights[order]
+
+        totals = np.bincount(codes, weights=weights)
+        offsets = np.concatenate([[0.0], np.cumsum(totals)[:-1]])
+        q_mid = (np.cumsum(weights) - offsets[codes] - weights / 2) / totals[codes]
+        k = np.floor(self.compression / (2 * np.pi) * np.arcsin(np.clip(2 * q_mid - 1, -1, 1)))
+
+        starts = np.r_[True, (codes[1:] != codes[:-1]) | (k[1:] != k[:-1])]
+        cluster = np.cumsum(starts) - 1
+        cluster_weight = np.bincount(cluster, weights=weights)
+        cluster_mean = np.bincount(cluster, weights=weights * means) / cluster_weight
+
+        first_rows = order[starts]
+        out = centroids[self.by].iloc[first_rows].reset_index(drop=True)
+        out['mean'] = cluster_mean
+        out['weight'] = cluster_weight
+        return out
+
+    def counts(self):
+        """
+        Number of values per group.
+        """
+        return self.centroids.groupby(self.by, observed=True, sort=True)['weight'].sum().rename('count')
+
+    def quantiles(self, qs=DEFAULT_QUANTILES):
+        """
+        Estimated quantiles per group as a DataFrame (columns p50, p90, ...).
+        Uses the same rank convention as pandas' linear quantile, so groups that were
+        never compressed return exact values.
+        """
+        # Interpolation knots per group: (0.5, min), centroid centers, (n - 0.5, max)
+        centroids = self.centroids.sort_values(self.by + ['mean'], kind='stable').reset_index(drop=True)
+        grouped = centroids.groupby(self.by, observed=True, sort=False)['weight']
+        centers = grouped.cumsum() - centroids['weight'] / 2
+
+        groups = self.extremes.merge(self.counts().reset_index(), on=self.by).sort_values(self.by).reset_index(drop=True)
+        codes = centroids[self.by].merge(groups[self.by].assign(g=np.arange(len(groups))), on=self.by, how='left')['g']
+        n = groups['count'].to_numpy()
+
+        knots = pd.concat([
+            pd.DataFrame({'g': np.arange(len(groups)), 'pos': 0.5, 'value': groups['min'].to_numpy(dtype=float)}),
+            pd.DataFrame({'g': codes.to_numpy(), 'pos': centers.to_numpy(), 'value': centroids['mean'].to_numpy()}),
+            pd.DataFrame({'g': np.arange(len(groups)), 'pos': n - 0.5, 'value': groups['max'].to_numpy(dtype=float)}),
+        ], ignore_index=True).sort_values(['g', 'pos'], kind='stable')
+
+        g = knots['g'].to_numpy()
+        offsets = np.concatenate([[0.0], np.cumsum(n)[:-1]])
+        global_pos = offsets[g] + np.clip(knots['pos'].to_numpy(), 0.5, n[g] - 0.5)
+        values = knots['value'].to_numpy()
+
+        result = groups[self.by].copy()
+        for q in qs:
+            target = offsets + q * (n - 1) + 0.5
+            upper = np.clip(np.searchsorted(global_pos, target, side='left'), 0, len(global_pos) - 1)
+            lower = np.maximum(upper - 1, 0)
+            span = global_pos[upper] - global_pos[lower]
+            frac = np.where(span > 0, (target - global_pos[lower]) / np.where(span > 0, span, 1), 0.0)
+            estimate = values[lower] + (values[upper] - values[lower]) * np.clip(frac, 0, 1)
+            result[_quantile_label(q)] = np.where(global_pos[upper] <= target, values[upper], estimate)
+        return result.set_index(self.by)
+
+
+def exact_quantiles(df, by=DEFAULT_GROUPS, value='delay_min', qs=DEFAULT_QUANTILES):
+    """
+    Exact sort-based quantiles per group, for verifying the sketch.
+    """
+    exact = df.groupby(by, observed=True, sort=True)[value].quantile(list(qs)).unstack()
+    exact.columns = [_quantile_label(q) for q in qs]
+    return exact
+
+
+def compare_to_exact(sketch, df, value='delay_min', qs=DEFAULT_QUANTILES):
+    """
+    Compares sketch estimates with exact quantiles.
+    Returns a per-quantile summary of max/mean absolute error in value units.
+    """
+    approx = sketch.quantiles(qs)
+    exact = exact_quantiles(df, sketch.by, value, qs).reindex(approx.index)
+    errors = (approx - exact).abs()
+    return pd.DataFrame({'max_abs_error': errors.max(), 'mean_abs_error': errors.mean()})
+
+
+def _sketch_chunk(chunk, by, value, compression):
+    return QuantileSketch.from_frame(chunk, by, value, compression)
+
+
+def _sketch_rows(input_path, start, stop, by, value, compression):
+    store = open_trip_store(input_path)
+    return QuantileSketch.from_frame(store.frame(start, stop, by + [value]), by, value, compression)
+
+
+def delay_quantiles(input_path='data/processed/cleaned_bus_delay.csv',
+                    output_path='reports/tables/delay_quantiles.csv',
+                    by=DEFAULT_GROUPS, qs=DEFAULT_QUANTILES, compression=DEFAULT_COMPRESSION,
+                    chunksize=None, workers=None, verify=False, start_date=None, end_date=None, routes=None):
+    """
+    Computes p50/p90/p95/p99 delays per route, hour and day of week with a quantile sketch.
+
+    With `chunksize`, the cleaned CSV is streamed and one sketch per chunk is merged, so
+    memory stays bounded; `workers` additionally builds the chunk sketches in a process
+    pool. Without `chunksize`, `workers` splits the memory-mapped trip store into row
+    ranges instead, when one exists. `verify=True` also computes exact quantiles and
+    logs the sketch's error.
+    `start_date`/`end_date` (inclusive) and `routes` restrict it to a slice of the trips,
+    read from the partitioned dataset when available.
+    """
+    logging.info("Computing delay quantiles...")
+
+    if not os.path.exists(input_path):
+        logging.error(f"Input file {input_path} not found.")
+        return None
+
+    by = list(by)
+    columns = by + ['delay_min']
+
+    filters = {'start_date': start_date, 'end_date': end_date, 'routes': routes}
+    store = open_trip_store(input_path) if workers and chunksize is None else None
+    if has_filters(**filters):
+        df = load_cleaned_data(input_path, columns=columns, **filters)
+        if df is None:
+            return None
+        sketch = QuantileSketch.from_frame(df, by, 'delay_min', compression)
+    elif store is not None:
+        # Each worker maps the trip store and sketches one row range; no trip data is pickled
+        sketch = QuantileSketch(by, compression)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_sketch_rows, input_path, start, stop, by, 'delay_min', compression)
+                       for start, stop in store.row_ranges(workers)]
+            for future in futures:
+                sketch = sketch.merge(future.result())
+    elif chunksize is None:
+        df = load_cleaned_data(input_path, columns=columns)
+        sketch = QuantileSketch.from_frame(df, by, 'delay_min', compression)
+    else:
+        sketch = QuantileSketch(by, compression)
+        chunks = pd.read_csv(input_path, usecols=columns, chunksize=chunksize,
+                             dtype=csv_dtypes(columns=columns), parse_dates=parse_dates(columns=columns))
+        if workers:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                pending = []
+                for chunk in chunks:
+                    pending.append(pool.submit(_sketch_chunk, chunk, by, 'delay_min', compression))
+                    if len(pending) >= 2 * workers:  # bound the chunks held in memory
+                        sketch = sketch.merge(pending.pop(0).result())
+                for future in pending:
+                    sketch = sketch.merge(future.result())
+        else:
+            for chunk in chunks:
+                sketch = sketch.merge(_sketch_chunk(chunk, by, 'delay_min', compression))
+
+    result = sketch.quantiles(qs)
+    result.insert(0, 'trips', sketch.counts().astype(int))
+
+    if verify:
+        df = load_cleaned_data(input_path, columns=columns, **filters)
+        report = compare_to_exact(sketch, df, 'delay_min', qs)
+        for label, row in report.iterrows():
+            logging.info(f"Sketch {label}: max abs error {row['max_abs_error']:.3f} min, mean {row['mean_abs_error']:.3f} min")
+
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    result.to_csv(output_path)
+    logging.info(f"Delay quantiles for {len(result)} groups exported to {output_path}")
+    return result
+
+if __name__ == "__main__":
+    delay_quantiles(verify='--verify' in sys.argv)
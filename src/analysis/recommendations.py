@@ -0,0 +1,192 @@
+import pandas as pd
+import numpy as np
+import re
+import os
+import json
+import logging
+
+DEFAULT_RULES_PATH = 'config/recommendation_rules.json'
+
+# Rule groupings and the cube keys of their statistics tables
+GROUPS = {
+    'overall': [],
+    'route': ['route_no', 'route_name'],
+    'route_hour': ['route_no', 'route_name', 'hour']
+}
+ROLLUP_METRICS = ['count', 'mean', 'std', 'min', 'max', 'inefficiency']
+PEAK_METRICS = ['peak_mean', 'offpeak_mean', 'peak_pct_diff']
+# Delay quantiles are requested as p50, p95, p99.9, ...
+QUANTILE_METRIC = re.compile(r'^p(\d+(?:\.\d+)?)$')
+
+OPS = {
+    '>': np.greater, '>=': np.greater_equal,
+    '<': np.less, '<=': np.less_equal,
+    '==': np.equal, '!=': np.not_equal
+}
+RULE_FIELDS = ['name', 'group', 'metric', 'op', 'threshold', 'issue', 'action']
+
+
+def validate_rule(rule):
+    """
+    Raises ValueError when a rule is missing a field or uses an unknown group, metric or operator.
+    """
+    name = rule.get('name', '<unnamed>')
+    missing = [field for field in RULE_FIELDS if field not in rule]
+    if missing:
+        raise ValueError(f"Rule '{name}' is missing {missing}")
+    if rule['group'] not in GROUPS:
+        raise ValueError(f"Rule '{name}': unknown group '{rule['group']}' (expected one of {list(GROUPS)})")
+    if rule['op'] not in OPS:
+        raise ValueError(f"Rule '{name}': unknown operator '{rule['op']}' (expected one of {list(OPS)})")
+    for metric in [rule['metric'], rule.get('order_by')]:
+        if metric is not None and metric not in ROLLUP_METRICS + PEAK_METRICS and not QUANTILE_METRIC.match(metric):
+            raise ValueError(f"Rule '{name}': unknown metric '{metric}'")
+
+
+def load_rules(rules_path=DEFAULT_RULES_PATH):
+    """
+    Reads the recommendation rules from a JSON file ({"rules": [...]}).
+
+    Each rule names a `group` (overall, route or route_hour), a `metric` of that group's
+    statistics table, a comparison (`op`, `threshold`) and the `issue`/`action` text.
+    `issue` may use {value}, {threshold}, {route_no}, {route_name} and {hour}.
+    Optional `order_by`/`ascending` sort the rule's matches (table order otherwise).
+    """
+    if not os.path.exists(rules_path):
+        logging.error(f"Rules file {rules_path} not found.")
+        return None
+
+    with open(rules_path) as f:
+        rules = json.load(f)['rules']
+    for rule in rules:
+        validate_rule(rule)
+    logging.info(f"Loaded {len(rules)} recommendation rules from {rules_path}")
+    return rules
+
+
+def rule_stats(cube, group, metrics):
+    """
+    Statistics table of one rule group: a row per group cell (a single 'ALL' row for
+    overall) with the requested metrics as columns, all read from the cube.
+    """
+    keys = GROUPS[group]
+    stats = cube.rollup(keys)
+
+    if any(metric in PEAK_METRICS for metric in metrics):
+        means = cube.rollup(keys + ['peak_hour'])['mean']
+        if keys:
+            means = means.unstack('peak_hour').reindex(stats.index)
+        stats['peak_mean'] = means.get(True, np.nan)
+        stats['offpeak_mean'] = means.get(False, np.nan)
+        # No off-peak baseline means no measurable peak effect
+        with np.errstate(divide='ignore', invalid='ignore'):
+            stats['peak_pct_diff'] = np.where(stats['offpeak_mean'] > 0,
+                                              (stats['peak_mean'] - stats['offpeak_mean']) / stats['offpeak_mean'] * 100,
+                                              0.0)
+
+    for metric in metrics:
+        match = QUANTILE_METRIC.match(metric)
+        if match and metric not in stats:
+            q = float(match.group(1)) / 100
+            stats[metric] = cube.quantile(q, by=keys).reindex(stats.index) if keys else cube.quantile(q)
+    return stats
+
+
+def row_labels(stats, group):
+    """
+    'Route' column text of every row of a statistics table.
+    """
+    if group == 'overall':
+        return np.full(len(stats), 'ALL', dtype=object)
+    index = stats.index
+    labels = (pd.Series(index.get_level_values('route_no').astype(str))
+              + ' (' + pd.Series(index.get_level_values('route_name').astype(str)) + ')')
+    if group == 'route_hour':
+        hours = pd.Series(index.get_level_values('hour').astype(int))
+        labels = labels + ' at ' + hours.map('{:02d}:00'.format)
+    return labels.to_numpy(dtype=object)
+
+
+def evaluate_rules(rules, tables):
+    """
+    Applies every rule to the statistics table of its group and returns the matches as a
+    DataFrame (Route, Issue, Action), grouped by rule in file order.
+
+    The rules of a group are compared in one pass: their metric columns form an
+    (rows x rules) matrix that is tested against the threshold vector once per operator.
+    Matches are read off that boolean matrix with NumPy, so the cost grows with
+    rows x rules in C, not with Python iterations per route.
+    """
+    rule_ids, row_ids, values = [], [], []
+    for group in GROUPS:
+        ids = np.array([i for i, rule in enumerate(rules) if rule['group'] == group], dtype=int)
+        if not len(ids):
+            continue
+        stats, labels = tables[group]
+        metric_values = stats[[rules[i]['metric'] for i in ids]].to_numpy(dtype=float)
+        thresholds = np.array([rules[i]['threshold'] for i in ids], dtype=float)
+        ops = np.array([rules[i]['op'] for i in ids])
+        hits = np.zeros(metric_values.shape, dtype=bool)
+        for op in np.unique(ops):
+            cols = ops == op
+            hits[:, cols] = OPS[op](metric_values[:, cols], thresholds[cols])
+
+        # Rules that share an ordering share one row permutation
+        orderings = {}
+        for pos, i in enumerate(ids):
+            orderings.setdefault((rules[i].get('order_by'), rules[i].get('ascending', True)), []).append(pos)
+        for (order_by, ascending), positions in orderings.items():
+            positions = np.array(positions)
+            if order_by is None:
+                perm = np.arange(len(stats))
+            else:
+                order = stats[order_by].reset_index(drop=True).sort_values(ascending=ascending, kind='stable')
+                perm = order.index.to_numpy()
+            rule_pos, row_pos = np.nonzero(hits[perm][:, positions].T)
+            rows = perm[row_pos]
+            rule_ids.append(ids[positions[rule_pos]])
+            row_ids.append(rows)
+            values.append(metric_values[rows, positions[rule_pos]])
+
+    if not rule_ids:
+        return pd.DataFrame(columns=['Route', 'Issue', 'Action'])
+    rule_ids = np.concatenate(rule_ids)
+    order = np.argsort(rule_ids, kind='stable')
+    rule_ids, row_ids, values = rule_ids[order], np.concatenate(row_ids)[order], np.concatenate(values)[order]
+
+    routes = np.empty(len(rule_ids), dtype=object)
+    issues = np.array([rule['issue'] for rule in rules], dtype=object)[rule_ids]
+    for i, rule in enumerate(rules):
+        matched = np.flatnonzero(rule_ids == i)
+        stats, labels = tables[rule['group']]
+        routes[matched] = labels[row_ids[matched]]
+        if '{' not in rule['issue']:
+            continue
+        # Only templated issues are formatted row by row, and only for their matches
+        keys = GROUPS[rule['group']]
+        fields = [stats.index.get_level_values(key).to_numpy(dtype=object)[row_ids[matched]] for key in keys]
+        issues[matched] = [
+            rule['issue'].format(value=value, threshold=rule['threshold'], **dict(zip(keys, row_keys)))
+            for value, *row_keys in zip(values[matched], *fields)
+        ]
+    actions = np.array([rule['action'] for rule in rules], dtype=object)[rule_ids]
+    return pd.DataFrame({'Route': routes, 'Issue': issues, 'Action': actions})
+
+
+def generate_recommendations(cube, rules):
+    """
+    Recommendations of `rules` for the trips summarized by `cube`, as a DataFrame.
+    Only the groups and metrics that the rules use are computed.
+    """
+    tables = {}
+    for group in GROUPS:
+        group_rules = [rule for rule in rules if rule['group'] == group]
+        if not group_rules:
+            continue
+        metrics = {rule['metric'] for rule in group_rules} | {rule['order_by'] for rule in group_rules
+                                                               if rule.get('order_by')}
+        stats = rule_stats(cube, group, metrics)
+        tables[group] = (stats, row_labels(stats, group))
+    recommendations = evaluate_rules(rules, tables)
+    logging.info(f"{len(recommendations)} recommendations from {len(rules)} rules")
+    return recommendations
@@ -0,0 +1,214 @@
+import pandas as pd
+import numpy as np
+import heapq
+import os
+import logging
+from src.data_processing.load_data import load_cleaned_data
+from src.data_processing.partitioned import has_filters, filter_trips
+from src.analysis.aggregate_cube import DelayCube, CUBE_COLUMNS
+
+# Grain of the schedule plan
+PLAN_KEYS = ['route_no', 'route_name', 'hour']
+SCHEDULE_COLUMNS = PLAN_KEYS + ['scheduled_time_min']
+DEFAULT_TARGET_PERCENTILE = 0.9
+
+
+def expected_wait(cycle_min, buses, delay_std):
+    """
+    Expected passenger wait (minutes) at a stop served by `buses` buses on a round trip of
+    `cycle_min` minutes: E[W] = E[H] / 2 + Var(H) / (2 E[H]) with headway H = cycle / buses.
+    Delay variability is taken as the headway variance, so adding buses shortens the mean
+    headway but also the gap that bunching has to eat into.
+    """
+    headway = cycle_min / buses
+    return headway / 2 + delay_std ** 2 / (2 * headway)
+
+
+def check_target_percentile(target_percentile):
+    """
+    Raises ValueError unless `target_percentile` is a share in (0, 1] (0.9, not 90).
+    """
+    if not 0 < target_percentile <= 1:
+        raise ValueError(f"target_percentile must be a share in (0, 1] such as 0.9, got {target_percentile}")
+
+
+def schedule_buffers(cube, target_percentile=DEFAULT_TARGET_PERCENTILE):
+    """
+    Per route x hour delay statistics and the schedule buffer that makes a trip on time
+    (delay <= buffer) with probability `target_percentile`, from the cube's exact delay
+    histogram. Also returns the on-time share today (delay == 0) and with the buffer.
+    """
+    check_target_percentile(target_percentile)
+    stats = cube.rollup(PLAN_KEYS)
+    days = cube.cells['date'].nunique() if 'date' in cube.cells else 1
+    plan = pd.DataFrame({
+        'trips': stats['count'],
+        'trips_per_day': stats['count'] / max(days, 1),
+        'delay_mean': stats['mean'],
+        'delay_std': stats['std'].fillna(0.0),
+        'buffer_min': np.ceil(cube.quantile(target_percentile, by=PLAN_KEYS).reindex(stats.index))
+    })
+
+    # On-time shares: cumulative histogram counts up to 0 minutes and up to the buffer
+    hist = cube.hist.groupby(PLAN_KEYS + ['delay_min'], observed=True)['count'].sum().reset_index()
+    buffers = plan['buffer_min'].reindex(pd.MultiIndex.from_frame(hist[PLAN_KEYS])).to_numpy()
+    delays = hist['delay_min'].to_numpy()
+    hist['_now'] = np.where(delays <= 0, hist['count'], 0)
+    hist['_planned'] = np.where(delays <= buffers, hist['count'], 0)
+    on_time = hist.groupby(PLAN_KEYS, observed=True)[['_now', '_planned']].sum()
+    plan['on_time_now'] = (on_time['_now'] / plan['trips']).reindex(plan.index)
+    plan['on_time_planned'] = (on_time['_planned'] / plan['trips']).reindex(plan.index)
+    return plan
+
+
+def marginal_gain(cycle_min, buses, delay_std, weight):
+    """
+    Weighted wait reduction of adding one bus to a route-hour that has `buses`:
+    w * (E[W](b) - E[W](b + 1)) = w * (C / (2 b (b + 1)) - std^2 / (2 C)).
+    Decreasing in b, since the wait is convex in the number of buses.
+    """
+    return weight * (cycle_min / (2 * buses * (buses + 1)) - delay_std ** 2 / (2 * cycle_min))
+
+
+def _extra_buses(threshold, cycle, std, weight, cap):
+    """
+    Number of buses beyond the first whose marginal gain is above `threshold`, per route-hour:
+    the largest b with C / (2 b (b + 1)) > threshold / w + std^2 / (2 C), capped at `cap`.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        limit = np.where(weight > 0, cycle / (2 * (threshold / weight + std ** 2 / (2 * cycle))), 0.0)
+        limit = np.where(np.isfinite(limit) & (limit > 0), limit, np.where(weight > 0, np.inf, 0.0))
+        extra = np.ceil((np.sqrt(1 + 4 * np.minimum(limit, 4.0 * (cap + 1) ** 2)) - 1) / 2) - 1
+    return np.clip(extra, 0, cap).astype(np.int64)
+
+
+def allocate_fleet(plan, fleet_size):
+    """
+    Splits `fleet_size` buses across the routes of every service hour so as to minimize the
+    passenger-weighted expected wait (see expected_wait()). Every route-hour keeps at least
+    one bus; a bus that would increase the wait (more bunching than it saves) is not assigned.
+
+    The wait is convex in the number of buses, so giving each next bus to the route-hour
+    with the largest marginal gain is optimal. Instead of popping buses one at a time, each
+    hour bisects for the gain threshold at which the fleet runs out (the bus count above a
+    threshold has a closed form), then hands the few remaining buses out greedily from a heap.
+    Returns the bus counts as an array.
+    """
+    cycle = plan['cycle_min'].to_numpy(dtype=float)
+    std = plan['delay_std'].to_numpy(dtype=float)
+    weight = plan['passengers'].to_numpy(dtype=float)
+    buses = np.ones(len(plan), dtype=np.int64)
+
+    hours = plan.index.get_level_values('hour').to_numpy()
+    for hour in np.unique(hours):
+        cells = np.flatnonzero(hours == hour)
+        spare = fleet_size - len(cells)
+        if spare < 0:
+            logging.warning(f"Fleet of {fleet_size} buses cannot cover the {len(cells)} routes at {hour}:00; "
+                            "each keeps one bus")
+            continue
+        c, s, w = cycle[cells], std[cells], weight[cells]
+        extra = _extra_buses(0.0, c, s, w, spare)
+        if extra.sum() > spare:
+            # Smallest threshold whose allocation still fits the fleet
+            lo, hi = 0.0, max(float(marginal_gain(c, 1, s, w).max()), 0.0)
+            for _ in range(100):
+                mid = (lo + hi) / 2
+                if _extra_buses(mid, c, s, w, spare).sum() > spare:
+                    lo = mid
+                else:
+                    hi = mid
+                if hi - lo <= 1e-12 * max(hi, 1.0):
+                    break
+            extra = _extra_buses(hi, c, s, w, spare)
+        buses[cells] += extra
+
+        # Buses left over at the threshold go one by one to the largest gains
+        spare -= int(extra.sum())
+        heap = [(-marginal_gain(cycle[i], buses[i], std[i], weight[i]), i) for i in cells]
+        heapq.heapify(heap)
+        while spare > 0 and heap:
+            best, i = heapq.heappop(heap)
+            if best >= 0:
+                break
+            buses[i] += 1
+            spare -= 1
+            heapq.heappush(heap, (-marginal_gain(cycle[i], buses[i], std[i], weight[i]), i))
+    return buses
+
+
+def build_schedule_plan(cube, scheduled, target_percentile=DEFAULT_TARGET_PERCENTILE, fleet_size=None,
+                        passengers=None):
+    """
+    Schedule plan per route x hour: buffered trip time, bus allocation and headway.
+
+    `scheduled` holds the scheduled trip times (SCHEDULE_COLUMNS). `passengers` may map
+    (route_no, route_name, hour) to ridership; without it the trips run per day are used
+    as the demand weight. `fleet_size` defaults to the buses the current timetable needs
+    in its busiest hour (at least one per route); a given fleet is kept as is, and hours
+    with more routes than buses are logged by allocate_fleet().
+    """
+    plan = schedule_buffers(cube, target_percentile)
+    scheduled = scheduled.groupby(PLAN_KEYS, observed=True)['scheduled_time_min'].mean()
+    plan.insert(0, 'scheduled_time_min', scheduled.reindex(plan.index))
+    plan.insert(list(plan.columns).index('buffer_min') + 1, 'recommended_time_min',
+                plan['scheduled_time_min'] + plan['buffer_min'])
+    plan['passengers'] = plan['trips_per_day'] if passengers is None else passengers.reindex(plan.index).fillna(0.0)
+
+    # A bus does the route both ways per cycle, on the buffered running time
+    plan['cycle_min'] = 2 * plan['recommended_time_min']
+    current_buses = plan['trips_per_day'] * plan['cycle_min'] / 60
+    if fleet_size is None:
+        fleet_size = int(np.ceil(current_buses.groupby(level='hour').sum().max()))
+        fleet_size = max(fleet_size, int(plan.groupby(level='hour').size().max()))
+
+    plan['buses'] = allocate_fleet(plan, fleet_size)
+    plan['headway_min'] = plan['cycle_min'] / plan['buses']
+    plan['departures_per_hour'] = 60 / plan['headway_min']
+    plan['expected_wait_min'] = expected_wait(plan['cycle_min'], plan['buses'], plan['delay_std'])
+
+    wait_now = expected_wait(plan['cycle_min'], current_buses, plan['delay_std'])
+    total = plan['passengers'].sum()
+    if total > 0:
+        logging.info(f"Fleet of {fleet_size} buses: passenger-weighted expected wait "
+                     f"{(wait_now * plan['passengers']).sum() / total:.2f} -> "
+                     f"{(plan['expected_wait_min'] * plan['passengers']).sum() / total:.2f} min")
+    return plan
+
+
+def optimize_schedule(input_path='data/processed/cleaned_bus_delay.csv', output_dir='reports/tables', df=None,
+                      cube=None, target_percentile=DEFAULT_TARGET_PERCENTILE, fleet_size=None,
+                      start_date=None, end_date=None, routes=None):
+    """
+    Computes the schedule plan (buffers at `target_percentile` on-time, fleet allocation and
+    headways per route x hour) and writes it to `output_dir`/schedule_plan.csv.
+    Pass an already loaded cleaned DataFrame as `df` or a prebuilt DelayCube as `cube` to
+    skip reading `input_path`. `start_date`/`end_date` (inclusive) and `routes` restrict it
+    to a slice of the trips. Raises ValueError for a `target_percentile` outside (0, 1].
+    """
+    logging.info("Starting schedule optimization...")
+    check_target_percentile(target_percentile)
+
+    filters = {'start_date': start_date, 'end_date': end_date, 'routes': routes}
+    if has_filters(**filters):
+        # Aggregates of the full history cannot answer a slice
+        cube = None
+        df = filter_trips(df, **filters) if df is not None else None
+    if df is None:
+        columns = SCHEDULE_COLUMNS if cube is not None else sorted(set(CUBE_COLUMNS + SCHEDULE_COLUMNS))
+        df = load_cleaned_data(input_path, columns=columns, **filters)
+        if df is None:
+            return None
+    if cube is None:
+        cube = DelayCube.from_trips(df)
+
+    plan = build_schedule_plan(cube, df[SCHEDULE_COLUMNS], target_percentile, fleet_size)
+
+    os.makedirs(output_dir, exist_ok=True)
+    output_path = os.path.join(output_dir, 'schedule_plan.csv')
+    plan.round(4).to_csv(output_path)
+    logging.info(f"Schedule plan for {len(plan)} route-hours exported to {output_path}")
+    return plan
+
+if __name__ == "__main__":
+    optimize_schedule()
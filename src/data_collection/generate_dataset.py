@@ -1,103 +1,188 @@
 import pandas as pd
 import numpy as np
-import random
 from datetime import datetime, timedelta
 import os
 import logging
+from src.data_processing.schema import RAW_SCHEMA, apply_schema, take_categorical
 
-def generate_dataset(output_path='data/raw/bus_delay_dataset.csv', days=30):
+# Configuration - COIMBATORE ROUTES (Specific)
+DEFAULT_ROUTES = {
+    '33A': {'distance': 34.0, 'base_time': 75, 'route_name': 'Gandhipuram - Mettupalayam'},
+    '32': {'distance': 10.0, 'base_time': 30, 'route_name': 'Gandhipuram - Thudiyalur'},
+    '111': {'distance': 10.0, 'base_time': 30, 'route_name': 'Thudiyalur - Gandhipuram'},
+    '70': {'distance': 15.0, 'base_time': 45, 'route_name': 'Gandhipuram - Maruthamalai'},
+    '4A': {'distance': 18.0, 'base_time': 55, 'route_name': 'Thudiyalur - Podanur'},
+    '2A': {'distance': 16.0, 'base_time': 50, 'route_name': 'Perur - Polytechnic'}
+}
+
+DEFAULT_TRIP_HOURS = [7, 9, 12, 17, 19]
+PEAK_HOURS = [7, 9, 17, 19]
+
+
+def peak_flags(hours, is_weekend):
+    """
+    Peak-hour flag of trips: a peak hour on a weekday (weekends have no peak).
+    """
+    return np.isin(hours, PEAK_HOURS) & ~np.asarray(is_weekend, dtype=bool)
+
+
+def route_table(routes=None):
+    """
+    Normalizes a route configuration (dict in DEFAULT_ROUTES format or a DataFrame
+    with route_no, route_name, distance, base_time columns) into a DataFrame.
+    """
+    if routes is None:
+        routes = DEFAULT_ROUTES
+    if isinstance(routes, pd.DataFrame):
+        table = routes[['route_no', 'route_name', 'distance', 'base_time']].copy()
+    else:
+        table = pd.DataFrame([
+            {'route_no': route, 'route_name': info['route_name'],
+             'distance': info['distance'], 'base_time': info['base_time']}
+            for route, info in routes.items()
+        ])
+    table['route_no'] = table['route_no'].astype(str)
+    return table.reset_index(drop=True)
+
+
+def synthetic_routes(n_routes, seed=42):
     """
-    Generates a realistic 30-day dataset for 6 bus routes in Coimbatore.
+    Builds a synthetic route table of `n_routes` routes (for scale tests and benchmarks).
+    Distances are 5-40 km with roughly 3 minutes scheduled per km.
+    """
+    rng = np.random.default_rng(seed)
+    distance = np.round(rng.uniform(5.0, 40.0, n_routes), 1)
+    base_time = np.round(distance * rng.uniform(2.5, 3.5, n_routes)).astype(int)
+    route_no = [f"R{i + 1}" for i in range(n_routes)]
+    return pd.DataFrame({
+        'route_no': route_no,
+        'route_name': [f"Synthetic Route {r}" for r in route_no],
+        'distance': distance,
+        'base_time': base_time
+    })
+
+
+def simulate_trip_times(rng, scheduled_time, is_peak, is_weekend, traffic_scale=1.0):
+    """
+    Draws traffic multipliers and trip times for whole arrays of trips at once.
+    `traffic_scale` (scalar or per-trip array) scales the traffic multiplier, for what-if runs.
+    Returns (traffic_multiplier, actual_time, delay) as float arrays.
+    """
+    n = len(scheduled_time)
+
+    # Traffic Multiplier Calculation
+    # Base traffic: 1.0
+    # Peak hour add: 0.3 - 0.8
+    # Non-peak add: 0.0 - 0.2
+    # Weekend reduction: -0.1
+    uplift = rng.uniform(0.0, 1.0, n)
+    traffic_multiplier = 1.0 + np.where(is_peak, 0.3 + 0.5 * uplift, 0.2 * uplift)
+    traffic_multiplier = (traffic_multiplier - 0.1 * is_weekend) * traffic_scale
+
+    # Ensure multiplier is never below 0.8
+    traffic_multiplier = np.maximum(0.8, traffic_multiplier)
+
+    # Actual time influenced by traffic and random noise
+    # variance factor: different drivers, weather, signals etc.
+    random_variation = rng.normal(0, 5, n)  # standard deviation of 5 mins
+
+    actual_time = (scheduled_time * traffic_multiplier) + random_variation
+    actual_time = np.maximum(scheduled_time - 5, actual_time)  # Can't be impossibly fast, but can be slightly faster
+
+    delay = np.maximum(0, actual_time - scheduled_time)  # No negative delays for this specific field requirement
+    return traffic_multiplier, actual_time, delay
+
+
+def day_rng(seed, day):
+    """
+    Independent random stream for one simulated day, so output does not depend on chunking.
+    """
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(day,)))
+
+
+def generate_trip_block(routes, trip_hours, dates, first_day, seed, trips_per_hour=1):
+    """
+    Generates all trips for a block of consecutive days as a DataFrame.
+    Trip order is day -> route -> hour -> trip, matching the original generator.
+    """
+    n_days, n_routes, n_hours = len(dates), len(routes), len(trip_hours)
+    trips_per_day = n_routes * n_hours * trips_per_hour
+
+    route_idx = np.tile(np.repeat(np.arange(n_routes), n_hours * trips_per_hour), n_days)
+    hours = np.tile(np.repeat(np.asarray(trip_hours, dtype=np.int64), trips_per_hour), n_days * n_routes)
+    day_idx = np.repeat(np.arange(n_days), trips_per_day)
+
+    weekday = ((dates.astype('datetime64[D]').astype(np.int64) + 3) % 7)[day_idx]  # 1970-01-01 was a Thursday
+    is_weekend = weekday >= 5
+    is_peak = peak_flags(hours, is_weekend)
+
+    scheduled_time = routes['base_time'].to_numpy(dtype=float)[route_idx]
+
+    # Draw each day from its own stream
+    traffic_multiplier = np.empty(len(hours))
+    actual_time = np.empty(len(hours))
+    delay = np.empty(len(hours))
+    for i in range(n_days):
+        day = slice(i * trips_per_day, (i + 1) * trips_per_day)
+        traffic_multiplier[day], actual_time[day], delay[day] = simulate_trip_times(
+            day_rng(seed, first_day + i), scheduled_time[day], is_peak[day], is_weekend[day]
+        )
+
+    # Compact trip schema: categoricals built from codes, narrow numeric types
+    return apply_schema(pd.DataFrame({
+        'route_no': take_categorical(routes['route_no'], route_idx),
+        'route_name': take_categorical(routes['route_name'], route_idx),
+        'distance_km': routes['distance'].to_numpy(dtype=float)[route_idx],
+        'scheduled_time_min': scheduled_time.astype(np.int64),
+        'actual_time_min': actual_time.astype(np.int64),
+        'delay_min': delay.astype(np.int64),
+        'hour': hours,
+        'date': dates.astype('datetime64[ns]')[day_idx],
+        'day_of_week': pd.Categorical.from_codes(weekday, dtype=RAW_SCHEMA['day_of_week']),
+        'peak_hour': is_peak,
+        'traffic_multiplier': np.round(traffic_multiplier, 2)
+    }), RAW_SCHEMA)
+
+
+def generate_dataset(output_path='data/raw/bus_delay_dataset.csv', days=30, routes=None,
+                     trip_hours=None, trips_per_hour=1, start_date=None, seed=42,
+                     chunk_days=31, return_df=True):
+    """
+    Generates a realistic dataset for bus routes in Coimbatore (30 days, 6 routes by default).
     Routes: 33A, 32, 111, 70, 4A, 2A
+
+    Trips are generated in batches of `chunk_days` days with NumPy and appended to the CSV,
+    so memory stays bounded for long ranges and large route tables. The same seed always
+    yields the same dataset, whatever the chunk size.
     """
     logging.info(f"Starting dataset generation for {days} days...")
-    
-    # 2. Reproducibility
-    np.random.seed(42)
-    random.seed(42)
-
-    # Configuration
-    # Configuration - COIMBATORE ROUTES (Specific)
-    routes = {
-        '33A': {'distance': 34.0, 'base_time': 75, 'route_name': 'Gandhipuram - Mettupalayam'},
-        '32': {'distance': 10.0, 'base_time': 30, 'route_name': 'Gandhipuram - Thudiyalur'},
-        '111': {'distance': 10.0, 'base_time': 30, 'route_name': 'Thudiyalur - Gandhipuram'},
-        '70': {'distance': 15.0, 'base_time': 45, 'route_name': 'Gandhipuram - Maruthamalai'},
-        '4A': {'distance': 18.0, 'base_time': 55, 'route_name': 'Thudiyalur - Podanur'},
-        '2A': {'distance': 16.0, 'base_time': 50, 'route_name': 'Perur - Polytechnic'}
-    }
-    
-    trip_hours = [7, 9, 12, 17, 19]
-    start_date = datetime.now() - timedelta(days=days)
-    
-    data = []
-
-    for day in range(days):
-        current_date = start_date + timedelta(days=day)
-        date_str = current_date.strftime('%Y-%m-%d')
-        day_of_week = current_date.strftime('%A')
-        is_weekend = current_date.weekday() >= 5
-
-        for route, info in routes.items():
-            for hour in trip_hours:
-                # Determine Peak Hour
-                is_peak = hour in [7, 9, 17, 19] and not is_weekend
-                
-                # Traffic Multiplier Calculation
-                # Base traffic: 1.0
-                # Peak hour add: 0.3 - 0.8
-                # Non-peak add: 0.0 - 0.2
-                # Weekend reduction: -0.1
-                
-                traffic_multiplier = 1.0
-                if is_peak:
-                    traffic_multiplier += np.random.uniform(0.3, 0.8)
-                else:
-                    traffic_multiplier += np.random.uniform(0.0, 0.2)
-                
-                if is_weekend:
-                    traffic_multiplier -= 0.1
-                
-                # Ensure multiplier is never below 0.8
-                traffic_multiplier = max(0.8, traffic_multiplier)
-
-                # Calculate Times
-                scheduled_time = info['base_time']
-                
-                # Actual time influenced by traffic and random noise
-                # variance factor: different drivers, weather, signals etc.
-                random_variation = np.random.normal(0, 5) # standard deviation of 5 mins
-                
-                actual_time = (scheduled_time * traffic_multiplier) + random_variation
-                actual_time = max(scheduled_time - 5, actual_time) # Can't be impossibly fast, but can be slightly faster
-                
-                delay = actual_time - scheduled_time
-                delay = max(0, delay) # No negative delays for this specific field requirement
-
-                trip_record = {
-                    'route_no': route,
-                    'route_name': info['route_name'],
-                    'distance_km': info['distance'],
-                    'scheduled_time_min': int(scheduled_time),
-                    'actual_time_min': int(actual_time),
-                    'delay_min': int(delay),
-                    'hour': hour,
-                    'date': date_str,
-                    'day_of_week': day_of_week,
-                    'peak_hour': is_peak,
-                    'traffic_multiplier': round(traffic_multiplier, 2)
-                }
-                data.append(trip_record)
-
-    # Create DataFrame
-    df = pd.DataFrame(data)
-    
-    # Save to CSV
+
+    routes = route_table(routes)
+    trip_hours = DEFAULT_TRIP_HOURS if trip_hours is None else list(trip_hours)
+    if start_date is None:
+        start_date = datetime.now() - timedelta(days=days)
+    start = np.datetime64(pd.Timestamp(start_date).date(), 'D')
+
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    df.to_csv(output_path, index=False)
+
+    chunks = []
+    total_records = 0
+    for first_day in range(0, days, chunk_days):
+        last_day = min(first_day + chunk_days, days)
+        dates = start + np.arange(first_day, last_day)
+        block = generate_trip_block(routes, trip_hours, dates, first_day, seed, trips_per_hour)
+
+        # Save to CSV (append after the first chunk)
+        block.to_csv(output_path, index=False, mode='w' if first_day == 0 else 'a', header=first_day == 0)
+        total_records += len(block)
+        if return_df:
+            chunks.append(block)
+
     logging.info(f"Dataset generated successfully at: {output_path}")
-    logging.info(f"Total records: {len(df)}")
-    return df
+    logging.info(f"Total records: {total_records}")
+    if return_df:
+        return pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame()
+    return None
 
 if __name__ == "__main__":
     generate_dataset()
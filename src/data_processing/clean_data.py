@@ -2,47 +2,135 @@ import pandas as pd
 import numpy as np
 import os
 import logging
+from src.data_processing.load_data import ColumnarCacheWriter
+from src.data_processing.trip_store import TripStoreWriter
+from src.data_processing.partitioned import PartitionedDatasetWriter
+from src.data_processing.schema import RAW_SCHEMA, CLEANED_SCHEMA, DELAY_CATEGORIES, apply_schema, lenient_dtypes, parse_dates
 
-def clean_data(input_path='data/raw/bus_delay_dataset.csv', output_path='data/processed/cleaned_bus_delay.csv'):
+# Fields a trip cannot be cleaned without (numbers, flags and the date)
+REQUIRED_COLUMNS = ['scheduled_time_min', 'actual_time_min', 'delay_min', 'hour', 'date', 'peak_hour']
+MINUTE_COLUMNS = ['scheduled_time_min', 'actual_time_min', 'delay_min']
+
+def categorize_delays(delay):
     """
-    Cleans raw bus delay data and adds calculated fields.
+    Vectorized delay categories: Low (<= 5 min), Moderate (<= 15 min), High otherwise.
     """
-    logging.info("Starting data cleaning process...")
-    
-    if not os.path.exists(input_path):
-        logging.error(f"Input file {input_path} not found.")
-        return None
-
-    df = pd.read_csv(input_path)
+    delay = np.asarray(delay)
+    codes = np.select([delay <= 5, delay <= 15], [0, 1], default=2)
+    return pd.Categorical.from_codes(codes, categories=DELAY_CATEGORIES)
 
-    # 1. Convert Date to Datetime
-    df['date'] = pd.to_datetime(df['date'])
+def transform_chunk(df):
+    """
+    Applies the cleaning rules and calculated fields to one block of raw trips.
+    Works row-by-row independently, so chunks can be cleaned separately.
+    Trips with a missing required field, an unparsable date or a fractional hour are
+    dropped; times are rounded to whole minutes.
+    """
+    # 1. Convert Date to Datetime (unparsable dates become NaT and are dropped below)
+    df['date'] = pd.to_datetime(df['date'], errors='coerce')
 
-    # 2. Remove Negative Delays (Already handled in generation, but good practice)
-    df = df[df['delay_min'] >= 0]
+    # 2. Remove incomplete trips and Negative Delays (Already handled in generation, but good practice)
+    valid = df[REQUIRED_COLUMNS].notna().all(axis=1) & (df['hour'] % 1 == 0) & (df['delay_min'].round() >= 0)
+    df = df[valid].copy()
+    df[MINUTE_COLUMNS] = df[MINUTE_COLUMNS].round()
 
     # 3. Calculate Inefficiency Score
     # Formula: (Actual / Scheduled) - 1
     df['inefficiency_score'] = (df['actual_time_min'] / df['scheduled_time_min']) - 1
-    
+
     # 4. Create Delay Categories
-    def category_delay(delay):
-        if delay <= 5:
-            return 'Low'
-        elif delay <= 15:
-            return 'Moderate'
-        else:
-            return 'High'
+    df['delay_category'] = categorize_delays(df['delay_min'])
+    return apply_schema(df, CLEANED_SCHEMA)
+
+def read_raw_trips(input_path, chunksize=None):
+    """
+    Reads the raw trip CSV (an iterator of chunks with `chunksize`). Numbers and flags are
+    read with lenient types, so dirty rows reach transform_chunk, which drops them and
+    casts the rest to the compact trip schema.
+    """
+    return pd.read_csv(input_path, dtype=lenient_dtypes(RAW_SCHEMA), parse_dates=parse_dates(RAW_SCHEMA),
+                       chunksize=chunksize)
+
+def side_writers(output_path, partition_by=None):
+    """
+    Writers of the derived copies of the cleaned CSV (Parquet cache, trip store and,
+    with `partition_by`, the hive-partitioned dataset).
+    """
+    writers = [ColumnarCacheWriter(output_path), TripStoreWriter(output_path)]
+    if partition_by:
+        writers.append(PartitionedDatasetWriter(output_path, partition_by))
+    return writers
+
+def clean_data(input_path='data/raw/bus_delay_dataset.csv', output_path='data/processed/cleaned_bus_delay.csv',
+               chunksize=None, partition_by=None, counts=None):
+    """
+    Cleans raw bus delay data and adds calculated fields.
+    Writes the cleaned CSV plus a Parquet cache and a memory-mappable binary trip
+    store of it for downstream readers.
 
-    df['delay_category'] = df['delay_min'].apply(category_delay)
+    With `chunksize` set, the raw file is streamed `chunksize` rows at a time and
+    each cleaned chunk is appended to the outputs, so peak memory does not grow with
+    the input size. The output is identical to the in-memory path; the function then
+    returns the number of cleaned records instead of the cleaned DataFrame.
+
+    With `partition_by` (e.g. ('date', 'route_no')), a hive-partitioned Parquet copy is
+    written as well, which lets date/route-filtered loads skip other partitions.
+
+    Pass a dict as `counts` to receive the number of raw records read ('rows_in') and of
+    cleaned records written ('rows_out'), counted while cleaning.
+    """
+    logging.info("Starting data cleaning process...")
+    counts = {} if counts is None else counts
+
+    if not os.path.exists(input_path):
+        logging.error(f"Input file {input_path} not found.")
+        return None
 
-    # Save Cleaned Data
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
+
+    if chunksize is not None:
+        return _clean_streaming(input_path, output_path, chunksize, partition_by, counts)
+
+    raw = read_raw_trips(input_path)
+    counts['rows_in'] = len(raw)
+    df = transform_chunk(raw)
+    counts['rows_out'] = len(df)
+
+    # Save Cleaned Data, plus columnar / binary / partitioned copies for fast downstream reads
     df.to_csv(output_path, index=False)
-    
+    for writer in side_writers(output_path, partition_by):
+        writer.write(df)
+        writer.close()
+
     logging.info(f"Data cleaned and saved to {output_path}")
     logging.info(f"Cleaned records: {len(df)}")
     return df
 
+def _clean_streaming(input_path, output_path, chunksize, partition_by=None, counts=None):
+    """
+    Chunked variant of clean_data: bounded memory, appends each cleaned chunk to the outputs.
+    Returns the number of cleaned records.
+    """
+    counts = {} if counts is None else counts
+    logging.info(f"Streaming mode: processing {chunksize} rows per chunk")
+
+    writers = side_writers(output_path, partition_by)
+    raw_records = total_records = 0
+    with open(output_path, 'w', newline='') as out:
+        for i, chunk in enumerate(read_raw_trips(input_path, chunksize=chunksize)):
+            raw_records += len(chunk)
+            chunk = transform_chunk(chunk)
+            chunk.to_csv(out, index=False, header=(i == 0))
+            for writer in writers:
+                writer.write(chunk)
+            total_records += len(chunk)
+    for writer in writers:
+        writer.close()
+    counts.update(rows_in=raw_records, rows_out=total_records)
+
+    logging.info(f"Data cleaned and saved to {output_path}")
+    logging.info(f"Cleaned records: {total_records}")
+    return total_records
+
 if __name__ == "__main__":
     clean_data()
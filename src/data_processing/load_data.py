@@ -0,0 +1,155 @@
+import pandas as pd
+import json
+import os
+import logging
+from src.data_processing.schema import CLEANED_SCHEMA, apply_schema, csv_dtypes, parse_dates
+from src.data_processing import schema
+from src.data_processing.trip_store import open_trip_store
+from src.data_processing.partitioned import has_filters, filter_trips, read_partitioned
+
+# Columns of the cleaned trip table, in file order (types: see schema.CLEANED_SCHEMA)
+CLEANED_COLUMNS = list(CLEANED_SCHEMA)
+
+FINGERPRINT_KEY = b'source_fingerprint'
+
+
+def columnar_cache_path(csv_path):
+    """
+    Location of the Parquet cache that shadows a cleaned CSV file.
+    """
+    return os.path.splitext(csv_path)[0] + '.parquet'
+
+
+def source_fingerprint(csv_path):
+    """
+    Cheap identity of the source CSV (size + modification time).
+    The cache is considered stale as soon as either changes.
+    """
+    stat = os.stat(csv_path)
+    return json.dumps({'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns})
+
+
+def arrow_schema():
+    """
+    Builds the pyarrow schema of the cleaned trip table.
+    """
+    return schema.arrow_schema(CLEANED_SCHEMA)
+
+
+class ColumnarCacheWriter:
+    """
+    Incrementally writes the Parquet cache that shadows `csv_path`, one DataFrame chunk at a time.
+    The CSV fingerprint is stamped on close(), so close it only after the CSV is complete.
+    Writes nothing when pyarrow is not installed.
+    """
+
+    def __init__(self, csv_path):
+        self.csv_path = csv_path
+        self.cache_path = columnar_cache_path(csv_path)
+        self._writer = None
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            logging.warning("pyarrow not installed; skipping columnar cache.")
+            return
+        self._writer = pq.ParquetWriter(self.cache_path, arrow_schema())
+
+    def write(self, df):
+        if self._writer is None:
+            return
+        import pyarrow as pa
+        table = pa.Table.from_pandas(df[CLEANED_COLUMNS], schema=arrow_schema(), preserve_index=False)
+        self._writer.write_table(table)
+
+    def close(self):
+        if self._writer is None:
+            return None
+        self._writer.add_key_value_metadata({FINGERPRINT_KEY: source_fingerprint(self.csv_path).encode()})
+        self._writer.close()
+        self._writer = None
+        logging.info(f"Columnar cache written to {self.cache_path}")
+        return self.cache_path
+
+
+def write_columnar_cache(df, csv_path):
+    """
+    Writes `df` as a Parquet file next to `csv_path`, tagged with the CSV's fingerprint.
+    Skipped (returns None) when pyarrow is not installed.
+    """
+    writer = ColumnarCacheWriter(csv_path)
+    writer.write(df)
+    return writer.close()
+
+
+def _read_valid_cache(csv_path, columns):
+    """
+    Reads the Parquet cache if it exists and matches the current CSV, else returns None.
+    """
+    cache_path = columnar_cache_path(csv_path)
+    if not os.path.exists(cache_path):
+        return None
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        return None
+
+    # Key-value metadata of the file footer (where ColumnarCacheWriter stamps the fingerprint)
+    metadata = pq.ParquetFile(cache_path).metadata.metadata or {}
+    if metadata.get(FINGERPRINT_KEY, b'').decode() != source_fingerprint(csv_path):
+        logging.info(f"Columnar cache {cache_path} is stale; falling back to CSV.")
+        return None
+
+    return apply_schema(pq.read_table(cache_path, columns=columns).to_pandas(date_as_object=False))
+
+
+def _load_all(input_path, columns):
+    """
+    Full load of the cleaned table: trip store, then Parquet cache, then the CSV itself.
+    """
+    store = open_trip_store(input_path)
+    if store is not None:
+        return store.frame(columns=columns)
+
+    df = _read_valid_cache(input_path, columns)
+    if df is not None:
+        return df
+
+    df = apply_schema(pd.read_csv(input_path, dtype=csv_dtypes(), parse_dates=parse_dates()))
+    if list(df.columns) == CLEANED_COLUMNS:
+        write_columnar_cache(df, input_path)
+    return df[columns] if columns is not None else df
+
+
+def load_cleaned_data(input_path='data/processed/cleaned_bus_delay.csv', columns=None,
+                      start_date=None, end_date=None, routes=None):
+    """
+    Loads the cleaned trip dataset written by clean_data.
+    Prefers the memory-mapped trip store, then the Parquet cache, when they are up to date
+    with the CSV, and rebuilds the Parquet cache otherwise.
+    `columns` restricts the load to the listed columns. Columns come back with the
+    compact types of schema.CLEANED_SCHEMA (categoricals, narrow ints, float32).
+
+    `start_date`/`end_date` (inclusive) and `routes` restrict the load to a slice. It is
+    read from the partitioned dataset when clean_data wrote one, so partitions outside
+    the slice are never opened; otherwise the full table is loaded and filtered.
+    Returns None if the file does not exist or no trip matches the filters.
+    """
+    if not os.path.exists(input_path):
+        logging.error(f"Input file {input_path} not found.")
+        return None
+
+    columns = list(columns) if columns is not None else None
+    if not has_filters(start_date, end_date, routes):
+        return _load_all(input_path, columns)
+
+    df = read_partitioned(input_path, columns, start_date, end_date, routes)
+    if df is None:
+        logging.info("No partitioned dataset available; filtering the full trip table.")
+        needed = None if columns is None else list(dict.fromkeys(columns + ['date', 'route_no']))
+        df = filter_trips(_load_all(input_path, needed), start_date, end_date, routes)
+        df = (df[columns] if columns is not None else df).reset_index(drop=True)
+    if df.empty:
+        logging.error(f"No trips in {input_path} match the filters "
+                      f"(start_date={start_date}, end_date={end_date}, routes={routes}).")
+        return None
+    return df
@@ -0,0 +1,139 @@
+import pandas as pd
+import json
+import os
+import shutil
+import logging
+from src.data_processing.schema import CLEANED_SCHEMA, apply_schema
+
+DEFAULT_PARTITION_BY = ('date', 'route_no')
+MARKER_FILE = '_source.json'
+
+
+def partitioned_dataset_path(csv_path):
+    """
+    Directory of the hive-partitioned copy of a cleaned CSV file.
+    """
+    return os.path.splitext(csv_path)[0] + '.partitioned'
+
+
+def has_filters(start_date=None, end_date=None, routes=None):
+    return start_date is not None or end_date is not None or bool(routes)
+
+
+def filter_trips(df, start_date=None, end_date=None, routes=None):
+    """
+    Rows of a loaded trip DataFrame inside the date range (inclusive) and route list.
+    """
+    mask = pd.Series(True, index=df.index)
+    if start_date is not None:
+        mask &= df['date'] >= pd.Timestamp(start_date)
+    if end_date is not None:
+        mask &= df['date'] <= pd.Timestamp(end_date)
+    if routes:
+        mask &= df['route_no'].astype(str).isin([str(r) for r in routes])
+    return df[mask]
+
+
+class PartitionedDatasetWriter:
+    """
+    Writes cleaned trip chunks as a hive-partitioned Parquet dataset next to `csv_path`:
+    <name>.partitioned/date=YYYY-MM-DD/route_no=<route>/part-<chunk>-<n>.parquet.
+
+    The directory is replaced on open. The CSV fingerprint is stamped into a marker
+    file on close(), so readers ignore the dataset until the CSV is complete.
+    Writes nothing when pyarrow is not installed.
+    """
+
+    def __init__(self, csv_path, partition_by=DEFAULT_PARTITION_BY):
+        self.csv_path = csv_path
+        self.dataset_path = partitioned_dataset_path(csv_path)
+        self.partition_by = list(partition_by)
+        self._chunks = 0
+        self._enabled = True
+        try:
+            import pyarrow.dataset  # noqa: F401
+        except ImportError:
+            logging.warning("pyarrow not installed; skipping partitioned dataset.")
+            self._enabled = False
+            return
+        if os.path.exists(self.dataset_path):
+            shutil.rmtree(self.dataset_path)
+        os.makedirs(self.dataset_path)
+
+    def write(self, df):
+        if not self._enabled or df.empty:
+            return
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+
+        # Partition values are plain strings in the directory names
+        df = df.assign(date=df['date'].dt.strftime('%Y-%m-%d'), route_no=df['route_no'].astype(str))
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        n_partitions = len(df[self.partition_by].drop_duplicates())
+        ds.write_dataset(
+            table, self.dataset_path, format='parquet',
+            partitioning=ds.partitioning(pa.schema([(c, pa.string()) for c in self.partition_by]), flavor='hive'),
+            basename_template=f"part-{self._chunks}-{{i}}.parquet",
+            existing_data_behavior='overwrite_or_ignore',
+            max_partitions=n_partitions + 1
+        )
+        self._chunks += 1
+
+    def close(self):
+        if not self._enabled:
+            return None
+        from src.data_processing.load_data import source_fingerprint
+        with open(os.path.join(self.dataset_path, MARKER_FILE), 'w') as f:
+            json.dump({'partition_by': self.partition_by, 'source_fingerprint': source_fingerprint(self.csv_path)}, f)
+        logging.info(f"Partitioned dataset written to {self.dataset_path}")
+        return self.dataset_path
+
+
+def read_partitioned(csv_path, columns=None, start_date=None, end_date=None, routes=None):
+    """
+    Reads the trips of the date range (inclusive) and routes from the partitioned copy of
+    `csv_path`. Partitions outside the filters are pruned by directory name, so no file
+    outside the slice is opened. Returns None if the dataset is missing or stale.
+    """
+    from src.data_processing.load_data import source_fingerprint
+    dataset_path = partitioned_dataset_path(csv_path)
+    marker_path = os.path.join(dataset_path, MARKER_FILE)
+    if not os.path.exists(marker_path) or not os.path.exists(csv_path):
+        return None
+    try:
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+    except ImportError:
+        return None
+
+    with open(marker_path) as f:
+        marker = json.load(f)
+    if marker['source_fingerprint'] != source_fingerprint(csv_path):
+        logging.info(f"Partitioned dataset {dataset_path} is stale; ignoring it.")
+        return None
+
+    partition_by = marker['partition_by']
+    partitioning = ds.partitioning(pa.schema([(c, pa.string()) for c in partition_by]), flavor='hive')
+    dataset = ds.dataset(dataset_path, format='parquet', partitioning=partitioning,
+                         exclude_invalid_files=False, ignore_prefixes=['_', '.'])
+
+    expression = None
+    conditions = []
+    # Dates are compared as ISO strings, which sort like the dates themselves
+    if start_date is not None:
+        conditions.append(ds.field('date') >= pd.Timestamp(start_date).strftime('%Y-%m-%d'))
+    if end_date is not None:
+        conditions.append(ds.field('date') <= pd.Timestamp(end_date).strftime('%Y-%m-%d'))
+    if routes:
+        conditions.append(ds.field('route_no').isin([str(r) for r in routes]))
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        # Listing the fragments costs a pass over every partition, so it is only counted when debugging
+        fragments = len(list(dataset.get_fragments(filter=expression)))
+        logging.debug(f"Reading {fragments} of {len(dataset.files)} partition files from {dataset_path}")
+
+    columns = list(columns) if columns is not None else list(CLEANED_SCHEMA)
+    table = dataset.to_table(columns=columns, filter=expression)
+    return apply_schema(table.to_pandas(date_as_object=False), CLEANED_SCHEMA)
@@ -0,0 +1,168 @@
+import pandas as pd
+import numpy as np
+import os
+import logging
+
+DAY_OF_WEEK = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+DELAY_CATEGORIES = ['Low', 'Moderate', 'High']
+
+# In-memory types of the raw trip table written by generate_dataset.
+# 'category' columns get their categories from the data (sorted, so groupby order is
+# the same as with plain strings); day_of_week uses calendar order.
+# Minute columns are int32: read_csv wraps out-of-range values of a narrower type
+# silently, and a wrapped delay turns negative and gets the trip dropped.
+RAW_SCHEMA = {
+    'route_no': 'category',
+    'route_name': 'category',
+    'distance_km': 'float32',
+    'scheduled_time_min': 'int32',
+    'actual_time_min': 'int32',
+    'delay_min': 'int32',
+    'hour': 'int8',
+    'date': 'datetime64[ns]',
+    'day_of_week': pd.CategoricalDtype(DAY_OF_WEEK),
+    'peak_hour': 'bool',
+    'traffic_multiplier': 'float32'
+}
+
+# Cleaned trip table: raw columns plus the fields added by clean_data.
+# inefficiency_score stays float64, it is the metric every ranking is built on.
+CLEANED_SCHEMA = {
+    **RAW_SCHEMA,
+    'inefficiency_score': 'float64',
+    'delay_category': pd.CategoricalDtype(DELAY_CATEGORIES)
+}
+
+_ARROW_TYPES = {
+    'float32': 'float32', 'float64': 'float64', 'int8': 'int8', 'int16': 'int16',
+    'int32': 'int32', 'int64': 'int64', 'bool': 'bool_', 'datetime64[ns]': 'date32'
+}
+
+
+def csv_dtypes(schema=CLEANED_SCHEMA, columns=None):
+    """
+    `dtype` argument for pd.read_csv (dates are parsed separately, see parse_dates()).
+    """
+    return {name: dtype for name, dtype in schema.items()
+            if str(dtype) != 'datetime64[ns]' and (columns is None or name in columns)}
+
+
+def lenient_dtypes(schema=RAW_SCHEMA, columns=None):
+    """
+    `dtype` argument for reading untrusted input with pd.read_csv: integer columns are read
+    as float64 and bool columns as nullable booleans, so a missing or fractional value
+    loads (for the cleaning rules to drop or fix) instead of failing the whole read.
+    """
+    dtypes = csv_dtypes(schema, columns)
+    for name, dtype in dtypes.items():
+        if str(dtype).startswith('int'):
+            dtypes[name] = 'float64'
+        elif str(dtype) == 'bool':
+            dtypes[name] = 'boolean'
+    return dtypes
+
+
+def parse_dates(schema=CLEANED_SCHEMA, columns=None):
+    """
+    `parse_dates` argument for pd.read_csv.
+    """
+    return [name for name, dtype in schema.items()
+            if dtype == 'datetime64[ns]' and (columns is None or name in columns)]
+
+
+def apply_schema(df, schema=CLEANED_SCHEMA):
+    """
+    Casts the columns of `df` that appear in `schema` to their compact types (in place).
+    Returns `df`. Columns already of the right type are left alone.
+    """
+    for name, dtype in schema.items():
+        if name not in df.columns:
+            continue
+        column = df[name]
+        if isinstance(dtype, pd.CategoricalDtype):
+            # CategoricalDtype equality (and so astype) ignores category order: re-map explicitly
+            if not isinstance(column.dtype, pd.CategoricalDtype):
+                df[name] = column.astype(dtype)
+            elif not column.cat.categories.equals(dtype.categories):
+                df[name] = column.cat.set_categories(dtype.categories)
+        elif dtype == 'category':
+            if not isinstance(column.dtype, pd.CategoricalDtype):
+                df[name] = column.astype('category')
+            elif not column.cat.categories.is_monotonic_increasing:
+                # e.g. dictionaries read back from Parquet, which keep first-seen order
+                df[name] = column.cat.set_categories(column.cat.categories.sort_values())
+        elif dtype == 'datetime64[ns]':
+            if column.dtype != dtype:
+                df[name] = pd.to_datetime(column).astype(dtype)
+        elif column.dtype != dtype:
+            df[name] = column.astype(dtype)
+    return df
+
+
+def take_categorical(lookup, indices):
+    """
+    Categorical of `lookup[indices]` with sorted categories, built from codes so the
+    (possibly long) result is never materialized as strings.
+    """
+    categories, codes = np.unique(np.asarray(lookup), return_inverse=True)
+    return pd.Categorical.from_codes(codes[indices], categories=categories)
+
+
+def arrow_schema(schema=CLEANED_SCHEMA):
+    """
+    pyarrow schema matching `schema`: categoricals become dictionary-encoded strings
+    and dates are stored as date32.
+    """
+    import pyarrow as pa
+    fields = []
+    for name, dtype in schema.items():
+        if isinstance(dtype, pd.CategoricalDtype) or dtype == 'category':
+            fields.append((name, pa.dictionary(pa.int32(), pa.string())))
+        else:
+            fields.append((name, getattr(pa, _ARROW_TYPES[str(dtype)])()))
+    return pa.schema(fields)
+
+
+def memory_report(before, after):
+    """
+    Per-column deep memory usage of two versions of the same table, in bytes,
+    with a total row and bytes per trip.
+    """
+    report = pd.DataFrame({
+        'dtype_before': before.dtypes.astype(str),
+        'bytes_before': before.memory_usage(deep=True, index=False),
+        'dtype_after': after.dtypes.reindex(before.columns).astype(str),
+        'bytes_after': after.memory_usage(deep=True, index=False).reindex(before.columns)
+    })
+    report.loc['TOTAL'] = ['', report['bytes_before'].sum(), '', report['bytes_after'].sum()]
+    rows = max(len(before), 1)
+    report['bytes_per_trip_before'] = (report['bytes_before'] / rows).round(2)
+    report['bytes_per_trip_after'] = (report['bytes_after'] / rows).round(2)
+    report['reduction'] = (report['bytes_before'] / report['bytes_after']).round(1)
+    return report
+
+
+def schema_memory_report(input_path='data/processed/cleaned_bus_delay.csv',
+                         output_path='reports/tables/memory_report.csv'):
+    """
+    Loads a trip CSV twice, with pandas' default type inference and with the trip
+    schema, and writes the memory comparison to `output_path`.
+    """
+    if not os.path.exists(input_path):
+        logging.error(f"Input file {input_path} not found.")
+        return None
+
+    before = pd.read_csv(input_path)
+    after = apply_schema(pd.read_csv(input_path, dtype=csv_dtypes(), parse_dates=parse_dates(columns=before.columns)))
+    report = memory_report(before, after)
+
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    report.to_csv(output_path, index_label='column')
+    total = report.loc['TOTAL']
+    logging.info(f"Trip memory: {total['bytes_per_trip_before']} -> {total['bytes_per_trip_after']} bytes/trip "
+                 f"({total['reduction']}x smaller). Report saved to {output_path}")
+    return report
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print(schema_memory_report())
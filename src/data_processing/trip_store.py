@@ -0,0 +1,171 @@
+import pandas as pd
+import numpy as np
+import json
+import os
+import logging
+from src.data_processing.schema import CLEANED_SCHEMA, apply_schema
+
+STORE_FORMAT_VERSION = 2
+
+# Fixed-width record of one cleaned trip. String columns are stored as codes into
+# per-store dictionaries; the date is days since 1970-01-01.
+RECORD_DTYPE = np.dtype([
+    ('route_no', '<u2'),
+    ('route_name', '<u2'),
+    ('distance_km', '<f4'),
+    ('scheduled_time_min', '<i4'),
+    ('actual_time_min', '<i4'),
+    ('delay_min', '<i4'),
+    ('hour', 'i1'),
+    ('date', '<i4'),
+    ('day_of_week', 'u1'),
+    ('peak_hour', '?'),
+    ('traffic_multiplier', '<f4'),
+    ('inefficiency_score', '<f8'),
+    ('delay_category', 'u1')
+])
+ENCODED_COLUMNS = ['route_no', 'route_name', 'day_of_week', 'delay_category']
+
+
+def trip_store_paths(csv_path):
+    """
+    (records file, metadata file) of the binary store that shadows a cleaned CSV file.
+    """
+    base = os.path.splitext(csv_path)[0]
+    return base + '.trips.bin', base + '.trips.json'
+
+
+class TripStoreWriter:
+    """
+    Appends cleaned trip chunks to the binary trip store of `csv_path`.
+
+    Records are written as raw fixed-width rows; the metadata (row count, dictionaries
+    and the CSV fingerprint) is written on close(), so close it only after the CSV is
+    complete. Until then readers treat the store as missing.
+    """
+
+    def __init__(self, csv_path):
+        self.csv_path = csv_path
+        self.records_path, self.meta_path = trip_store_paths(csv_path)
+        self._dictionaries = {name: [] for name in ENCODED_COLUMNS}
+        self._lookup = {name: {} for name in ENCODED_COLUMNS}
+        self._rows = 0
+        if os.path.exists(self.meta_path):
+            os.remove(self.meta_path)
+        self._file = open(self.records_path, 'wb')
+
+    def _encode(self, name, column):
+        """
+        Codes of `column` in the store-wide dictionary of `name` (new values are appended).
+        """
+        if not isinstance(column.dtype, pd.CategoricalDtype):
+            column = column.astype('category')
+        lookup = self._lookup[name]
+        for value in column.cat.categories:
+            if value not in lookup:
+                lookup[value] = len(self._dictionaries[name])
+                self._dictionaries[name].append(value)
+        if len(lookup) > np.iinfo(RECORD_DTYPE[name]).max + 1:
+            raise ValueError(f"Too many distinct values in '{name}' for the trip store ({len(lookup)})")
+        mapping = np.array([lookup[value] for value in column.cat.categories], dtype=np.int64)
+        codes = column.cat.codes.to_numpy()
+        if (codes < 0).any():
+            raise ValueError(f"Column '{name}' has missing values; the trip store cannot encode them")
+        return mapping[codes]
+
+    def write(self, df):
+        records = np.empty(len(df), dtype=RECORD_DTYPE)
+        for name in RECORD_DTYPE.names:
+            if name in ENCODED_COLUMNS:
+                records[name] = self._encode(name, df[name])
+            elif name == 'date':
+                records[name] = df[name].to_numpy().astype('datetime64[D]').astype(np.int64)
+            else:
+                records[name] = df[name].to_numpy()
+        records.tofile(self._file)
+        self._rows += len(records)
+
+    def close(self):
+        from src.data_processing.load_data import source_fingerprint
+        self._file.close()
+        meta = {
+            'version': STORE_FORMAT_VERSION,
+            'rows': self._rows,
+            'dtype': RECORD_DTYPE.descr,
+            'dictionaries': self._dictionaries,
+            'source_fingerprint': source_fingerprint(self.csv_path)
+        }
+        tmp_path = self.meta_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self.meta_path)
+        logging.info(f"Trip store written to {self.records_path} ({self._rows} trips)")
+        return self.records_path
+
+
+class TripStore:
+    """
+    Read-only, memory-mapped view of a binary trip store.
+
+    Opening maps the file without reading it, so it costs the same at any size, and
+    every process that opens the same store shares one copy in the page cache.
+    Process-pool workers should be handed the CSV path and a row range, not data.
+    """
+
+    def __init__(self, csv_path, meta):
+        self.csv_path = csv_path
+        self.records_path, self.meta_path = trip_store_paths(csv_path)
+        self.dictionaries = meta['dictionaries']
+        self.records = np.memmap(self.records_path, dtype=RECORD_DTYPE, mode='r', shape=(meta['rows'],)) \
+            if meta['rows'] else np.empty(0, dtype=RECORD_DTYPE)
+
+    def __len__(self):
+        return len(self.records)
+
+    def row_ranges(self, parts):
+        """
+        Splits the rows into at most `parts` contiguous (start, stop) ranges.
+        """
+        bounds = np.linspace(0, len(self), max(1, min(parts, len(self))) + 1).astype(int)
+        return [(int(a), int(b)) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+
+    def frame(self, start=None, stop=None, columns=None):
+        """
+        DataFrame of rows [start, stop) with the columns and types of the cleaned trip table.
+        Only the requested columns of the requested rows are read from disk.
+        """
+        records = self.records[start:stop]
+        columns = list(columns) if columns is not None else list(RECORD_DTYPE.names)
+        data = {}
+        for name in columns:
+            values = records[name]
+            if name in ENCODED_COLUMNS:
+                data[name] = pd.Categorical.from_codes(values.astype(np.int32), categories=self.dictionaries[name])
+            elif name == 'date':
+                data[name] = values.astype('datetime64[D]').astype('datetime64[ns]')
+            else:
+                data[name] = np.array(values)
+        return apply_schema(pd.DataFrame(data, columns=columns), CLEANED_SCHEMA)
+
+
+def open_trip_store(csv_path):
+    """
+    Opens the trip store of `csv_path` if it exists and matches the current CSV, else returns None.
+    """
+    from src.data_processing.load_data import source_fingerprint
+    records_path, meta_path = trip_store_paths(csv_path)
+    if not (os.path.exists(meta_path) and os.path.exists(records_path) and os.path.exists(csv_path)):
+        return None
+
+    with open(meta_path) as f:
+        meta = json.load(f)
+    if meta.get('version') != STORE_FORMAT_VERSION or np.dtype([tuple(d) for d in meta['dtype']]) != RECORD_DTYPE:
+        logging.info(f"Trip store {records_path} has an old format; ignoring it.")
+        return None
+    if meta['source_fingerprint'] != source_fingerprint(csv_path):
+        logging.info(f"Trip store {records_path} is stale; ignoring it.")
+        return None
+    if os.path.getsize(records_path) != meta['rows'] * RECORD_DTYPE.itemsize:
+        logging.warning(f"Trip store {records_path} is truncated; ignoring it.")
+        return None
+    return TripStore(csv_path, meta)
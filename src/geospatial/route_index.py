@@ -0,0 +1,180 @@
+import pandas as pd
+import numpy as np
+import time
+import logging
+from src.geospatial.routes import ROUTE_COORDS, project, route_geometries, unproject
+
+DEFAULT_MAX_DISTANCE_M = 100.0
+QUERY_CHUNK = 250_000
+
+
+class RouteIndex:
+    """
+    Uniform grid index over the segments of route polylines, for snapping GPS pings.
+
+    Coordinates are projected to metres and every segment is registered in each grid cell
+    that holds a point within `cell_size_m` of it, so snapping within that radius only
+    measures the distance to the segments of the point's own cell and is still exact.
+    Queries are vectorized over whole batches of points.
+    """
+
+    def __init__(self, geometries, cell_size_m=DEFAULT_MAX_DISTANCE_M):
+        self.route_nos = list(geometries)
+        self.cell_size = float(cell_size_m)
+        lats = np.concatenate([np.asarray(coords)[:, 0] for coords in geometries.values()])
+        lons = np.concatenate([np.asarray(coords)[:, 1] for coords in geometries.values()])
+        self.origin = (float(lats.mean()), float(lons.mean()))
+
+        # Flat segment table: route, start/end point in metres, distance along the route
+        route, ax, ay, bx, by, offset = [], [], [], [], [], []
+        for i, coords in enumerate(geometries.values()):
+            coords = np.asarray(coords, dtype=float)
+            if len(coords) == 1:
+                coords = np.vstack([coords, coords])
+            x, y = project(coords[:, 0], coords[:, 1], self.origin)
+            lengths = np.hypot(np.diff(x), np.diff(y))
+            route.append(np.full(len(lengths), i))
+            ax.append(x[:-1]), ay.append(y[:-1]), bx.append(x[1:]), by.append(y[1:])
+            offset.append(np.concatenate([[0.0], np.cumsum(lengths)[:-1]]))
+        self.seg_route = np.concatenate(route)
+        self.ax, self.ay = np.concatenate(ax), np.concatenate(ay)
+        self.bx, self.by = np.concatenate(bx), np.concatenate(by)
+        self.seg_offset = np.concatenate(offset)
+        self._build_grid()
+        logging.info(f"Route index: {len(self.seg_route)} segments of {len(self.route_nos)} routes "
+                     f"in {len(self.cell_keys)} cells of {self.cell_size:.0f} m")
+
+    def _cell(self, x, y):
+        return np.floor(x / self.cell_size).astype(np.int64), np.floor(y / self.cell_size).astype(np.int64)
+
+    @staticmethod
+    def _key(cx, cy):
+        # Cells are within +-2^31 of the origin, so the pair packs into one int64
+        return (cx << 32) + (cy + (1 << 31))
+
+    def _build_grid(self):
+        """
+        CSR table cell key -> segment ids. Candidate cells are the segment's bounding box grown
+        by one cell; a cell is kept when its center is within the radius plus half the cell
+        diagonal of the segment, which covers every point of the cell within the radius.
+        """
+        x0, y0 = self._cell(np.minimum(self.ax, self.bx), np.minimum(self.ay, self.by))
+        x1, y1 = self._cell(np.maximum(self.ax, self.bx), np.maximum(self.ay, self.by))
+        x0, y0, x1, y1 = x0 - 1, y0 - 1, x1 + 1, y1 + 1
+        width, height = x1 - x0 + 1, y1 - y0 + 1
+        counts = width * height
+        segments = np.repeat(np.arange(len(counts)), counts)
+        local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        cx = x0[segments] + local % width[segments]
+        cy = y0[segments] + local // width[segments]
+
+        reach = self.cell_size * (1 + np.sqrt(0.5))
+        near = self._distance((cx + 0.5) * self.cell_size, (cy + 0.5) * self.cell_size, segments)[0] <= reach
+        keys = self._key(cx[near], cy[near])
+        order = np.argsort(keys, kind='stable')
+        keys, self.cell_segments = keys[order], segments[near][order]
+        self.cell_keys, self.cell_starts = np.unique(keys, return_index=True)
+        self.cell_ends = np.append(self.cell_starts[1:], len(keys))
+
+    def _distance(self, x, y, segments):
+        """
+        Distance of each point to its paired segment, and the position t in [0, 1] of the
+        nearest point along the segment.
+        """
+        ax, ay = self.ax[segments], self.ay[segments]
+        dx, dy = self.bx[segments] - ax, self.by[segments] - ay
+        length_sq = dx * dx + dy * dy
+        with np.errstate(invalid='ignore', divide='ignore'):
+            t = np.where(length_sq > 0, ((x - ax) * dx + (y - ay) * dy) / length_sq, 0.0)
+        t = np.clip(t, 0.0, 1.0)
+        return np.hypot(ax + t * dx - x, ay + t * dy - y), t
+
+    def _candidates(self, cx, cy):
+        """
+        (point, segment) pairs for every segment registered in each point's cell.
+        """
+        keys = self._key(cx, cy)
+        pos = np.minimum(np.searchsorted(self.cell_keys, keys), len(self.cell_keys) - 1)
+        found = self.cell_keys[pos] == keys
+        starts = np.where(found, self.cell_starts[pos], 0)
+        lengths = np.where(found, self.cell_ends[pos] - self.cell_starts[pos], 0)
+        points = np.repeat(np.arange(len(cx)), lengths)
+        within = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        return points, self.cell_segments[np.repeat(starts, lengths) + within]
+
+    def _snap_chunk(self, x, y, max_distance):
+        n = len(x)
+        segment = np.full(n, -1, dtype=np.int64)
+        distance = np.full(n, np.nan)
+        t_best = np.zeros(n)
+        points, candidates = self._candidates(*self._cell(x, y))
+        if len(points):
+            d, t = self._distance(x[points], y[points], candidates)
+
+            # Nearest candidate per point: pairs are grouped by point, so reduce per group
+            first = np.flatnonzero(np.r_[True, points[1:] != points[:-1]])
+            best = np.minimum.reduceat(d, first)
+            owner = points[first]
+            is_best = d == np.repeat(best, np.diff(np.append(first, len(points))))
+            pick = np.flatnonzero(is_best)
+            pick = pick[np.r_[True, points[pick][1:] != points[pick][:-1]]]
+            keep = best <= max_distance
+            segment[owner[keep]] = candidates[pick[keep]]
+            distance[owner[keep]] = best[keep]
+            t_best[owner[keep]] = t[pick[keep]]
+        return segment, distance, t_best
+
+    def snap(self, lat, lon, max_distance_m=None):
+        """
+        Snaps GPS points to the nearest route segment within `max_distance_m` (the cell size
+        by default, and never more). Returns a DataFrame with the route, segment, distance
+        to it, offset along the route and the snapped coordinates; route_no is missing for
+        points with no route in range.
+        """
+        max_distance = self.cell_size if max_distance_m is None else min(max_distance_m, self.cell_size)
+        x, y = project(lat, lon, self.origin)
+        x, y = np.atleast_1d(x), np.atleast_1d(y)
+        segment = np.empty(len(x), dtype=np.int64)
+        distance = np.empty(len(x))
+        t = np.empty(len(x))
+        for start in range(0, len(x), QUERY_CHUNK):
+            chunk = slice(start, start + QUERY_CHUNK)
+            segment[chunk], distance[chunk], t[chunk] = self._snap_chunk(x[chunk], y[chunk], max_distance)
+
+        found = segment >= 0
+        seg = np.where(found, segment, 0)
+        dx, dy = self.bx[seg] - self.ax[seg], self.by[seg] - self.ay[seg]
+        snapped_lat, snapped_lon = unproject(self.ax[seg] + t * dx, self.ay[seg] + t * dy, self.origin)
+        route_codes = np.where(found, self.seg_route[seg], -1)
+        return pd.DataFrame({
+            'route_no': pd.Categorical.from_codes(route_codes, categories=self.route_nos),
+            'segment': segment,
+            'distance_m': distance,
+            'offset_m': np.where(found, self.seg_offset[seg] + t * np.hypot(dx, dy), np.nan),
+            'snapped_lat': np.where(found, snapped_lat, np.nan),
+            'snapped_lon': np.where(found, snapped_lon, np.nan)
+        })
+
+
+def snap_pings(pings, route_nos, max_distance_m=DEFAULT_MAX_DISTANCE_M, lat_col='lat', lon_col='lon'):
+    """
+    Snaps a DataFrame of raw GPS pings to the geometries of `route_nos`; returns the pings
+    with the snapping columns of RouteIndex.snap() appended.
+    """
+    index = RouteIndex(route_geometries(route_nos), cell_size_m=max_distance_m)
+    start = time.perf_counter()
+    snapped = index.snap(pings[lat_col].to_numpy(), pings[lon_col].to_numpy())
+    elapsed = time.perf_counter() - start
+    logging.info(f"Snapped {len(pings)} pings in {elapsed:.2f}s "
+                 f"({snapped['route_no'].notna().mean():.1%} within {max_distance_m:.0f} m of a route)")
+    return pd.concat([pings.reset_index(drop=True), snapped], axis=1)
+
+if __name__ == "__main__":
+    # Jittered points along the known routes, as stand-in GPS pings
+    rng = np.random.default_rng(0)
+    geometries = route_geometries(ROUTE_COORDS)
+    coords = np.concatenate(list(geometries.values()))
+    picks = rng.integers(0, len(coords), 1_000_000)
+    pings = pd.DataFrame({'lat': coords[picks, 0] + rng.normal(0, 0.0005, len(picks)),
+                          'lon': coords[picks, 1] + rng.normal(0, 0.0005, len(picks))})
+    snap_pings(pings, list(ROUTE_COORDS))
@@ -0,0 +1,63 @@
+import numpy as np
+import zlib
+
+# Coimbatore Center
+CITY_CENTER = (11.0168, 76.9558)
+EARTH_RADIUS_M = 6_371_000.0
+
+# Simulated Route Coordinates for Coimbatore (Specific)
+# NOTE: These are approximate straight lines for visualization
+ROUTE_COORDS = {
+    '33A': [(11.0168, 76.9558), (11.3006, 76.9366)],  # Gandhipuram - Mettupalayam
+    '32': [(11.0168, 76.9558), (11.0822, 76.9427)],   # Gandhipuram - Thudiyalur
+    '111': [(11.0822, 76.9427), (11.0168, 76.9558)],  # Thudiyalur - Gandhipuram (Reverse of 32)
+    '70': [(11.0168, 76.9558), (11.0422, 76.8770)],   # Gandhipuram - Maruthamalai
+    '4A': [(11.0822, 76.9427), (10.9634, 76.9804)],   # Thudiyalur - Podanur
+    '2A': [(10.9850, 76.9180), (11.0287, 77.0305)]    # Perur - Polytechnic
+}
+
+
+def synthetic_route_geometry(route_no, n_stops=12, seed=42):
+    """
+    Deterministic random-walk polyline (n_stops x (lat, lon)) around the city center for a
+    route without surveyed coordinates. Seeded by the route number, so a route keeps its
+    shape whatever other routes exist.
+    """
+    rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(zlib.crc32(str(route_no).encode()),)))
+    start = np.array(CITY_CENTER) + rng.normal(0, 0.06, 2)
+    heading = rng.uniform(0, 2 * np.pi) + np.cumsum(rng.normal(0, 0.35, n_stops - 1))
+    steps = rng.uniform(0.004, 0.012, n_stops - 1)[:, None] * np.column_stack([np.sin(heading), np.cos(heading)])
+    return np.vstack([start, start + np.cumsum(steps, axis=0)])
+
+
+def route_geometries(route_nos, seed=42):
+    """
+    {route_no: (n x 2) array of (lat, lon) vertices}: the surveyed coordinates where known,
+    synthetic polylines otherwise.
+    """
+    return {
+        str(route): np.asarray(ROUTE_COORDS[str(route)], dtype=float) if str(route) in ROUTE_COORDS
+        else synthetic_route_geometry(route, seed=seed)
+        for route in route_nos
+    }
+
+
+def project(lat, lon, origin):
+    """
+    Equirectangular projection of degrees to metres (x east, y north) around `origin`.
+    Accurate to well under a metre over a city-sized area.
+    """
+    lat0, lon0 = origin
+    x = np.radians(np.asarray(lon, dtype=float) - lon0) * EARTH_RADIUS_M * np.cos(np.radians(lat0))
+    y = np.radians(np.asarray(lat, dtype=float) - lat0) * EARTH_RADIUS_M
+    return x, y
+
+
+def unproject(x, y, origin):
+    """
+    Inverse of project(): metres around `origin` back to (lat, lon) degrees.
+    """
+    lat0, lon0 = origin
+    lat = lat0 + np.degrees(np.asarray(y) / EARTH_RADIUS_M)
+    lon = lon0 + np.degrees(np.asarray(x) / (EARTH_RADIUS_M * np.cos(np.radians(lat0))))
+    return lat, lon
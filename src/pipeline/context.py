@@ -0,0 +1,74 @@
+import threading
+import logging
+
+class PipelineContext:
+    """
+    Shared state for one pipeline run.
+    The cleaned trip data is parsed at most once and handed to every stage.
+    Lazy loads are locked, so concurrently running stages can share one context.
+    pandas and the cube module are imported on first use, so creating a context is cheap.
+
+    When the trips have not been loaded, the cube is built straight from the
+    memory-mapped trip store (in `cube_workers` processes if set), so stages that
+    only need aggregates never materialize the trip table.
+    """
+
+    def __init__(self, raw_data_path='data/raw/bus_delay_dataset.csv',
+                 processed_data_path='data/processed/cleaned_bus_delay.csv', cube_workers=None):
+        self.raw_data_path = raw_data_path
+        self.processed_data_path = processed_data_path
+        self.cube_workers = cube_workers
+        self._cleaned = None
+        self._cube = None
+        self._lock = threading.RLock()
+
+    @property
+    def cleaned(self):
+        """
+        Cleaned trip DataFrame, loaded from processed_data_path on first access.
+        """
+        with self._lock:
+            if self._cleaned is None:
+                from src.data_processing.load_data import load_cleaned_data
+                logging.info(f"Loading cleaned data from {self.processed_data_path}")
+                self._cleaned = load_cleaned_data(self.processed_data_path)
+            return self._cleaned
+
+    @cleaned.setter
+    def cleaned(self, df):
+        with self._lock:
+            self._cleaned = df
+            self._cube = None
+
+    @property
+    def loaded_cleaned(self):
+        """
+        Cleaned trip DataFrame if it is already in memory, else None (never loads it).
+        """
+        with self._lock:
+            return self._cleaned
+
+    @property
+    def cube(self):
+        """
+        DelayCube of the cleaned data, built on first access and shared by all report stages.
+        """
+        with self._lock:
+            if self._cube is None and self._cleaned is None:
+                from src.analysis.aggregate_cube import cube_from_store
+                self._cube = cube_from_store(self.processed_data_path, workers=self.cube_workers)
+            if self._cube is None and self.cleaned is not None:
+                from src.analysis.aggregate_cube import DelayCube
+                self._cube = DelayCube.from_trips(self.cleaned)
+            return self._cube
+
+    @property
+    def trip_count(self):
+        """
+        Number of cleaned trips, taken from the cube when the trips are not loaded.
+        """
+        with self._lock:
+            if self._cleaned is not None:
+                return len(self._cleaned)
+        cube = self.cube
+        return int(cube.cells['count'].sum()) if cube is not None else None
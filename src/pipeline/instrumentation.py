@@ -0,0 +1,174 @@
+import cProfile
+import csv
+import io
+import json
+import os
+import pstats
+import resource
+import threading
+import time
+import tracemalloc
+import logging
+from datetime import datetime
+
+REPORT_FIELDS = ['stage', 'status', 'started_at', 'wall_s', 'cpu_s', 'peak_rss_mb', 'peak_traced_mb',
+                 'rows_in', 'rows_out', 'rows_per_s']
+
+
+def current_rss_mb():
+    """
+    Resident set size of this process in MB (Linux /proc; falls back to the high-water mark).
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class StageProfile:
+    """
+    Context manager measuring one pipeline stage.
+
+    Records wall time, CPU time of the stage's thread, peak RSS (sampled in a
+    background thread), optionally the tracemalloc peak, rows in/out and rows/sec.
+    With `profile_dir`, a cProfile dump (<stage>.prof) and a text summary
+    (<stage>.txt) are written as well.
+
+    RSS and tracemalloc are process-wide: when stages overlap, their peaks include
+    each other's memory. Run with one job for clean per-stage memory numbers.
+    """
+
+    def __init__(self, name, trace_memory=False, profile_dir=None, sample_interval=0.05):
+        self.name = name
+        self.trace_memory = trace_memory
+        self.profile_dir = profile_dir
+        self.sample_interval = sample_interval
+        self.rows_in = None
+        self.rows_out = None
+        self.record = None
+
+    def set_rows(self, rows_in=None, rows_out=None):
+        self.rows_in = rows_in
+        self.rows_out = rows_out
+
+    def _sample_rss(self):
+        while not self._stop.wait(self.sample_interval):
+            self._peak_rss = max(self._peak_rss, current_rss_mb())
+
+    def __enter__(self):
+        self._started_at = datetime.now().isoformat(timespec='seconds')
+        self._peak_rss = current_rss_mb()
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample_rss, daemon=True)
+        self._sampler.start()
+
+        self._owns_tracemalloc = False
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._owns_tracemalloc = True
+            tracemalloc.reset_peak()
+
+        self._profiler = None
+        if self.profile_dir:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+        self._wall = time.perf_counter()
+        self._cpu = time.thread_time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall_s = time.perf_counter() - self._wall
+        cpu_s = time.thread_time() - self._cpu
+
+        if self._profiler is not None:
+            self._profiler.disable()
+            self._write_profile()
+
+        peak_traced_mb = None
+        if self.trace_memory:
+            peak_traced_mb = tracemalloc.get_traced_memory()[1] / 2**20
+            if self._owns_tracemalloc:
+                tracemalloc.stop()
+
+        self._stop.set()
+        self._sampler.join()
+        self._peak_rss = max(self._peak_rss, current_rss_mb())
+
+        # Throughput is measured on the input side; generators only have output rows
+        rows = self.rows_in if self.rows_in is not None else self.rows_out
+        self.record = {
+            'stage': self.name,
+            'status': 'failed' if exc_type else 'done',
+            'started_at': self._started_at,
+            'wall_s': round(wall_s, 4),
+            'cpu_s': round(cpu_s, 4),
+            'peak_rss_mb': round(self._peak_rss, 1),
+            'peak_traced_mb': round(peak_traced_mb, 1) if peak_traced_mb is not None else None,
+            'rows_in': self.rows_in,
+            'rows_out': self.rows_out,
+            'rows_per_s': round(rows / wall_s, 1) if rows and wall_s > 0 else None
+        }
+        return False
+
+    def _write_profile(self):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        prof_path = os.path.join(self.profile_dir, f"{self.name}.prof")
+        self._profiler.dump_stats(prof_path)
+
+        summary = io.StringIO()
+        pstats.Stats(self._profiler, stream=summary).sort_stats('cumulative').print_stats(30)
+        with open(os.path.join(self.profile_dir, f"{self.name}.txt"), 'w') as f:
+            f.write(summary.getvalue())
+        logging.info(f"cProfile output for stage '{self.name}' written to {prof_path}")
+
+
+class RunReport:
+    """
+    Collects per-stage records of one pipeline run and writes them as JSON and CSV.
+    """
+
+    def __init__(self, output_dir='reports/metrics'):
+        self.output_dir = output_dir
+        self.started_at = datetime.now().isoformat(timespec='seconds')
+        self._start = time.perf_counter()
+        self._records = []
+        self._lock = threading.Lock()
+
+    def add(self, record):
+        with self._lock:
+            self._records.append(record)
+        if record.get('wall_s') is not None:
+            logging.info(f"Stage [{record['stage']}] metrics: wall {record['wall_s']:.2f}s, "
+                         f"cpu {record['cpu_s']:.2f}s, peak RSS {record['peak_rss_mb']:.0f} MB, "
+                         f"rows in/out {record['rows_in']}/{record['rows_out']}")
+
+    @property
+    def records(self):
+        with self._lock:
+            return list(self._records)
+
+    def write(self):
+        """
+        Writes run_metrics.json and run_metrics.csv; returns the JSON path.
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        records = self.records
+        json_path = os.path.join(self.output_dir, 'run_metrics.json')
+        with open(json_path, 'w') as f:
+            json.dump({
+                'run_started_at': self.started_at,
+                'total_wall_s': round(time.perf_counter() - self._start, 4),
+                'stages': records
+            }, f, indent=2)
+
+        with open(os.path.join(self.output_dir, 'run_metrics.csv'), 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS)
+            writer.writeheader()
+            for record in records:
+                writer.writerow({field: record.get(field) for field in REPORT_FIELDS})
+
+        logging.info(f"Run metrics written to {json_path}")
+        return json_path
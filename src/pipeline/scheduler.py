@@ -0,0 +1,166 @@
+import hashlib
+import json
+import os
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from src.pipeline.instrumentation import StageProfile
+
+DEFAULT_STATE_PATH = 'data/.pipeline_state.json'
+
+
+class Stage:
+    """
+    One pipeline step: a callable plus the files it reads and writes.
+    Dependencies are derived from the files: a stage runs after every stage that
+    produces one of its inputs. `params` are the settings that affect its outputs.
+    The callable may return {'rows_in': ..., 'rows_out': ...} for the run report.
+    """
+
+    def __init__(self, name, func, inputs=(), outputs=(), params=None):
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.params = params or {}
+
+
+class StageScheduler:
+    """
+    Runs a DAG of stages, independent stages concurrently.
+
+    A stage is skipped when the content hashes of its inputs and its parameters
+    match its last successful run and all of its outputs still exist. Signatures
+    are persisted in a JSON state file together with a (size, mtime) -> sha256
+    cache, so unchanged files are not re-hashed on every run.
+
+    With a RunReport, every stage is measured by a StageProfile and its record
+    (including skipped stages) is added to the report.
+    """
+
+    def __init__(self, stages, state_path=DEFAULT_STATE_PATH, max_workers=4,
+                 report=None, trace_memory=False, profile_dir=None):
+        self.stages = {stage.name: stage for stage in stages}
+        self.state_path = state_path
+        self.max_workers = max_workers
+        self.report = report
+        self.trace_memory = trace_memory
+        self.profile_dir = profile_dir
+        self._lock = threading.Lock()
+        self._state = self._load_state()
+
+        producers = {path: stage.name for stage in stages for path in stage.outputs}
+        self.upstream = {
+            stage.name: sorted({producers[p] for p in stage.inputs if p in producers and producers[p] != stage.name})
+            for stage in stages
+        }
+
+    def _load_state(self):
+        if os.path.exists(self.state_path):
+            with open(self.state_path) as f:
+                return json.load(f)
+        return {'stages': {}, 'files': {}}
+
+    def _save_state(self):
+        os.makedirs(os.path.dirname(self.state_path) or '.', exist_ok=True)
+        tmp_path = self.state_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self._state, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.state_path)
+
+    def file_hash(self, path):
+        """
+        sha256 of a file's content (None if missing), cached by size and mtime.
+        """
+        if not os.path.exists(path):
+            return None
+        stat = os.stat(path)
+        with self._lock:
+            cached = self._state['files'].get(path)
+        if cached and cached['size'] == stat.st_size and cached['mtime_ns'] == stat.st_mtime_ns:
+            return cached['sha256']
+
+        with open(path, 'rb') as f:
+            digest = hashlib.file_digest(f, 'sha256').hexdigest()
+        with self._lock:
+            self._state['files'][path] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': digest}
+        return digest
+
+    def signature(self, stage):
+        """
+        Hash of a stage's parameters and the content of its inputs.
+        """
+        payload = {
+            'params': stage.params,
+            'inputs': {path: self.file_hash(path) for path in stage.inputs}
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+    def is_up_to_date(self, stage, signature):
+        with self._lock:
+            last = self._state['stages'].get(stage.name)
+        return last == signature and all(os.path.exists(path) for path in stage.outputs)
+
+    def _run_stage(self, stage, force):
+        signature = self.signature(stage)
+        if not force and self.is_up_to_date(stage, signature):
+            logging.info(f">>> Stage [{stage.name}]: inputs unchanged, skipped")
+            if self.report is not None:
+                self.report.add({'stage': stage.name, 'status': 'skipped'})
+            return 'skipped'
+
+        logging.info(f">>> Stage [{stage.name}]: running...")
+        profile = StageProfile(stage.name, self.trace_memory, self.profile_dir)
+        try:
+            with profile:
+                result = stage.func()
+                if isinstance(result, dict):
+                    profile.set_rows(result.get('rows_in'), result.get('rows_out'))
+        finally:
+            if self.report is not None and profile.record is not None:
+                self.report.add(profile.record)
+        with self._lock:
+            self._state['stages'][stage.name] = signature
+            self._save_state()
+        logging.info(f">>> Stage [{stage.name}]: done")
+        return 'done'
+
+    def run(self, only=None, force=False):
+        """
+        Runs the selected stages (all when `only` is None) in dependency order.
+        Stages outside `only` are treated as already satisfied.
+        Returns {stage name: 'done' | 'skipped' | 'failed' | 'blocked'}.
+        """
+        selected = [name for name in self.stages if only is None or name in only]
+        unknown = set(only or []) - set(self.stages)
+        if unknown:
+            raise ValueError(f"Unknown stage(s): {sorted(unknown)}; expected one of {list(self.stages)}")
+
+        results = {}
+        remaining = list(selected)
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while remaining or running:
+                for name in list(remaining):
+                    deps = [d for d in self.upstream[name] if d in selected]
+                    if any(results.get(d) in ('failed', 'blocked') for d in deps):
+                        logging.error(f">>> Stage [{name}]: blocked by failed upstream stage")
+                        results[name] = 'blocked'
+                        remaining.remove(name)
+                    elif all(d in results for d in deps):
+                        running[pool.submit(self._run_stage, self.stages[name], force)] = name
+                        remaining.remove(name)
+
+                if not running:
+                    if remaining:
+                        raise ValueError(f"Dependency cycle between stages: {remaining}")
+                    continue
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    try:
+                        results[name] = future.result()
+                    except Exception as e:
+                        logging.critical(f">>> Stage [{name}] failed with error: {str(e)}", exc_info=True)
+                        results[name] = 'failed'
+        return results
@@ -0,0 +1,252 @@
+import pandas as pd
+import numpy as np
+import json
+import os
+import time
+import logging
+from src.data_processing.load_data import load_cleaned_data
+
+MODEL_FORMAT_VERSION = 1
+DEFAULT_MODEL_PATH = 'data/models/delay_model'
+
+# Trip columns the model predicts from, and the ones training also needs
+FEATURE_COLUMNS = ['route_no', 'hour', 'peak_hour', 'day_of_week', 'traffic_multiplier']
+TRAIN_COLUMNS = FEATURE_COLUMNS + ['date', 'delay_min']
+# Regressors of every group's linear model
+REGRESSORS = ['intercept', 'traffic', 'traffic_sq', 'peak_hour', 'weekend']
+WEEKEND_DAYS = ['Saturday', 'Sunday']
+HOURS = 24
+
+
+def model_paths(model_path):
+    """
+    (coefficients file, metadata file) of a saved model.
+    """
+    return model_path + '.npz', model_path + '.json'
+
+
+def _is_weekend(day_of_week):
+    """
+    Boolean weekend flag; categorical columns are mapped through their categories only.
+    """
+    if isinstance(day_of_week.dtype, pd.CategoricalDtype):
+        flags = np.append(np.isin(day_of_week.cat.categories.astype(str), WEEKEND_DAYS), False)
+        return flags[day_of_week.cat.codes.to_numpy()]
+    return np.isin(day_of_week.to_numpy(dtype=str), WEEKEND_DAYS)
+
+
+def design_matrix(df):
+    """
+    (trips x REGRESSORS) float matrix of a trip DataFrame (needs FEATURE_COLUMNS).
+    The squared traffic term lets a linear model follow delays being cut off at zero.
+    """
+    traffic = df['traffic_multiplier'].to_numpy(dtype=np.float64)
+    X = np.empty((len(df), len(REGRESSORS)))
+    X[:, 0] = 1.0
+    X[:, 1] = traffic
+    X[:, 2] = traffic ** 2
+    X[:, 3] = df['peak_hour'].to_numpy(dtype=np.float64)
+    X[:, 4] = _is_weekend(df['day_of_week'])
+    return X
+
+
+def _route_codes(route_no, routes):
+    """
+    Codes of `route_no` in the model's route list; unseen routes get len(routes).
+    Categorical columns are mapped through their categories only.
+    """
+    if isinstance(route_no.dtype, pd.CategoricalDtype):
+        mapping = np.append(pd.Index(routes).get_indexer(route_no.cat.categories.astype(str)), -1)
+        codes = mapping[route_no.cat.codes.to_numpy()]
+    else:
+        codes = pd.Index(routes).get_indexer(route_no.astype(str))
+    return np.where(codes < 0, len(routes), codes)
+
+
+def _shrunk_solve(xtx, xty, alpha, prior):
+    """
+    Ridge solutions of many groups at once, each shrunk towards its `prior` coefficients:
+    beta = (X'X + alpha I)^-1 (X'y + alpha prior).
+    """
+    eye = np.eye(xtx.shape[-1])
+    return np.linalg.solve(xtx + alpha * eye, (xty + alpha * prior)[..., None])[..., 0]
+
+
+class DelayModel:
+    """
+    Hierarchical per-group linear regression of trip delay.
+
+    Every route x hour has its own ridge regression of delay_min on the REGRESSORS.
+    Its coefficients are shrunk towards the route's model, and the route's towards the
+    global model, by `alpha` pseudo-trips: groups with few trips stay close to their
+    parent, and unseen routes or hours fall back to it. Training needs one pass over
+    the trips to build each group's X'X and X'y; all groups are then solved at once.
+
+    Prediction is a table lookup plus a row-wise dot product, so batches of millions of
+    trips take well under a second.
+    """
+
+    def __init__(self, routes, coef, alpha, meta=None):
+        self.routes = list(routes)
+        # coef[route code, hour]; the extra last route row holds the global model
+        self.coef = coef
+        self.alpha = alpha
+        self.meta = meta or {}
+
+    @classmethod
+    def fit(cls, df, alpha=10.0):
+        """
+        Trains the model on cleaned trips (needs TRAIN_COLUMNS except date).
+        """
+        logging.info(f"Training delay model on {len(df)} trips...")
+        routes = sorted(df['route_no'].astype(str).unique())
+        codes = _route_codes(df['route_no'], routes)
+        group = codes * HOURS + df['hour'].to_numpy(dtype=np.int64)
+        X = design_matrix(df)
+        y = df['delay_min'].to_numpy(dtype=np.float64)
+
+        # X'X and X'y of every route x hour, one bincount per matrix entry
+        k = X.shape[1]
+        n_groups = len(routes) * HOURS
+        xtx = np.zeros((n_groups, k, k))
+        for i in range(k):
+            for j in range(i, k):
+                xtx[:, i, j] = xtx[:, j, i] = np.bincount(group, weights=X[:, i] * X[:, j], minlength=n_groups)
+        xty = np.stack([np.bincount(group, weights=X[:, i] * y, minlength=n_groups) for i in range(k)], axis=1)
+        xtx = xtx.reshape(len(routes), HOURS, k, k)
+        xty = xty.reshape(len(routes), HOURS, k)
+
+        # Global -> route -> route x hour, each level shrunk towards its parent
+        global_coef = _shrunk_solve(xtx.sum(axis=(0, 1)), xty.sum(axis=(0, 1)), 1e-6, np.zeros(k))
+        route_coef = _shrunk_solve(xtx.sum(axis=1), xty.sum(axis=1), alpha, global_coef)
+        group_coef = _shrunk_solve(xtx, xty, alpha, route_coef[:, None, :])
+
+        coef = np.empty((len(routes) + 1, HOURS, k))
+        coef[:-1] = group_coef
+        coef[-1] = global_coef
+        meta = {'trained_trips': int(len(df))}
+        if 'date' in df:
+            meta['trained_until'] = str(pd.Timestamp(df['date'].max()).date())
+        return cls(routes, coef, alpha, meta)
+
+    def predict(self, df):
+        """
+        Predicted delay in minutes for every trip of `df` (needs FEATURE_COLUMNS), as a float array.
+        """
+        codes = _route_codes(df['route_no'], self.routes)
+        hours = np.clip(df['hour'].to_numpy(dtype=np.int64), 0, HOURS - 1)
+        coef = self.coef[codes, hours]
+        return np.maximum(np.einsum('ij,ij->i', design_matrix(df), coef), 0.0)
+
+    def save(self, model_path=DEFAULT_MODEL_PATH):
+        coef_path, meta_path = model_paths(model_path)
+        os.makedirs(os.path.dirname(coef_path) or '.', exist_ok=True)
+        np.savez(coef_path, coef=self.coef)
+        meta = {'version': MODEL_FORMAT_VERSION, 'regressors': REGRESSORS, 'routes': self.routes,
+                'alpha': self.alpha, **self.meta}
+        with open(meta_path, 'w') as f:
+            json.dump(meta, f, indent=2)
+        logging.info(f"Delay model saved to {coef_path}")
+
+    @classmethod
+    def load(cls, model_path=DEFAULT_MODEL_PATH):
+        """
+        Loads a saved model, or returns None when it is missing or of another format.
+        """
+        coef_path, meta_path = model_paths(model_path)
+        if not (os.path.exists(coef_path) and os.path.exists(meta_path)):
+            logging.error(f"Model {model_path} not found.")
+            return None
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta.get('version') != MODEL_FORMAT_VERSION or meta.get('regressors') != REGRESSORS:
+            logging.error(f"Model {model_path} has an old format; retrain it.")
+            return None
+        with np.load(coef_path) as data:
+            coef = data['coef']
+        extra = {key: value for key, value in meta.items() if key not in ('version', 'regressors', 'routes', 'alpha')}
+        return cls(meta['routes'], coef, meta['alpha'], extra)
+
+
+def holdout_split(df, holdout_fraction=0.2):
+    """
+    Splits trips by date: the last `holdout_fraction` of the days are held out, so the
+    model is always scored on trips that come after the ones it was trained on.
+    """
+    dates = np.sort(df['date'].unique())
+    cutoff = dates[max(int(len(dates) * (1 - holdout_fraction)), 1) - 1] if len(dates) > 1 else dates[-1]
+    train = df['date'] <= cutoff
+    return df[train], df[~train]
+
+
+def baseline_predictions(train, test):
+    """
+    Baseline forecast of the `test` trips: the training mean delay of their route x hour
+    (the overall training mean for route-hours the training trips do not cover).
+    """
+    keys = ['route_no', 'hour']
+    means = train.groupby(keys, observed=True)['delay_min'].mean().rename('baseline')
+    baseline = test[keys].join(means, on=keys)['baseline']
+    return baseline.fillna(train['delay_min'].mean()).to_numpy(dtype=np.float64)
+
+
+def evaluate_model(model, train, test, batch_rows=1_000_000):
+    """
+    Holdout accuracy (MAE, RMSE, R^2, and the MAE of the training route x hour mean delay
+    as a baseline) and prediction throughput, measured on a batch of at least
+    `batch_rows` trips built by repeating the holdout.
+    """
+    y = test['delay_min'].to_numpy(dtype=np.float64)
+    error = model.predict(test) - y
+    group_mean = baseline_predictions(train, test)
+    metrics = {
+        'holdout_trips': len(test),
+        'mae_min': float(np.abs(error).mean()),
+        'rmse_min': float(np.sqrt((error ** 2).mean())),
+        'r2': float(1 - (error ** 2).sum() / ((y - y.mean()) ** 2).sum()),
+        'baseline_mae_min': float(np.abs(group_mean - y).mean())
+    }
+
+    repeats = max(1, -(-batch_rows // len(test)))
+    batch = test[FEATURE_COLUMNS].iloc[np.tile(np.arange(len(test)), repeats)]
+    start = time.perf_counter()
+    model.predict(batch)
+    elapsed = time.perf_counter() - start
+    metrics['throughput_batch_trips'] = len(batch)
+    metrics['throughput_trips_per_s'] = float(len(batch) / elapsed) if elapsed > 0 else None
+    return metrics
+
+
+def train_delay_model(input_path='data/processed/cleaned_bus_delay.csv', model_path=DEFAULT_MODEL_PATH,
+                      report_path='reports/tables/model_evaluation.csv', df=None, alpha=10.0,
+                      holdout_fraction=0.2):
+    """
+    Scores the model on a date-based holdout, then retrains it on every trip and saves it.
+    Pass an already loaded cleaned DataFrame as `df` to skip reading `input_path`.
+    The holdout metrics are written to `report_path` (a 'no holdout' note when the trips
+    cover a single day).
+    """
+    logging.info("Starting delay model training...")
+    if df is None:
+        df = load_cleaned_data(input_path, columns=TRAIN_COLUMNS)
+        if df is None:
+            return None
+
+    train, test = holdout_split(df[TRAIN_COLUMNS], holdout_fraction)
+    if len(test):
+        metrics = evaluate_model(DelayModel.fit(train, alpha), train, test)
+        logging.info(f"Holdout: MAE {metrics['mae_min']:.2f} min (route x hour mean: {metrics['baseline_mae_min']:.2f}), "
+                     f"RMSE {metrics['rmse_min']:.2f}, R^2 {metrics['r2']:.3f}, "
+                     f"{metrics['throughput_trips_per_s']:,.0f} predictions/s")
+    else:
+        logging.warning("Not enough days for a holdout evaluation; skipped it.")
+        metrics = {'holdout_trips': 0, 'holdout': 'none (needs trips on at least 2 days)'}
+    os.makedirs(os.path.dirname(report_path), exist_ok=True)
+    pd.Series(metrics, name='value').to_csv(report_path, index_label='metric')
+
+    model = DelayModel.fit(df, alpha)
+    model.save(model_path)
+    return model
+
+if __name__ == "__main__":
+    train_delay_model()
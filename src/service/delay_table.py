@@ -0,0 +1,75 @@
+import pandas as pd
+import numpy as np
+import os
+import logging
+from src.data_processing.load_data import load_cleaned_data
+from src.data_processing.schema import DELAY_CATEGORIES
+from src.service.query_service import DEFAULT_TABLE_PATH
+
+# Grain of the lookup table; day_type is 'weekday', 'weekend' or 'all'
+TABLE_KEYS = ['route_no', 'hour', 'day_type']
+TABLE_COLUMNS = ['route_no', 'route_name', 'hour', 'day_type', 'trips', 'delay_mean', 'delay_std', 'delay_p50',
+                 'delay_p90', 'delay_p95', 'delay_max', 'low_delay_share', 'inefficiency']
+TABLE_QUANTILES = {'delay_p50': 0.5, 'delay_p90': 0.9, 'delay_p95': 0.95}
+SOURCE_COLUMNS = ['route_no', 'route_name', 'hour', 'day_of_week', 'delay_min', 'delay_category',
+                  'inefficiency_score']
+WEEKEND_DAYS = ['Saturday', 'Sunday']
+
+
+def _group_stats(df, keys):
+    grouped = df.groupby(keys, observed=True, sort=True)
+    stats = grouped.agg(
+        route_name=('route_name', 'first'),
+        trips=('delay_min', 'size'),
+        delay_mean=('delay_min', 'mean'),
+        delay_std=('delay_min', 'std'),
+        delay_max=('delay_min', 'max'),
+        low_delay_share=('_low_delay', 'mean'),
+        inefficiency=('inefficiency_score', 'mean')
+    )
+    quantiles = grouped['delay_min'].quantile(list(TABLE_QUANTILES.values())).unstack()
+    quantiles.columns = list(TABLE_QUANTILES)
+    return stats.join(quantiles).reset_index()
+
+
+def build_delay_table(df):
+    """
+    Delay statistics per route x hour x day type (weekday, weekend and all days) from
+    cleaned trips: trips, mean/std/max delay, p50/p90/p95, the share of trips in the
+    Low delay category (<= 5 min; not the on-time share, which elsewhere means no delay)
+    and mean inefficiency.
+    """
+    df = df[SOURCE_COLUMNS].assign(
+        route_no=df['route_no'].astype(str),
+        day_type=np.where(df['day_of_week'].astype(str).isin(WEEKEND_DAYS), 'weekend', 'weekday'),
+        _low_delay=(df['delay_category'] == DELAY_CATEGORIES[0]).astype(float)
+    )
+    by_day_type = _group_stats(df, TABLE_KEYS)
+    all_days = _group_stats(df, ['route_no', 'hour']).assign(day_type='all')
+    table = pd.concat([by_day_type, all_days], ignore_index=True)[TABLE_COLUMNS]
+    return table.sort_values(TABLE_KEYS, ignore_index=True)
+
+
+def write_delay_table(input_path='data/processed/cleaned_bus_delay.csv', output_path=DEFAULT_TABLE_PATH, df=None):
+    """
+    Builds the query service's lookup table and writes it to `output_path`.
+    The file is replaced atomically, so a running service never reads a partial table
+    and reloads it as soon as it changes. Pass an already loaded cleaned DataFrame as
+    `df` to skip reading `input_path`.
+    """
+    logging.info("Building delay lookup table...")
+    if df is None:
+        df = load_cleaned_data(input_path, columns=SOURCE_COLUMNS)
+        if df is None:
+            return None
+
+    table = build_delay_table(df)
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    tmp_path = output_path + '.tmp'
+    table.round(4).to_csv(tmp_path, index=False)
+    os.replace(tmp_path, output_path)
+    logging.info(f"Delay lookup table with {len(table)} rows saved to {output_path}")
+    return table
+
+if __name__ == "__main__":
+    write_delay_table()
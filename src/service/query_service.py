@@ -0,0 +1,317 @@
+import argparse
+import csv
+import json
+import os
+import threading
+import time
+import logging
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+# Only the standard library is imported, so the service starts in milliseconds and never
+# pulls pandas into a request path. The table is built by src.service.delay_table.
+DEFAULT_TABLE_PATH = 'data/service/delay_table.csv'
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8750
+DEFAULT_CACHE_SIZE = 4096
+DAY_TYPES = ['weekday', 'weekend', 'all']
+WEEKEND_DAYS = {'saturday', 'sunday'}
+WEEKDAYS = {'monday', 'tuesday', 'wednesday', 'thursday', 'friday'}
+INT_FIELDS = {'hour', 'trips'}
+TEXT_FIELDS = {'route_no', 'route_name', 'day_type'}
+
+
+class LRUCache:
+    """
+    Thread-safe least-recently-used cache with hit/miss/eviction counters.
+    """
+
+    def __init__(self, maxsize=DEFAULT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'size': len(self._items), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions, 'hit_rate': round(self.hits / lookups, 4) if lookups else None}
+
+
+def _parse_row(row):
+    return {name: (value if name in TEXT_FIELDS else int(value) if name in INT_FIELDS
+                   else float(value) if value != '' else None)
+            for name, value in row.items()}
+
+
+def load_table(table_path):
+    """
+    Reads the lookup table into an index {(route_no, hour, day_type): row} and the
+    per-route summary {route_no: {route_name, hours}}.
+    """
+    index = {}
+    routes = {}
+    with open(table_path, newline='') as f:
+        for row in csv.DictReader(f):
+            row = _parse_row(row)
+            index[(row['route_no'], row['hour'], row['day_type'])] = row
+            route = routes.setdefault(row['route_no'], {'route_name': row['route_name'], 'hours': set()})
+            route['hours'].add(row['hour'])
+    for route in routes.values():
+        route['hours'] = sorted(route['hours'])
+    return index, routes
+
+
+def normalize_day(day):
+    """
+    Day type of a `day` query value: weekday/weekend/all or a day name (all when empty).
+    Raises ValueError for anything else.
+    """
+    day = (day or 'all').strip().lower()
+    if day in DAY_TYPES:
+        return day
+    if day in WEEKEND_DAYS:
+        return 'weekend'
+    if day in WEEKDAYS:
+        return 'weekday'
+    raise ValueError(f"Unknown day '{day}'; use weekday, weekend, all or a day name")
+
+
+class QueryError(Exception):
+    """
+    A query that cannot be answered, with the HTTP status to report.
+    """
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class DelayQueryService:
+    """
+    In-process delay lookups over the precomputed route x hour x day type table.
+
+    Lookups hit a dict index, and their JSON answers are kept in an LRU cache, so a
+    repeated query costs one cache hit. A watcher thread checks the table file every
+    `reload_interval_s` seconds. When a pipeline run replaces it, the new table is loaded
+    off the request path, swapped in with a single assignment and the cache is cleared.
+    Queries never see a half-loaded table.
+    """
+
+    def __init__(self, table_path=DEFAULT_TABLE_PATH, cache_size=DEFAULT_CACHE_SIZE, reload_interval_s=1.0):
+        self.table_path = table_path
+        self.cache = LRUCache(cache_size)
+        self.reload_interval_s = reload_interval_s
+        self.table = None  # (version, index, routes)
+        self.fingerprint = None
+        self.loaded_at = None
+        self.reloads = 0
+        self._stop = threading.Event()
+        self._watcher = None
+
+    def _file_fingerprint(self):
+        try:
+            stat = os.stat(self.table_path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def load(self):
+        """
+        (Re)loads the table. Returns False, keeping any table already loaded, when the
+        file is missing or unreadable.
+        """
+        fingerprint = self._file_fingerprint()
+        if fingerprint is None:
+            logging.error(f"Delay table {self.table_path} not found.")
+            return False
+        try:
+            index, routes = load_table(self.table_path)
+        except (OSError, ValueError, KeyError) as e:
+            logging.error(f"Could not load delay table {self.table_path}: {e}")
+            return False
+        version = (self.table[0] + 1) if self.table else 1
+        self.table = (version, index, routes)
+        self.fingerprint = fingerprint
+        self.loaded_at = time.time()
+        self.cache.clear()
+        logging.info(f"Delay table v{version} loaded: {len(index)} rows, {len(routes)} routes")
+        return True
+
+    def reload_if_changed(self):
+        fingerprint = self._file_fingerprint()
+        if fingerprint is not None and fingerprint != self.fingerprint:
+            if self.load():
+                self.reloads += 1
+                return True
+        return False
+
+    def _watch(self):
+        while not self._stop.wait(self.reload_interval_s):
+            self.reload_if_changed()
+
+    def start_watcher(self):
+        self._watcher = threading.Thread(target=self._watch, name='delay-table-watcher', daemon=True)
+        self._watcher.start()
+
+    def stop(self):
+        self._stop.set()
+
+    @staticmethod
+    def _answer(table, route, hour, day_type):
+        version, index, routes = table
+        if route not in routes:
+            raise QueryError(404, f"Unknown route '{route}'")
+        if hour is None:
+            rows = [index[(route, h, day_type)] for h in routes[route]['hours'] if (route, h, day_type) in index]
+            return {'route_no': route, 'day_type': day_type, 'hours': rows, 'table_version': version}
+        row = index.get((route, hour, day_type))
+        if row is None:
+            raise QueryError(404, f"No trips of route {route} at {hour}:00 ({day_type})")
+        return {**row, 'expected_delay_min': row['delay_mean'], 'table_version': version}
+
+    def lookup(self, route, hour=None, day=None):
+        """
+        Delay statistics of `route` at `hour` (every hour when None) on `day` (weekday,
+        weekend, all or a day name), as (dict, JSON bytes). Raises QueryError.
+        """
+        table = self.table
+        if table is None:
+            raise QueryError(503, "Delay table not loaded")
+        try:
+            hour = None if hour is None or hour == '' else int(hour)
+        except ValueError:
+            raise QueryError(400, f"Invalid hour '{hour}'")
+        try:
+            query = (str(route), hour, normalize_day(day))
+        except ValueError as e:
+            raise QueryError(400, str(e))
+        # Keyed by table version too: an answer computed from a table that was just replaced
+        # can never be served after the reload
+        key = (table[0],) + query
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        answer = self._answer(table, *query)
+        result = (answer, json.dumps(answer).encode())
+        self.cache.put(key, result)
+        return result
+
+    def health(self):
+        version = self.table[0] if self.table else None
+        return {'table_path': self.table_path, 'table_version': version,
+                'rows': len(self.table[1]) if self.table else 0, 'reloads': self.reloads,
+                'loaded_at': self.loaded_at, 'cache': self.cache.stats()}
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """
+    GET /delay?route=70&hour=17&day=weekday, GET /routes and GET /health.
+    Keep-alive HTTP/1.1, so clients can reuse one connection for many queries.
+    """
+    protocol_version = 'HTTP/1.1'
+    # Buffered output: headers and body leave in one write when the request is done, instead
+    # of two small writes where the second waits on the client's delayed ACK
+    wbufsize = -1
+    service = None
+
+    def _send(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        try:
+            if url.path == '/delay':
+                if 'route' not in params:
+                    raise QueryError(400, "Missing 'route' parameter")
+                _, body = self.service.lookup(params['route'], params.get('hour'), params.get('day'))
+            elif url.path == '/routes':
+                if self.service.table is None:
+                    raise QueryError(503, "Delay table not loaded")
+                body = json.dumps(self.service.table[2]).encode()
+            elif url.path == '/health':
+                body = json.dumps(self.service.health()).encode()
+            else:
+                raise QueryError(404, f"Unknown endpoint {url.path}")
+        except QueryError as e:
+            self._send(e.status, json.dumps({'error': str(e)}).encode())
+            return
+        self._send(200, body)
+
+    def log_message(self, format, *args):
+        logging.debug("%s - %s", self.address_string(), format % args)
+
+
+def make_server(service, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    """
+    Threaded HTTP server answering queries from `service` (port 0 picks a free port).
+    """
+    handler = type('BoundQueryHandler', (QueryHandler,), {'service': service})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def serve(table_path=DEFAULT_TABLE_PATH, host=DEFAULT_HOST, port=DEFAULT_PORT, cache_size=DEFAULT_CACHE_SIZE,
+          reload_interval_s=1.0):
+    """
+    Runs the HTTP query service until interrupted, reloading the table whenever it changes.
+    """
+    service = DelayQueryService(table_path, cache_size, reload_interval_s)
+    if not service.load():
+        return None
+    service.start_watcher()
+    server = make_server(service, host, port)
+    logging.info(f"Delay query service listening on http://{host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logging.info("Delay query service stopped")
+    finally:
+        service.stop()
+        server.server_close()
+    return service
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Delay query service")
+    parser.add_argument('--table', default=DEFAULT_TABLE_PATH)
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_SIZE)
+    parser.add_argument('--reload-interval', type=float, default=1.0, help="Seconds between table change checks")
+    args = parser.parse_args()
+    serve(args.table, args.host, args.port, args.cache_size, args.reload_interval)
@@ -0,0 +1,276 @@
+import pandas as pd
+import numpy as np
+import os
+import json
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from src.data_collection.generate_dataset import route_table, simulate_trip_times, DEFAULT_TRIP_HOURS, PEAK_HOURS
+
+DEFAULT_SCENARIOS_PATH = 'config/scenarios.json'
+DEFAULT_REPLICATIONS = 1000
+# Replications per worker task. Fixed, so the merge order (and so the floating point
+# sums) are the same whatever the number of workers
+BLOCK_REPLICATIONS = 50
+# Delay histogram range in whole minutes; longer delays are counted in the last bin
+MAX_DELAY_MIN = 240
+CHANGE_FIELDS = {'routes', 'hours', 'traffic_scale', 'shift_to', 'buffer_min'}
+Z_95 = 1.959964
+
+
+def load_scenarios(scenarios_path=DEFAULT_SCENARIOS_PATH):
+    """
+    Reads the what-if scenarios from a JSON file ({"scenarios": [...]}).
+
+    A scenario has a `name` and a list of `changes`. A change selects trips by `routes`
+    (route numbers, all when omitted) and `hours` (a list, "peak" or "offpeak", all when
+    omitted) and applies any of: `traffic_scale` (multiplies the traffic multiplier),
+    `shift_to` (moves the trips to another hour) and `buffer_min` (minutes added to the
+    schedule). The first scenario is the reference the others are compared with.
+    """
+    if not os.path.exists(scenarios_path):
+        logging.error(f"Scenarios file {scenarios_path} not found.")
+        return None
+
+    with open(scenarios_path) as f:
+        scenarios = json.load(f)['scenarios']
+    if not scenarios:
+        raise ValueError(f"No scenarios in {scenarios_path}")
+    for scenario in scenarios:
+        for change in scenario.get('changes', []):
+            unknown = set(change) - CHANGE_FIELDS
+            if unknown:
+                raise ValueError(f"Scenario '{scenario['name']}': unknown change fields {sorted(unknown)}")
+    logging.info(f"Loaded {len(scenarios)} scenarios from {scenarios_path}")
+    return scenarios
+
+
+def trip_plan(routes, trip_hours, days, start_date):
+    """
+    The simulated timetable as flat arrays, one entry per trip (day -> route -> hour),
+    as in generate_dataset.
+    """
+    n_routes, n_hours = len(routes), len(trip_hours)
+    route_idx = np.tile(np.repeat(np.arange(n_routes), n_hours), days)
+    hours = np.tile(np.asarray(trip_hours, dtype=np.int64), days * n_routes)
+    start = np.datetime64(pd.Timestamp(start_date).date(), 'D').astype(np.int64)
+    weekday = (start + np.repeat(np.arange(days), n_routes * n_hours) + 3) % 7  # 1970-01-01 was a Thursday
+    return {
+        'route_idx': route_idx,
+        'hour': hours,
+        'is_weekend': weekday >= 5,
+        'base_time': routes['base_time'].to_numpy(dtype=float)[route_idx]
+    }
+
+
+def apply_changes(plan, route_nos, changes):
+    """
+    Per-trip (is_peak, traffic_scale, buffer_min) arrays of the timetable with `changes` applied.
+    Peak hour selections refer to the timetable before any trip is shifted.
+    """
+    hours = plan['hour'].copy()
+    is_weekend = plan['is_weekend']
+    was_peak = np.isin(plan['hour'], PEAK_HOURS) & ~is_weekend
+    traffic_scale = np.ones(len(hours))
+    buffer_min = np.zeros(len(hours))
+    for change in changes:
+        mask = np.ones(len(hours), dtype=bool)
+        if 'routes' in change:
+            mask &= np.isin(route_nos[plan['route_idx']], [str(r) for r in change['routes']])
+        if change.get('hours') == 'peak':
+            mask &= was_peak
+        elif change.get('hours') == 'offpeak':
+            mask &= ~was_peak
+        elif 'hours' in change:
+            mask &= np.isin(plan['hour'], change['hours'])
+        if 'traffic_scale' in change:
+            traffic_scale[mask] *= change['traffic_scale']
+        if 'buffer_min' in change:
+            buffer_min[mask] += change['buffer_min']
+        if 'shift_to' in change:
+            hours[mask] = change['shift_to']
+    return np.isin(hours, PEAK_HOURS) & ~is_weekend, traffic_scale, buffer_min
+
+
+class ScenarioAggregate:
+    """
+    Mergeable results of a batch of replications, per scenario and route (the last route
+    row is all routes together):
+
+    - hist: trip counts per whole delay minute, so delay quantiles are exact;
+    - rep_sum / rep_sumsq: sum and sum of squares of the per-replication mean delay,
+      which give the confidence interval of the mean across replications;
+    - diff_sum / diff_sumsq: the same for the per-replication difference to the first
+      (reference) scenario. Every scenario of a replication uses the same random stream,
+      so these paired differences are much tighter than comparing two independent means.
+
+    Replications are folded in as they are simulated; no trip is kept.
+    """
+
+    def __init__(self, n_scenarios, n_routes, bins=MAX_DELAY_MIN + 1):
+        shape = (n_scenarios, n_routes + 1)
+        self.replications = 0
+        self.hist = np.zeros(shape + (bins,), dtype=np.int64)
+        self.rep_sum = np.zeros(shape)
+        self.rep_sumsq = np.zeros(shape)
+        self.diff_sum = np.zeros(shape)
+        self.diff_sumsq = np.zeros(shape)
+
+    def add(self, delays, route_idx, trips_per_route):
+        """
+        Folds one replication in: `delays` holds the trip delays of every scenario (one row each).
+        """
+        n_scenarios = len(delays)
+        n_routes, bins = self.hist.shape[1] - 1, self.hist.shape[2]
+        cells = (np.arange(n_scenarios)[:, None] * n_routes + route_idx) * bins + np.minimum(delays, bins - 1)
+        hist = np.bincount(cells.ravel(), minlength=n_scenarios * n_routes * bins).reshape(n_scenarios, n_routes, bins)
+        self.hist[:, :n_routes] += hist
+        self.hist[:, n_routes] += hist.sum(axis=1)
+
+        sums = np.bincount((np.arange(n_scenarios)[:, None] * n_routes + route_idx).ravel(),
+                           weights=delays.ravel(), minlength=n_scenarios * n_routes).reshape(n_scenarios, n_routes)
+        means = np.column_stack([sums / trips_per_route, delays.mean(axis=1)])
+        diffs = means - means[0]
+        self.rep_sum += means
+        self.rep_sumsq += means ** 2
+        self.diff_sum += diffs
+        self.diff_sumsq += diffs ** 2
+        self.replications += 1
+
+    def merge(self, other):
+        """
+        Adds the replications of another aggregate (in place). Returns self.
+        """
+        for name in ['hist', 'rep_sum', 'rep_sumsq', 'diff_sum', 'diff_sumsq']:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        self.replications += other.replications
+        return self
+
+    def summary(self, scenario_names, route_nos):
+        """
+        One row per scenario and route ('ALL' for every route): mean delay with its 95%
+        confidence interval, delay quantiles, on-time share and the change in mean delay
+        against the reference scenario with its 95% confidence interval.
+        The intervals are NaN with fewer than 2 replications (no sample variance).
+        """
+        n = self.replications
+        hist = self.hist.reshape(-1, self.hist.shape[2])
+        trips = hist.sum(axis=1)
+
+        def interval(total, total_sq):
+            mean = (total / n).ravel()
+            if n < 2:
+                return mean, np.full_like(mean, np.nan), np.full_like(mean, np.nan)
+            var = np.maximum(total_sq.ravel() / n - mean ** 2, 0.0) * n / (n - 1)
+            half = Z_95 * np.sqrt(var / n)
+            return mean, mean - half, mean + half
+
+        mean, mean_lo, mean_hi = interval(self.rep_sum, self.rep_sumsq)
+        change, change_lo, change_hi = interval(self.diff_sum, self.diff_sumsq)
+        result = pd.DataFrame({
+            'scenario': np.repeat(scenario_names, len(route_nos) + 1),
+            'route_no': np.tile(list(route_nos) + ['ALL'], len(scenario_names)),
+            'replications': n,
+            'trips': trips,
+            'delay_mean': mean,
+            'delay_mean_ci_low': mean_lo,
+            'delay_mean_ci_high': mean_hi
+        })
+        for q in (0.5, 0.9, 0.95):
+            result[f"p{q * 100:g}"] = histogram_quantile(hist, q)
+        result['on_time_share'] = hist[:, 0] / trips
+        result['change_vs_reference'] = change
+        result['change_ci_low'] = change_lo
+        result['change_ci_high'] = change_hi
+        return result
+
+
+def histogram_quantile(hist, q):
+    """
+    Quantile of every row of a (rows x delay minute) histogram, with linear
+    interpolation between ranks as in pandas' quantile.
+    """
+    cum = hist.cumsum(axis=1)
+    pos = (cum[:, -1] - 1) * q
+    lo, hi = np.floor(pos), np.ceil(pos)
+    v_lo = (cum > lo[:, None]).argmax(axis=1)
+    v_hi = (cum > hi[:, None]).argmax(axis=1)
+    return v_lo + (v_hi - v_lo) * (pos - lo)
+
+
+def simulate_replications(routes, trip_hours, days, start_date, scenarios, seed, first, last):
+    """
+    Worker task: simulates replications [first, last) of every scenario and returns their
+    ScenarioAggregate. Replication i draws from SeedSequence(seed, spawn_key=(i,)) whichever
+    worker runs it, so results do not depend on how replications are split.
+    """
+    plan = trip_plan(routes, trip_hours, days, start_date)
+    route_nos = routes['route_no'].to_numpy(dtype=str)
+    changed = [apply_changes(plan, route_nos, scenario.get('changes', [])) for scenario in scenarios]
+    trips_per_route = np.bincount(plan['route_idx'], minlength=len(routes))
+    base_time = plan['base_time']
+    aggregate = ScenarioAggregate(len(scenarios), len(routes))
+
+    delays = np.empty((len(scenarios), len(base_time)), dtype=np.int64)
+    for rep in range(first, last):
+        stream = np.random.SeedSequence(seed, spawn_key=(rep,))
+        for s, (is_peak, traffic_scale, buffer_min) in enumerate(changed):
+            # Common random numbers: every scenario replays the same stream
+            _, actual_time, _ = simulate_trip_times(np.random.default_rng(stream), base_time, is_peak,
+                                                    plan['is_weekend'], traffic_scale)
+            delays[s] = np.maximum(0, actual_time - (base_time + buffer_min))
+        aggregate.add(delays, plan['route_idx'], trips_per_route)
+    return aggregate
+
+
+def run_scenarios(scenarios_path=DEFAULT_SCENARIOS_PATH, output_path='reports/tables/scenario_results.csv',
+                  replications=DEFAULT_REPLICATIONS, workers=None, seed=42, days=30, routes=None,
+                  trip_hours=None, start_date='2024-01-01'):
+    """
+    Runs `replications` Monte Carlo replications of every scenario on the generator's
+    traffic and noise model (`days` days of the route table from `start_date`) and writes
+    the delay distribution per scenario and route to `output_path`.
+
+    Replications are split into blocks over a process pool of `workers` processes (all
+    CPUs by default, in-process with 1) and the block aggregates are merged in block
+    order, so the same seed gives the same results with any number of workers.
+    Raises ValueError for fewer than 2 replications, which give no confidence interval.
+    """
+    logging.info("Starting scenario simulation...")
+    if replications < 2:
+        raise ValueError(f"At least 2 replications are needed for confidence intervals, got {replications}")
+    scenarios = load_scenarios(scenarios_path)
+    if scenarios is None:
+        return None
+
+    routes = route_table(routes)
+    trip_hours = DEFAULT_TRIP_HOURS if trip_hours is None else list(trip_hours)
+    workers = workers or os.cpu_count() or 1
+    blocks = [(first, min(first + BLOCK_REPLICATIONS, replications))
+              for first in range(0, replications, BLOCK_REPLICATIONS)]
+    args = (routes, trip_hours, days, start_date, scenarios, seed)
+
+    logging.info(f"Simulating {replications} replications of {len(scenarios)} scenarios "
+                 f"({len(routes) * len(trip_hours) * days} trips each) in {workers} process(es)...")
+    aggregate = ScenarioAggregate(len(scenarios), len(routes))
+    if workers < 2:
+        for first, last in blocks:
+            aggregate.merge(simulate_replications(*args, first, last))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for partial in pool.map(simulate_replications, *zip(*[args + block for block in blocks])):
+                aggregate.merge(partial)
+
+    result = aggregate.summary([scenario['name'] for scenario in scenarios], routes['route_no'])
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    result.round(4).to_csv(output_path, index=False)
+
+    overall = result[result['route_no'] == 'ALL'].set_index('scenario')
+    for name, row in overall.iloc[1:].iterrows():
+        logging.info(f"Scenario '{name}': mean delay {row['delay_mean']:.2f} min, "
+                     f"{row['change_vs_reference']:+.2f} min vs '{overall.index[0]}' "
+                     f"(95% CI {row['change_ci_low']:+.2f} to {row['change_ci_high']:+.2f})")
+    logging.info(f"Scenario results exported to {output_path}")
+    return result
+
+if __name__ == "__main__":
+    run_scenarios()
@@ -0,0 +1,407 @@
+import pandas as pd
+import numpy as np
+import argparse
+import asyncio
+import io
+import json
+import os
+import threading
+import time
+import logging
+from collections import deque
+from src.data_processing.schema import RAW_SCHEMA, apply_schema, csv_dtypes, parse_dates
+from src.data_processing.clean_data import transform_chunk
+from src.data_collection.generate_dataset import peak_flags
+
+# Wire format: one raw trip per line, CSV in RAW_SCHEMA column order, no header
+EVENT_COLUMNS = list(RAW_SCHEMA)
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 9750
+READ_SIZE = 1 << 16
+WINDOW_KEYS = ['route_no', 'hour', 'peak_hour']
+# Per-group sums kept in each window bucket, and how buckets combine
+BUCKET_AGG = {'trips': 'sum', 'delay_sum': 'sum', 'delay_sq': 'sum', 'delay_max': 'max', 'inefficiency_sum': 'sum'}
+# Bucket frames are combined once this many micro-batches have been added to one bucket
+MAX_BUCKET_FRAMES = 32
+
+
+def _parse_lenient(data):
+    """
+    Slow path of parse_events for batches with bad lines: every field is read as text and
+    converted with coercion, and rows with a missing or unparsable field are dropped.
+    """
+    raw = pd.read_csv(io.BytesIO(data), names=EVENT_COLUMNS, header=None, dtype=str, on_bad_lines='skip')
+    for name, dtype in RAW_SCHEMA.items():
+        if dtype == 'datetime64[ns]':
+            raw[name] = pd.to_datetime(raw[name], errors='coerce')
+        elif dtype == 'bool':
+            raw[name] = raw[name].map({'True': True, 'False': False})
+        elif not isinstance(dtype, pd.CategoricalDtype) and dtype != 'category':
+            raw[name] = pd.to_numeric(raw[name], errors='coerce')
+    raw = raw.dropna()
+    if isinstance(RAW_SCHEMA['day_of_week'], pd.CategoricalDtype):
+        raw = raw[raw['day_of_week'].isin(RAW_SCHEMA['day_of_week'].categories)]
+    return apply_schema(raw.reset_index(drop=True), RAW_SCHEMA)
+
+
+def parse_events(lines):
+    """
+    Parses a micro-batch of raw trip lines (bytes) and applies clean_data's transformations.
+    Returns (cleaned trips, malformed line count). A batch with bad lines is re-read
+    leniently, so a bad event only drops itself, not its whole batch.
+    """
+    data = b'\n'.join(lines)
+    try:
+        raw = pd.read_csv(io.BytesIO(data), names=EVENT_COLUMNS, header=None, dtype=csv_dtypes(RAW_SCHEMA),
+                          parse_dates=parse_dates(RAW_SCHEMA))
+    except (ValueError, pd.errors.ParserError):
+        raw = _parse_lenient(data)
+    return transform_chunk(raw), len(lines) - len(raw)
+
+
+class RollingWindows:
+    """
+    Rolling per route x hour delay and inefficiency over the last `window_s` seconds.
+
+    The window is a ring of `bucket_s`-second buckets, each holding mergeable per-group
+    sums (trips, delay sum and sum of squares, max delay, inefficiency sum) of the
+    micro-batches that arrived in it. Expired buckets are dropped whole, so memory is
+    bounded by the number of buckets times the number of groups, whatever the event rate.
+    Safe to update and snapshot from different threads.
+    """
+
+    def __init__(self, window_s=900, bucket_s=60):
+        self.window_s = window_s
+        self.bucket_s = bucket_s
+        self.buckets = deque()  # [bucket start, list of per-group sum frames]
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def batch_sums(trips):
+        delay = trips['delay_min'].astype(np.float64)
+        # Same weekday-only peak rule as the batch data, whatever flag the event carried
+        peak = peak_flags(trips['hour'].to_numpy(), trips['date'].dt.dayofweek.to_numpy() >= 5)
+        return trips.assign(_delay=delay, _delay_sq=delay ** 2, peak_hour=peak).groupby(WINDOW_KEYS, observed=True).agg(
+            trips=('_delay', 'size'),
+            delay_sum=('_delay', 'sum'),
+            delay_sq=('_delay_sq', 'sum'),
+            delay_max=('_delay', 'max'),
+            inefficiency_sum=('inefficiency_score', 'sum')
+        )
+
+    @staticmethod
+    def _combine(frames):
+        frames = [frame.reset_index().astype({'route_no': str}) for frame in frames]
+        return pd.concat(frames, ignore_index=True).groupby(WINDOW_KEYS).agg(BUCKET_AGG)
+
+    def _expire(self, now):
+        while self.buckets and self.buckets[0][0] <= now - self.window_s:
+            self.buckets.popleft()
+
+    def update(self, trips, now=None):
+        now = time.monotonic() if now is None else now
+        sums = self.batch_sums(trips)
+        start = now - now % self.bucket_s
+        with self._lock:
+            self._expire(now)
+            if self.buckets and self.buckets[-1][0] == start:
+                frames = self.buckets[-1][1]
+                frames.append(sums)
+                if len(frames) >= MAX_BUCKET_FRAMES:
+                    frames[:] = [self._combine(frames)]
+            else:
+                if self.buckets and len(self.buckets[-1][1]) > 1:
+                    self.buckets[-1][1][:] = [self._combine(self.buckets[-1][1])]
+                self.buckets.append([start, [sums]])
+
+    def snapshot(self, now=None):
+        """
+        Window metrics per route x hour x peak flag: trips, mean/std/max delay and mean inefficiency.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._expire(now)
+            frames = [frame for _, bucket in self.buckets for frame in bucket]
+        if not frames:
+            return pd.DataFrame(columns=WINDOW_KEYS + ['trips', 'delay_mean', 'delay_std', 'delay_max',
+                                                       'inefficiency'])
+        sums = self._combine(frames)
+        mean = sums['delay_sum'] / sums['trips']
+        variance = (sums['delay_sq'] - sums['trips'] * mean ** 2) / (sums['trips'] - 1).where(sums['trips'] > 1)
+        out = pd.DataFrame({
+            'trips': sums['trips'].astype(np.int64),
+            'delay_mean': mean,
+            'delay_std': np.sqrt(variance.clip(lower=0)),
+            'delay_max': sums['delay_max'],
+            'inefficiency': sums['inefficiency_sum'] / sums['trips']
+        }).reset_index()
+        return out
+
+
+def _write_atomic(path, write):
+    # Readers polling the live files never see a half-written one
+    tmp_path = path + '.tmp'
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+class IngestionService:
+    """
+    Long-running asyncio ingestion of trip-completion events.
+
+    Sources (a TCP socket or a tailed file) push chunks of complete lines into a bounded
+    queue of `max_pending` chunks. When processing falls behind, the queue fills up and the
+    sources stop reading, so TCP flow control slows the senders down instead of memory
+    growing. A batcher cuts the queue into micro-batches of up to `batch_size` events,
+    waiting at most `max_latency_s` after the oldest queued event before processing. Each
+    batch is parsed and cleaned in a worker thread, keeping the event loop responsive,
+    then folded into the rolling windows. Window metrics and throughput/latency counters
+    are written to `output_dir` every `report_interval_s` seconds.
+    """
+
+    def __init__(self, batch_size=5000, max_latency_s=0.5, max_pending=16, window_s=900, bucket_s=60,
+                 output_dir='reports/live', report_interval_s=5.0):
+        self.batch_size = batch_size
+        self.max_latency_s = max_latency_s
+        self.max_pending = max_pending
+        self.windows = RollingWindows(window_s, bucket_s)
+        self.output_dir = output_dir
+        self.report_interval_s = report_interval_s
+        self.queue = None
+        self._clients = {}  # handler task -> its connection's writer
+        self._last_report = (0.0, 0)
+        self.started = time.monotonic()
+        self.counters = {
+            'received': 0, 'ingested': 0, 'rejected': 0, 'malformed': 0, 'batches': 0, 'clients': 0,
+            'queue_capacity': max_pending, 'queue_high_water': 0,
+            'last_latency_s': None, 'max_latency_s': 0.0, 'latency_sum_s': 0.0
+        }
+
+    async def _enqueue(self, lines):
+        lines = [line for line in lines if line.strip()]
+        if not lines:
+            return
+        # Blocks while the queue is full: the backpressure point
+        await self.queue.put((time.monotonic(), lines))
+        self.counters['received'] += len(lines)
+        self.counters['queue_high_water'] = max(self.counters['queue_high_water'], self.queue.qsize())
+
+    async def _read_stream(self, read):
+        pending = b''
+        while True:
+            data = await read()
+            if data is None:
+                return pending
+            lines = (pending + data).split(b'\n')
+            pending = lines.pop()
+            await self._enqueue(lines)
+
+    async def handle_client(self, reader, writer):
+        peer = writer.get_extra_info('peername')
+        self.counters['clients'] += 1
+        logging.info(f"Feed connected: {peer}")
+
+        async def read():
+            return await reader.read(READ_SIZE) or None
+
+        task = asyncio.current_task()
+        self._clients[task] = writer
+        try:
+            rest = await self._read_stream(read)
+            await self._enqueue([rest])
+        except ConnectionError as e:
+            logging.warning(f"Feed {peer} dropped: {e}")
+        finally:
+            self._clients.pop(task, None)
+            writer.close()
+            logging.info(f"Feed disconnected: {peer}")
+
+    async def tail_file(self, path, from_start=False, poll_interval_s=0.2):
+        """
+        Follows `path` like `tail -f`, from its end unless `from_start`. Waits for the file
+        to appear and starts over when it is truncated.
+        """
+        while not os.path.exists(path):
+            await asyncio.sleep(poll_interval_s)
+        with open(path, 'rb') as f:
+            if not from_start:
+                f.seek(0, os.SEEK_END)
+            logging.info(f"Tailing {path} from offset {f.tell()}")
+
+            async def read():
+                while True:
+                    data = f.read(READ_SIZE)
+                    if data:
+                        return data
+                    if os.path.getsize(path) < f.tell():
+                        logging.warning(f"{path} was truncated; reading it from the start")
+                        f.seek(0)
+                        continue
+                    await asyncio.sleep(poll_interval_s)
+
+            await self._read_stream(read)
+
+    async def _batcher(self):
+        while True:
+            arrived, lines = await self.queue.get()
+            batch, chunks = list(lines), 1
+            deadline = arrived + self.max_latency_s
+            while len(batch) < self.batch_size:
+                try:
+                    _, more = self.queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    try:
+                        _, more = await asyncio.wait_for(self.queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                batch.extend(more)
+                chunks += 1
+            try:
+                await self._process(batch, arrived)
+            finally:
+                for _ in range(chunks):
+                    self.queue.task_done()
+
+    def _ingest(self, lines):
+        trips, malformed = parse_events(lines)
+        if len(trips):
+            self.windows.update(trips)
+        return len(trips), malformed
+
+    async def _process(self, lines, arrived):
+        try:
+            ingested, malformed = await asyncio.to_thread(self._ingest, lines)
+        except Exception:
+            logging.exception(f"Dropped a batch of {len(lines)} events")
+            self.counters['malformed'] += len(lines)
+            return
+        latency = time.monotonic() - arrived
+        counters = self.counters
+        counters['batches'] += 1
+        counters['ingested'] += ingested
+        counters['malformed'] += malformed
+        counters['rejected'] += len(lines) - ingested - malformed
+        counters['last_latency_s'] = latency
+        counters['max_latency_s'] = max(counters['max_latency_s'], latency)
+        counters['latency_sum_s'] += latency
+
+    def stats(self):
+        """
+        Counters plus derived uptime, throughput, mean batch size and mean latency.
+        """
+        counters = dict(self.counters)
+        uptime = time.monotonic() - self.started
+        batches = counters['batches']
+        counters['uptime_s'] = round(uptime, 3)
+        counters['events_per_s'] = round(counters['ingested'] / uptime, 1) if uptime > 0 else None
+        counters['mean_batch_size'] = round((counters['ingested'] + counters['rejected']) / batches, 1) if batches else None
+        counters['mean_latency_s'] = counters.pop('latency_sum_s') / batches if batches else None
+        counters['queue_size'] = self.queue.qsize() if self.queue is not None else 0
+        return counters
+
+    def write_report(self):
+        """
+        Writes the window metrics (rolling_metrics.csv) and counters (ingest_counters.json).
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        window = self.windows.snapshot()
+        stats = self.stats()
+        # Throughput since the previous report, next to the lifetime average
+        last_time, last_ingested = self._last_report
+        interval = stats['uptime_s'] - last_time
+        stats['recent_events_per_s'] = round((stats['ingested'] - last_ingested) / interval, 1) if interval > 0 else None
+        self._last_report = (stats['uptime_s'], stats['ingested'])
+        _write_atomic(os.path.join(self.output_dir, 'rolling_metrics.csv'),
+                      lambda path: window.to_csv(path, index=False))
+
+        def write_stats(path):
+            with open(path, 'w') as f:
+                json.dump(stats, f, indent=2)
+
+        _write_atomic(os.path.join(self.output_dir, 'ingest_counters.json'), write_stats)
+        peak = window[window['peak_hour']]
+        peak_delay = (peak['delay_mean'] * peak['trips']).sum() / peak['trips'].sum() if len(peak) else float('nan')
+        logging.info(f"Live: {stats['ingested']} trips ingested ({stats['recent_events_per_s']}/s), "
+                     f"{stats['rejected']} rejected, {stats['malformed']} malformed, "
+                     f"latency last {stats['last_latency_s'] or 0:.3f}s / max {stats['max_latency_s']:.3f}s, "
+                     f"queue {stats['queue_size']}/{self.max_pending}; "
+                     f"window peak-hour delay {peak_delay:.1f} min over {int(window['trips'].sum())} trips")
+        return stats
+
+    async def _reporter(self):
+        while True:
+            await asyncio.sleep(self.report_interval_s)
+            await asyncio.to_thread(self.write_report)
+
+    async def run(self, host=DEFAULT_HOST, port=DEFAULT_PORT, path=None, from_start=False, duration_s=None):
+        """
+        Serves the TCP feed on host:port, or tails `path` when given, until cancelled or for
+        `duration_s` seconds. Queued events are processed and a final report is written on exit.
+        """
+        self.queue = asyncio.Queue(maxsize=self.max_pending)
+        self.started = time.monotonic()
+        self._last_report = (0.0, 0)
+        workers = [asyncio.create_task(self._batcher()), asyncio.create_task(self._reporter())]
+        server = None
+        if path is not None:
+            source = asyncio.create_task(self.tail_file(path, from_start))
+        else:
+            server = await asyncio.start_server(self.handle_client, host, port, limit=READ_SIZE)
+            logging.info(f"Listening for trip events on {host}:{port}")
+            source = asyncio.create_task(server.serve_forever())
+        try:
+            if duration_s is None:
+                await source
+            else:
+                await asyncio.wait([source], timeout=duration_s)
+        finally:
+            source.cancel()
+            if server is not None:
+                server.close()
+                # Closing the connections ends each handler as if its feed had hung up, so the
+                # handlers finish normally and queue what they have read
+                clients = list(self._clients.items())
+                for _, writer in clients:
+                    writer.transport.abort()
+                await asyncio.gather(*(task for task, _ in clients), return_exceptions=True)
+            try:
+                await asyncio.wait_for(self.queue.join(), timeout=max(self.max_latency_s * 10, 5.0))
+            except asyncio.TimeoutError:
+                logging.warning(f"Stopped with {self.queue.qsize()} chunks of events still queued")
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            stats = await asyncio.to_thread(self.write_report)
+            logging.info(f"Ingestion stopped after {stats['uptime_s']:.0f}s")
+        return stats
+
+
+def ingest_events(host=DEFAULT_HOST, port=DEFAULT_PORT, path=None, from_start=False, duration_s=None, **options):
+    """
+    Runs the ingestion service (see IngestionService for `options`) until interrupted or
+    for `duration_s` seconds. Returns the final counters.
+    """
+    service = IngestionService(**options)
+    try:
+        return asyncio.run(service.run(host, port, path, from_start, duration_s))
+    except KeyboardInterrupt:
+        logging.info("Ingestion interrupted")
+        return service.stats()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Real-time trip event ingestion")
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--file', default=None, help="Tail this file instead of listening on a socket")
+    parser.add_argument('--from-start', action='store_true', help="Read the tailed file from its start")
+    parser.add_argument('--duration', type=float, default=None, help="Stop after this many seconds")
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--max-latency', type=float, default=0.5, help="Seconds an event may wait for its batch")
+    parser.add_argument('--window', type=int, default=900, help="Rolling window length in seconds")
+    args = parser.parse_args()
+    ingest_events(args.host, args.port, args.file, args.from_start, args.duration,
+                  batch_size=args.batch_size, max_latency_s=args.max_latency, window_s=args.window)
@@ -0,0 +1,89 @@
+import pandas as pd
+import numpy as np
+import argparse
+import asyncio
+import time
+import logging
+from datetime import datetime, timedelta
+from src.data_collection.generate_dataset import (route_table, synthetic_routes, generate_trip_block,
+                                                  DEFAULT_TRIP_HOURS)
+from src.streaming.ingest import DEFAULT_HOST, DEFAULT_PORT, EVENT_COLUMNS
+
+# Events are written in chunks of this many lines, the unit of rate limiting
+SEND_CHUNK = 1000
+
+
+def trip_events(days=1, routes=None, trip_hours=None, trips_per_hour=1, start_date=None, seed=42):
+    """
+    Yields the generator's trips as event lines (bytes, ingest wire format), one day at a
+    time and in hour order within a day, as trips complete during the day.
+    """
+    routes = route_table(routes)
+    trip_hours = DEFAULT_TRIP_HOURS if trip_hours is None else list(trip_hours)
+    if start_date is None:
+        start_date = datetime.now() - timedelta(days=days)
+    start = np.datetime64(pd.Timestamp(start_date).date(), 'D')
+    for day in range(days):
+        block = generate_trip_block(routes, trip_hours, start + np.arange(day, day + 1), day, seed, trips_per_hour)
+        block = block[EVENT_COLUMNS].sort_values('hour', kind='stable')
+        text = block.to_csv(header=False, index=False, date_format='%Y-%m-%d')
+        yield from text.encode().splitlines()
+
+
+async def replay_trips(host=DEFAULT_HOST, port=DEFAULT_PORT, path=None, rate=None, **trip_options):
+    """
+    Replays generated trips as a live feed: sent to the ingestion socket, or appended to
+    `path` for the file tailer. `rate` caps events per second (None: as fast as the
+    receiver accepts them; TCP backpressure from the service applies either way).
+    `trip_options` are passed to trip_events(). Returns the number of events sent.
+    """
+    if path is not None:
+        out = open(path, 'ab')
+        write, flush = out.write, lambda: asyncio.to_thread(out.flush)
+        close = out.close
+    else:
+        _, writer = await asyncio.open_connection(host, port)
+        write, flush = writer.write, writer.drain
+        close = writer.close
+    logging.info(f"Replaying trips to {path or f'{host}:{port}'}" + (f" at {rate} events/s" if rate else ""))
+
+    sent = 0
+    started = time.monotonic()
+    try:
+        chunk = []
+        for line in trip_events(**trip_options):
+            chunk.append(line)
+            if len(chunk) < SEND_CHUNK:
+                continue
+            write(b'\n'.join(chunk) + b'\n')
+            await flush()
+            sent += len(chunk)
+            chunk = []
+            if rate:
+                ahead = sent / rate - (time.monotonic() - started)
+                if ahead > 0:
+                    await asyncio.sleep(ahead)
+        if chunk:
+            write(b'\n'.join(chunk) + b'\n')
+            await flush()
+            sent += len(chunk)
+    finally:
+        close()
+    elapsed = time.monotonic() - started
+    logging.info(f"Replayed {sent} events in {elapsed:.2f}s ({sent / elapsed if elapsed else 0:,.0f}/s)")
+    return sent
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Replay generated trips as a live event feed")
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--file', default=None, help="Append events to this file instead of the socket")
+    parser.add_argument('--rate', type=float, default=None, help="Events per second (default: unthrottled)")
+    parser.add_argument('--days', type=int, default=1)
+    parser.add_argument('--routes', type=int, default=None, help="Use this many synthetic routes")
+    parser.add_argument('--trips-per-hour', type=int, default=1)
+    args = parser.parse_args()
+    routes = synthetic_routes(args.routes) if args.routes else None
+    asyncio.run(replay_trips(args.host, args.port, args.file, args.rate, days=args.days, routes=routes,
+                             trips_per_hour=args.trips_per_hour))
@@ -1,79 +1,232 @@
 import pandas as pd
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')  # Non-interactive backend: no display needed, safe in worker processes
 import matplotlib.pyplot as plt
 import seaborn as sns
+import hashlib
+import json
 import os
 import logging
+from concurrent.futures import ProcessPoolExecutor
+from src.data_processing.load_data import load_cleaned_data
+from src.data_processing.partitioned import has_filters, filter_trips
+from src.analysis.aggregate_cube import DelayCube, CUBE_COLUMNS
 
-def plot_delays(input_path='data/processed/cleaned_bus_delay.csv', output_dir='reports/plots'):
-    """
-    Generates various visualizations for bus delay analysis.
-    """
-    logging.info("Generating visualizations...")
-    
-    if not os.path.exists(input_path):
-        logging.error(f"Input file {input_path} not found.")
-        return
+DENSITY_BINS = 40
 
-    df = pd.read_csv(input_path)
-    os.makedirs(output_dir, exist_ok=True)
+# Bump when a renderer changes so cached figures are redrawn
+RENDER_VERSION = 2
+FINGERPRINT_FILE = '.plot_fingerprints.json'
 
-    # Set style
+# --- Figure renderers ---
+# Each one draws a single figure from per-group statistics or counts taken from the
+# cube, so neither drawing nor shipping inputs to a worker grows with the number of
+# trips. They are module-level so a process pool can pickle them.
+
+def render_delay_distribution(delay_counts, path):
+    # 1. Delay Distribution Histogram, weighted by trip counts per delay value
     sns.set_style("whitegrid")
-    
-    # 1. Delay Distribution Histogram
     plt.figure(figsize=(10, 6))
-    sns.histplot(df['delay_min'], kde=True, bins=30, color='skyblue')
+    # A KDE needs at least two distinct delays (a slice where every trip is on time has one)
+    sns.histplot(x=delay_counts.index.to_numpy(), weights=delay_counts.to_numpy(), kde=len(delay_counts) >= 2,
+                 bins=30, color='skyblue')
     plt.title('Distribution of Bus Delays')
     plt.xlabel('Delay (minutes)')
     plt.ylabel('Frequency')
-    plt.savefig(os.path.join(output_dir, 'delay_distribution.png'))
+    plt.savefig(path)
     plt.close()
-    logging.info("Saved delay_distribution.png")
 
+def render_route_wise_delay(avg_delay, path):
     # 2. Route-wise Average Delay Bar Chart
+    sns.set_style("whitegrid")
     plt.figure(figsize=(12, 6))
-    avg_delay = df.groupby('route_no')['delay_min'].mean().sort_values()
     sns.barplot(x=avg_delay.index, y=avg_delay.values, hue=avg_delay.index, palette='viridis', legend=False)
     plt.title('Average Delay by Route')
     plt.xlabel('Route Number')
     plt.ylabel('Average Delay (minutes)')
-    plt.savefig(os.path.join(output_dir, 'route_wise_delay.png'))
+    plt.savefig(path)
     plt.close()
-    logging.info("Saved route_wise_delay.png")
 
-    # 3. Hour vs Delay Line Plot
+def render_hour_vs_delay(stats, path):
+    # 3. Hour vs Delay Line Plot, with analytic 95% confidence intervals (mean +/- 1.96 SE)
+    sns.set_style("whitegrid")
     plt.figure(figsize=(12, 6))
-    sns.lineplot(data=df, x='hour', y='delay_min', hue='route_no', marker='o')
+    palette = sns.color_palette(n_colors=stats['route_no'].nunique())
+    for color, (route, group) in zip(palette, stats.groupby('route_no', sort=False)):
+        half_width = 1.96 * (group['std'] / np.sqrt(group['count'])).fillna(0)
+        plt.plot(group['hour'], group['mean'], marker='o', color=color, label=route)
+        plt.fill_between(group['hour'], group['mean'] - half_width, group['mean'] + half_width, color=color, alpha=0.2)
     plt.title('Delay Trends by Hour of Day')
     plt.xlabel('Hour of Day')
     plt.ylabel('Delay (minutes)')
-    plt.xticks(sorted(df['hour'].unique()))
+    plt.xticks(sorted(stats['hour'].unique()))
     plt.legend(title='Route', bbox_to_anchor=(1.05, 1), loc='upper left')
     plt.tight_layout()
-    plt.savefig(os.path.join(output_dir, 'hour_vs_delay.png'))
+    plt.savefig(path)
     plt.close()
-    logging.info("Saved hour_vs_delay.png")
 
+def render_delay_heatmap(pivot_table, path):
     # 4. Heatmap (Hour vs Route Average Delay)
-    pivot_table = df.pivot_table(index='route_no', columns='hour', values='delay_min', aggfunc='mean')
+    sns.set_style("whitegrid")
     plt.figure(figsize=(10, 8))
     sns.heatmap(pivot_table, annot=True, cmap='coolwarm', fmt=".1f")
     plt.title('Heatmap of Average Delays (Route vs Hour)')
     plt.xlabel('Hour of Day')
     plt.ylabel('Route Number')
-    plt.savefig(os.path.join(output_dir, 'delay_heatmap.png'))
+    plt.savefig(path)
     plt.close()
-    logging.info("Saved delay_heatmap.png")
-    
-    # 5. Scatter Plot: Traffic Multiplier vs Delay
+
+def render_traffic_vs_delay(points, path):
+    # 5. Scatter Plot: Traffic Multiplier vs Delay, one marker per distinct value sized by its trips
+    sns.set_style("whitegrid")
     plt.figure(figsize=(10, 6))
-    sns.scatterplot(data=df, x='traffic_multiplier', y='delay_min', hue='peak_hour', alpha=0.7)
+    sns.scatterplot(data=points, x='traffic_multiplier', y='delay_min', hue='peak_hour', size='count', alpha=0.7)
     plt.title('Impact of Traffic Multiplier on Delay')
     plt.xlabel('Traffic Multiplier')
     plt.ylabel('Delay (minutes)')
-    plt.savefig(os.path.join(output_dir, 'traffic_vs_delay.png'))
+    plt.savefig(path)
+    plt.close()
+
+def render_traffic_vs_delay_density(density, path):
+    # 5. Binned density of Traffic Multiplier vs Delay, one panel per peak flag
+    sns.set_style("white")
+    flags = sorted(density['peak_hour'].unique())
+    fig, axes = plt.subplots(1, len(flags), figsize=(12, 6), sharex=True, sharey=True, squeeze=False)
+    for ax, flag in zip(axes[0], flags):
+        bins = density[density['peak_hour'] == flag]
+        grid = bins.pivot_table(index='delay_lo', columns='traffic_lo', values='trips', aggfunc='sum')
+        x_edges = np.append(grid.columns.to_numpy(), bins['traffic_hi'].max())
+        y_edges = np.append(grid.index.to_numpy(), bins['delay_hi'].max())
+        mesh = ax.pcolormesh(x_edges, y_edges, np.ma.masked_equal(grid.to_numpy(), 0), cmap='viridis')
+        fig.colorbar(mesh, ax=ax, label='Trips')
+        ax.set_title(f"Peak Hour: {flag}")
+        ax.set_xlabel('Traffic Multiplier')
+    axes[0][0].set_ylabel('Delay (minutes)')
+    fig.suptitle('Impact of Traffic Multiplier on Delay')
+    plt.savefig(path)
     plt.close()
-    logging.info("Saved traffic_vs_delay.png")
+
+def traffic_density(traffic, bins=DENSITY_BINS):
+    """
+    2D histogram of trips over traffic multiplier x delay, per peak flag (long format),
+    from the cube's trip counts per traffic multiplier and delay value.
+    """
+    x = traffic['traffic_multiplier'].to_numpy(dtype=float)
+    y = traffic['delay_min'].to_numpy(dtype=float)
+    weights = traffic['count'].to_numpy(dtype=float)
+    x_edges = np.linspace(x.min(), x.max(), bins + 1)
+    y_edges = np.linspace(y.min(), y.max(), bins + 1)
+    x_lo, y_lo = np.meshgrid(x_edges[:-1], y_edges[:-1], indexing='ij')
+    x_hi, y_hi = np.meshgrid(x_edges[1:], y_edges[1:], indexing='ij')
+
+    frames = []
+    peak = traffic['peak_hour'].to_numpy(dtype=bool)
+    for flag in np.unique(peak):
+        rows = peak == flag
+        counts, _, _ = np.histogram2d(x[rows], y[rows], bins=[x_edges, y_edges], weights=weights[rows])
+        frames.append(pd.DataFrame({
+            'peak_hour': flag, 'traffic_lo': x_lo.ravel(), 'traffic_hi': x_hi.ravel(),
+            'delay_lo': y_lo.ravel(), 'delay_hi': y_hi.ravel(), 'trips': counts.ravel()
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+def figure_specs(cube, mode='trips'):
+    """
+    Returns {file name: (renderer, input data)} for every figure, all taken from the cube.
+    mode='aggregate' swaps the traffic scatter for a binned density.
+    """
+    hour_stats = cube.rollup(['route_no', 'hour']).reset_index()
+    if mode == 'aggregate':
+        traffic_figure = (render_traffic_vs_delay_density, traffic_density(cube.traffic))
+    else:
+        traffic_figure = (render_traffic_vs_delay, cube.traffic)
+    return {
+        'delay_distribution.png': (render_delay_distribution, cube.hist.groupby('delay_min')['count'].sum()),
+        'route_wise_delay.png': (render_route_wise_delay, cube.rollup(['route_no'])['mean'].sort_values()),
+        'hour_vs_delay.png': (render_hour_vs_delay, hour_stats),
+        'delay_heatmap.png': (render_delay_heatmap, hour_stats.pivot(index='route_no', columns='hour', values='mean')),
+        'traffic_vs_delay.png': traffic_figure,
+    }
+
+def fingerprint(renderer, data):
+    """
+    Hash of a figure's renderer and input data; equal hashes produce identical images.
+    """
+    digest = hashlib.sha256(f"{renderer.__name__}:{RENDER_VERSION}".encode())
+    if isinstance(data, pd.DataFrame):
+        digest.update(json.dumps([str(c) for c in data.columns] + [str(t) for t in data.dtypes]).encode())
+    else:
+        digest.update(f"{data.name}:{data.dtype}".encode())
+    digest.update(pd.util.hash_pandas_object(data, index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+def plot_delays(input_path='data/processed/cleaned_bus_delay.csv', output_dir='reports/plots', df=None, cube=None,
+                workers=None, use_cache=True, mode='trips', start_date=None, end_date=None, routes=None):
+    """
+    Generates various visualizations for bus delay analysis.
+    Every figure is drawn from the aggregates of a DelayCube: pass a prebuilt one as
+    `cube` to reuse the shared aggregates, or an already loaded cleaned DataFrame as `df`
+    to build it without reading `input_path`.
+
+    Each figure is fingerprinted by a hash of its aggregated input; with `use_cache`,
+    figures whose fingerprint matches the previous render are not redrawn. With
+    `workers`, the remaining figures are rendered in a process pool; output files are
+    the same as with sequential rendering.
+
+    mode='aggregate' replaces the traffic scatter with a binned density, which stays
+    readable when there are many distinct traffic/delay values.
+    `start_date`/`end_date` (inclusive) and `routes` restrict it to a slice of the trips,
+    read from the partitioned dataset when available.
+    """
+    logging.info("Generating visualizations...")
+
+    if mode not in ('trips', 'aggregate'):
+        raise ValueError(f"Unknown plot mode '{mode}' (expected 'trips' or 'aggregate')")
+
+    filters = {'start_date': start_date, 'end_date': end_date, 'routes': routes}
+    if has_filters(**filters):
+        # Aggregates of the full history cannot answer a slice
+        cube = None
+        df = filter_trips(df, **filters) if df is not None else None
+    if cube is None:
+        if df is None:
+            df = load_cleaned_data(input_path, columns=CUBE_COLUMNS, **filters)
+            if df is None:
+                return
+        cube = DelayCube.from_trips(df)
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    fingerprint_path = os.path.join(output_dir, FINGERPRINT_FILE)
+    previous = {}
+    if use_cache and os.path.exists(fingerprint_path):
+        with open(fingerprint_path) as f:
+            previous = json.load(f)
+
+    # Decide which figures need drawing
+    current, pending = {}, []
+    for name, (renderer, data) in figure_specs(cube, mode).items():
+        current[name] = fingerprint(renderer, data)
+        path = os.path.join(output_dir, name)
+        if use_cache and previous.get(name) == current[name] and os.path.exists(path):
+            logging.info(f"Skipped {name} (inputs unchanged)")
+            continue
+        pending.append((name, renderer, data, path))
+
+    if workers and len(pending) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [(name, pool.submit(renderer, data, path)) for name, renderer, data, path in pending]
+            for name, future in futures:
+                future.result()
+                logging.info(f"Saved {name}")
+    else:
+        for name, renderer, data, path in pending:
+            renderer(data, path)
+            logging.info(f"Saved {name}")
+
+    with open(fingerprint_path, 'w') as f:
+        json.dump(current, f, indent=2)
 
     logging.info(f"All plots saved to {output_dir}")
 
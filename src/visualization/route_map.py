@@ -1,44 +1,55 @@
 import folium
-import pandas as pd
+from folium.plugins import FastMarkerCluster
+import numpy as np
 import os
-import random
 import logging
+from src.data_processing.load_data import load_cleaned_data
+from src.data_processing.partitioned import has_filters, filter_trips
+from src.analysis.aggregate_cube import DelayCube, CUBE_COLUMNS
+from src.geospatial.routes import CITY_CENTER, route_geometries
 
-def generate_route_map(input_path='data/processed/cleaned_bus_delay.csv', output_path='reports/bus_route_map.html'):
+# Stop markers are built client-side from plain [lat, lon, label] rows
+STOP_MARKER_CALLBACK = """
+function (row) {
+    var marker = L.marker(new L.LatLng(row[0], row[1]));
+    marker.bindPopup(row[2]);
+    return marker;
+}
+"""
+
+def generate_route_map(input_path='data/processed/cleaned_bus_delay.csv', output_path='reports/bus_route_map.html', df=None, cube=None,
+                       start_date=None, end_date=None, routes=None):
     """
     Generates an interactive map of bus routes colored by inefficiency.
-    Simulates route coordinates for Coimbatore area.
+    Routes without surveyed coordinates get synthetic polylines around Coimbatore.
+    All routes go into a single GeoJSON layer and their stops into one clustered marker
+    layer, so the page stays small and fast for networks of thousands of routes.
+    Pass an already loaded cleaned DataFrame as `df` to skip reading `input_path`, or a
+    prebuilt DelayCube as `cube` to skip the trip scan altogether.
+    `start_date`/`end_date` (inclusive) and `routes` restrict it to a slice of the trips,
+    read from the partitioned dataset when available.
     """
     logging.info("Generating geospatial map...")
     
-    if not os.path.exists(input_path):
-        logging.error(f"Input file {input_path} not found.")
-        return
-
-    df = pd.read_csv(input_path)
+    filters = {'start_date': start_date, 'end_date': end_date, 'routes': routes}
+    if has_filters(**filters):
+        # Aggregates of the full history cannot answer a slice
+        cube = None
+        df = filter_trips(df, **filters) if df is not None else None
+    if cube is None:
+        if df is None:
+            df = load_cleaned_data(input_path, columns=CUBE_COLUMNS, **filters)
+            if df is None:
+                return
+        cube = DelayCube.from_trips(df)
     
     # Calculate average inefficiency per route for color coding
-    # We use 'first' for route_name since it's constant per route_no
-    route_stats = df.groupby('route_no').agg({
-        'inefficiency_score': 'mean',
-        'delay_min': 'mean',
-        'route_name': 'first'
-    }).reset_index()
-
-    # Coimbatore Center
-    coimbatore_lat, coimbatore_lon = 11.0168, 76.9558
-    m = folium.Map(location=[coimbatore_lat, coimbatore_lon], zoom_start=12)
+    # route_name is constant per route_no, so it is carried as a group key
+    route_stats = cube.rollup(['route_no', 'route_name']).rename(
+        columns={'inefficiency': 'inefficiency_score', 'mean': 'delay_min'}
+    ).reset_index()
 
-    # Simulated Route Coordinates for Coimbatore (Specific)
-    # NOTE: These are approximate straight lines for visualization
-    route_coords = {
-        '33A': [(11.0168, 76.9558), (11.3006, 76.9366)], # Gandhipuram - Mettupalayam
-        '32': [(11.0168, 76.9558), (11.0822, 76.9427)],  # Gandhipuram - Thudiyalur
-        '111': [(11.0822, 76.9427), (11.0168, 76.9558)], # Thudiyalur - Gandhipuram (Reverse of 32)
-        '70': [(11.0168, 76.9558), (11.0422, 76.8770)],  # Gandhipuram - Maruthamalai
-        '4A': [(11.0822, 76.9427), (10.9634, 76.9804)],  # Thudiyalur - Podanur
-        '2A': [(10.9850, 76.9180), (11.0287, 77.0305)]   # Perur - Polytechnic
-    }
+    m = folium.Map(location=list(CITY_CENTER), zoom_start=12)
 
     # Color scale based on inefficiency
     def get_color(score):
@@ -46,33 +57,36 @@ def generate_route_map(input_path='data/processed/cleaned_bus_delay.csv', output
         elif score < 0.2: return 'orange'
         else: return 'red'
 
-    for index, row in route_stats.iterrows():
-        route = row['route_no']
-        coords = route_coords.get(route, [(coimbatore_lat, coimbatore_lon)])
-        
-        color = get_color(row['inefficiency_score'])
-        
-        # Draw Route Line
-        folium.PolyLine(
-            locations=coords,
-            color=color,
-            weight=5,
-            opacity=0.8,
-            tooltip=f"Route {route} ({row['route_name']}): Avg Inefficiency {row['inefficiency_score']:.2f}"
-        ).add_to(m)
+    geometries = route_geometries(route_stats['route_no'])
+    features, stops = [], []
+    for route, name, score, delay, trips in zip(route_stats['route_no'].astype(str), route_stats['route_name'].astype(str),
+                                               route_stats['inefficiency_score'], route_stats['delay_min'],
+                                               route_stats['count']):
+        # GeoJSON is (lon, lat); 5 decimals is about a metre
+        coords = np.round(geometries[route], 5)
+        features.append({
+            'type': 'Feature',
+            'geometry': {'type': 'LineString', 'coordinates': coords[:, ::-1].tolist()},
+            'properties': {'route_no': route, 'route_name': name, 'inefficiency': round(float(score), 3),
+                           'delay_min': round(float(delay), 2), 'trips': int(trips), 'color': get_color(score)}
+        })
+        label = f"Route {route} ({name})"
+        stops.extend([lat, lon, f"{label} stop {i + 1}"] for i, (lat, lon) in enumerate(coords.tolist()))
 
-        # Add Markers
-        folium.Marker(
-            location=coords[0],
-            popup=f"Start Route {route} ({row['route_name']})",
-            icon=folium.Icon(color='blue', icon='play')
-        ).add_to(m)
-        
-        folium.Marker(
-            location=coords[-1],
-            popup=f"End Route {route} ({row['route_name']})",
-            icon=folium.Icon(color='red', icon='stop')
+    # One layer for every route line, styled from its own properties
+    # (an empty slice has no features, and the tooltip cannot be built without them)
+    if features:
+        folium.GeoJson(
+            {'type': 'FeatureCollection', 'features': features},
+            name='Routes',
+            style_function=lambda feature: {'color': feature['properties']['color'], 'weight': 5, 'opacity': 0.8},
+            tooltip=folium.GeoJsonTooltip(fields=['route_no', 'route_name', 'inefficiency', 'delay_min', 'trips'],
+                                          aliases=['Route', 'Name', 'Avg Inefficiency', 'Avg Delay (min)', 'Trips'])
         ).add_to(m)
+        FastMarkerCluster(stops, callback=STOP_MARKER_CALLBACK, name='Stops').add_to(m)
+        folium.LayerControl().add_to(m)
+    else:
+        logging.warning("No routes to draw; the map only shows the city.")
 
     # Add Legend (HTML overlay)
     legend_html = '''
@@ -0,0 +1,40 @@
+import os
+from src.data_processing.clean_data import clean_data
+
+HEADER = ('route_no,route_name,distance_km,scheduled_time_min,actual_time_min,delay_min,hour,date,'
+          'day_of_week,peak_hour,traffic_multiplier\n')
+ROWS = [
+    '70,X,10.0,30,36,6,9,2024-01-01,Monday,False,1.1',          # clean
+    '70,X,10.0,30,,5,8,2024-01-01,Monday,True,1.5',             # missing actual time
+    '70,X,10.0,30.4,36.6,6.2,9,2024-01-01,Monday,False,1.1',    # fractional minutes
+    '70,X,10.0,30,36,6,,2024-01-01,Monday,False,1.1',           # missing hour
+    '70,X,10.0,30,36,6,9,not-a-date,Monday,False,1.1',          # bad date
+    '70,X,10.0,30,36,6,9,2024-01-02,Tuesday,,1.1',              # missing peak flag
+    '70,X,10.0,30,25,-5,9,2024-01-02,Tuesday,False,1.1',        # negative delay
+    '70,X,10.0,30,40030,40000,8,2024-01-02,Tuesday,True,1.5',   # beyond int16
+]
+
+
+def write_raw(tmp_path):
+    path = os.path.join(tmp_path, 'raw.csv')
+    with open(path, 'w') as f:
+        f.write(HEADER + '\n'.join(ROWS) + '\n')
+    return path
+
+
+def test_dirty_rows_are_dropped_or_rounded(tmp_path):
+    df = clean_data(write_raw(tmp_path), os.path.join(tmp_path, 'out', 'cleaned.csv'))
+    assert df['delay_min'].tolist() == [6, 6, 40000]
+    assert df['actual_time_min'].tolist() == [36, 37, 40030]
+    assert str(df['delay_min'].dtype) == 'int32'
+
+
+def test_chunked_cleaning_counts_the_same_rows(tmp_path):
+    assert clean_data(write_raw(tmp_path), os.path.join(tmp_path, 'out', 'cleaned.csv'), chunksize=3) == 3
+
+
+def test_counts_are_reported_in_both_modes(tmp_path):
+    for chunksize in (None, 3):
+        counts = {}
+        clean_data(write_raw(tmp_path), os.path.join(tmp_path, 'out', 'cleaned.csv'), chunksize=chunksize, counts=counts)
+        assert counts == {'rows_in': len(ROWS), 'rows_out': 3}
@@ -0,0 +1,18 @@
+import os
+import pandas as pd
+from src.visualization.plot_delay import render_delay_distribution
+
+
+def test_delay_distribution_with_one_delay_value(tmp_path):
+    # Every trip of the slice is on time: a single distinct delay, no KDE possible
+    delay_counts = pd.Series([42], index=pd.Index([0], name='delay_min'), name='count')
+    path = os.path.join(tmp_path, 'delay_distribution.png')
+    render_delay_distribution(delay_counts, path)
+    assert os.path.getsize(path) > 0
+
+
+def test_delay_distribution_with_several_delay_values(tmp_path):
+    delay_counts = pd.Series([5, 3, 1], index=pd.Index([0, 4, 12], name='delay_min'), name='count')
+    path = os.path.join(tmp_path, 'delay_distribution.png')
+    render_delay_distribution(delay_counts, path)
+    assert os.path.getsize(path) > 0